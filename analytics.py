@@ -0,0 +1,154 @@
+"""
+Usage rollups for the analytics page.
+
+handle_api records login / register / license events here. Each worker
+accumulates them per (app, period, bucket start) for hourly and daily
+periods: event counters plus HyperLogLog sketches of the HWIDs and IPs seen.
+Every `flush_interval` seconds the accumulators are handed to the data layer,
+which folds them into one small document per bucket (counters with $inc,
+sketches by register-wise max), so charts read a few dozen documents instead
+of scanning logs. The flush runs on a background thread, never on the
+request that happened to record an event.
+"""
+
+import hashlib
+import math
+import os
+import threading
+import time
+import traceback
+from collections import Counter
+
+PERIODS = {'hour': 3600, 'day': 86400}
+EVENTS = ('login', 'register', 'license')
+
+
+class HyperLogLog:
+    """Cardinality sketch: 2**p one-byte registers, ~1.04/sqrt(2**p) standard error."""
+
+    def __init__(self, p=11, registers=None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.m)
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = bytes(data)
+        return cls(p=int(math.log2(len(data))), registers=data)
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    def add(self, value):
+        if not value:
+            return
+        x = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError('cannot merge sketches of different precision')
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small sets
+        return int(round(estimate))
+
+
+class _Bucket:
+    __slots__ = ('counts', 'hwids', 'ips')
+
+    def __init__(self, p):
+        self.counts = Counter()
+        self.hwids = HyperLogLog(p)
+        self.ips = HyperLogLog(p)
+
+    def absorb(self, other):
+        self.counts.update(other.counts)
+        self.hwids.merge(other.hwids)
+        self.ips.merge(other.ips)
+
+
+class Rollups:
+    """`merge((app_id, period, start), bucket)` folds one accumulated bucket into storage."""
+
+    def __init__(self, merge, flush_interval=10.0, precision=11, autostart=True):
+        self.merge_fn = merge
+        self.flush_interval = flush_interval
+        self.precision = precision
+        self.autostart = autostart  # False: only explicit flush() calls write
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+
+    def configure(self, flush_interval=None, precision=None):
+        with self._lock:
+            if flush_interval is not None:
+                self.flush_interval = flush_interval
+            if precision:
+                self.precision = precision
+
+    def record(self, app_id, event, hwid=None, ip=None, now=None):
+        now = now or time.time()
+        with self._lock:
+            for period, seconds in PERIODS.items():
+                key = (app_id, period, int(now // seconds) * seconds)
+                bucket = self._pending.get(key)
+                if bucket is None:
+                    bucket = self._pending[key] = _Bucket(self.precision)
+                bucket.counts[event] += 1
+                bucket.hwids.add(hwid)
+                bucket.ips.add(ip)
+        self.ensure_started()
+
+    def ensure_started(self):
+        # Threads don't survive fork: start lazily in whichever process records.
+        if not self.autostart or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            threading.Thread(target=self._loop, name='analytics-flush', daemon=True).start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def flush(self):
+        """Merge every pending bucket; returns how many were written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        written = 0
+        for key, bucket in pending.items():
+            try:
+                self.merge_fn(key, bucket)
+                written += 1
+            except Exception:
+                # Fold back in so the next flush retries it
+                with self._lock:
+                    current = self._pending.get(key)
+                    if current is None:
+                        self._pending[key] = bucket
+                    else:
+                        current.absorb(bucket)
+        return written
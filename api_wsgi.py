@@ -0,0 +1,23 @@
+# Slim entry point for nodes that only serve the client API (/api/1.2).
+# gunicorn -c gunicorn.conf.py api_wsgi:application
+from flask import Flask
+
+from config import Config
+from models import db
+from routes import register_common
+
+
+def create_api_app():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    register_common(app)
+
+    # Indexes are managed once per deploy by `python manage.py ensure-indexes`
+    db.init_app(app, ensure_indexes=False)
+
+    from routes.api import api_bp
+    app.register_blueprint(api_bp)
+    return app
+
+
+application = create_api_app()
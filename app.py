@@ -3,16 +3,14 @@ from flask import Flask
 
 from config import Config
 from models import db
+from routes import register_common
 
 
 def create_app():
     print("Initializing Flask app...")
     app = Flask(__name__)
     app.config.from_object(Config)
-
-    @app.route('/health')
-    def health():
-        return "OK", 200
+    register_common(app)
 
     print("Initializing database...")
     db.init_app(app)
@@ -30,6 +28,7 @@ def create_app():
         from routes.api import api_bp
         from routes.discord_mgmt import discord_mgmt_bp
         from routes.apps_extra import apps_extra_bp
+        from routes.jobs import jobs_bp
 
         app.register_blueprint(auth_bp)
         app.register_blueprint(dashboard_bp)
@@ -42,6 +41,7 @@ def create_app():
         app.register_blueprint(api_bp)
         app.register_blueprint(discord_mgmt_bp)
         app.register_blueprint(apps_extra_bp)
+        app.register_blueprint(jobs_bp)
 
         print("App created successfully.")
         return app
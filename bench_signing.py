@@ -0,0 +1,80 @@
+"""
+Microbenchmark for signed API responses: the previous json.dumps + hmac.new
+path against signing.encode_json + the cached HMAC state.
+
+  python bench_signing.py [--seconds 1.0]
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import secrets
+import time
+
+import signing
+
+SECRET = secrets.token_hex(32)
+SESSION_KEY = f"{secrets.token_hex(8)}-{SECRET}"
+
+PAYLOADS = {
+    'check': {"success": True, "message": "Session is valid."},
+    'init': {
+        "success": True, "message": "Initialized", "sessionid": secrets.token_hex(16),
+        "appinfo": {"numUsers": "15230", "numOnlineUsers": "412", "numKeys": "15230",
+                    "version": "1.0", "customerPanelLink": "https://example.com"},
+        "newsession": True, "newSession": True,
+    },
+    'login': {
+        "success": True, "message": "Logged in!",
+        "info": {"username": "SKYLINE-1A2B3C4D-5E6F7A8B-9C0D1E2F", "ip": "203.0.113.7",
+                 "hwid": "S-1-5-21-1004336348-1177238915-682003330-512",
+                 "createdate": "1700000000", "lastlogin": "1760000000",
+                 "subscriptions": [{"subscription": "default", "expiry": "1790000000",
+                                    "timeleft": "29999999"}]},
+        "nonce": secrets.token_hex(16),
+    },
+    'chatget': {"success": True, "message": "Retrieved chat.", "messages": [
+        {"author": f"user{i}", "message": "hello there " * 4, "timestamp": str(1760000000 + i)}
+        for i in range(50)]},
+}
+
+
+def legacy(data, key):
+    body = json.dumps(data, separators=(',', ':'))
+    return body.encode(), hmac.new(key.encode(), body.encode(), hashlib.sha256).hexdigest()
+
+
+def current(data, key):
+    body = signing.encode_json(data)
+    return body, signing.sign(body, key)
+
+
+def rate(fn, data, key, seconds):
+    n = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            fn(data, key)
+        n += 100
+    return n / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=1.0)
+    args = parser.parse_args()
+
+    print(f"orjson: {'on' if signing.USE_ORJSON else 'off'}")
+    print(f"{'payload':<10}{'bytes':>7}{'legacy/s':>12}{'current/s':>12}{'speed-up':>10}")
+    for name, data in PAYLOADS.items():
+        key = SECRET if name == 'init' else SESSION_KEY
+        assert legacy(data, key) == current(data, key), f"{name}: output differs"
+        before = rate(legacy, data, key, args.seconds)
+        after = rate(current, data, key, args.seconds)
+        size = len(current(data, key)[0])
+        print(f"{name:<10}{size:>7}{before:>12.0f}{after:>12.0f}{after / before:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
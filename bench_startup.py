@@ -0,0 +1,71 @@
+"""
+Measure import time, boot time and RSS of the WSGI entry points.
+
+Each entry point is imported in a fresh interpreter under `-X importtime`;
+the slowest imports are listed so regressions are easy to spot.
+
+  python bench_startup.py                    # app and api_wsgi
+  python bench_startup.py api_wsgi --top 25
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+PROBE = (
+    "import resource, sys, time\n"
+    "t0 = time.perf_counter()\n"
+    "import {module}\n"
+    "boot = time.perf_counter() - t0\n"
+    "rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+    "print(f'BOOT {{boot:.4f}} {{rss}} {{len(sys.modules)}}')\n"
+)
+
+
+def parse_importtime(stderr):
+    """Return [(cumulative_us, self_us, name)] for every import line."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def measure(module, top):
+    env = dict(os.environ)
+    # A placeholder URI is enough: MongoClient connects lazily in the background.
+    env.setdefault('MONGO_URI', 'mongodb://127.0.0.1:27017')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module)],
+        env=env, capture_output=True, text=True,
+    )
+    boot_line = next((l for l in proc.stdout.splitlines() if l.startswith('BOOT ')), None)
+    if proc.returncode != 0 or not boot_line:
+        print(f"{module}: failed to import\n{proc.stderr[-2000:]}")
+        return
+    _, boot, rss_kb, n_modules = boot_line.split()
+    rows = parse_importtime(proc.stderr)
+    # Top-level imports are the lines whose name is not indented.
+    total_us = sum(cum for cum, _, name in rows if not name.startswith('  '))
+
+    print(f"== {module}")
+    print(f"   boot {float(boot) * 1000:.0f} ms | imports {total_us / 1000:.0f} ms | "
+          f"modules {n_modules} | max RSS {int(rss_kb) / 1024:.1f} MB")
+    for cum, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"   {cum / 1000:8.1f} ms  {self_us / 1000:7.1f} ms  {name.strip()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=['app', 'api_wsgi'])
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+    for module in args.modules:
+        measure(module, args.top)
+
+
+if __name__ == '__main__':
+    main()
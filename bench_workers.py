@@ -0,0 +1,162 @@
+"""
+Compare gunicorn worker models on the /api/1.2 request mix.
+
+Starts gunicorn once per worker model with gunicorn.conf.py, drives it with
+keep-alive clients for a fixed duration and prints throughput and latency.
+Needs MONGO_URI in the environment and an existing app + license key:
+
+  python bench_workers.py --name MyApp --ownerid <owner id> --key SKYLINE-...
+  python bench_workers.py ... --modes sync gthread --concurrency 64
+"""
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+MODES = {
+    'sync':    {'GUNICORN_WORKER_CLASS': 'sync'},
+    'gthread': {'GUNICORN_WORKER_CLASS': 'gthread'},
+    'gevent':  {'GUNICORN_WORKER_CLASS': 'gevent'},
+}
+
+# Relative weights of the actions in a typical client launch + session.
+MIX = [('init', 1), ('license', 1), ('check', 4), ('var', 2)]
+
+
+class Client:
+    def __init__(self, port, args):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        self.args = args
+        self.sessionid = None
+
+    def call(self, action, **extra):
+        body = urlencode({'type': action, 'name': self.args.name,
+                          'ownerid': self.args.ownerid, **extra})
+        self.conn.request('POST', '/api/1.2/', body,
+                          {'Content-Type': 'application/x-www-form-urlencoded'})
+        resp = self.conn.getresponse()
+        data = resp.read()
+        return resp.status, data
+
+    def step(self, action):
+        if action == 'init' or self.sessionid is None:
+            status, data = self.call('init', ver=self.args.ver, enckey='benchkey')
+            try:
+                self.sessionid = json.loads(data).get('sessionid')
+            except ValueError:
+                self.sessionid = None
+            return status
+        if action == 'license':
+            return self.call('license', key=self.args.key, hwid='bench-hwid',
+                             sessionid=self.sessionid)[0]
+        if action == 'var':
+            return self.call('var', varid=self.args.varid, sessionid=self.sessionid)[0]
+        return self.call(action, sessionid=self.sessionid)[0]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def drive(port, args):
+    plan = [action for action, weight in MIX for _ in range(weight)]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.time() + args.duration
+
+    def worker():
+        client = Client(port, args)
+        local, failed, i = [], 0, 0
+        while time.time() < stop_at:
+            action = plan[i % len(plan)]
+            i += 1
+            t0 = time.perf_counter()
+            try:
+                if client.step(action) != 200:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                client = Client(port, args)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0]
+
+
+def run_mode(mode, args):
+    env = dict(os.environ, PORT=str(args.port), **MODES[mode])
+    if args.workers:
+        env['WEB_CONCURRENCY'] = str(args.workers)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', args.target],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_for_port(args.port):
+            return None
+        latencies, errors = drive(args.port, args)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    if not latencies:
+        return None
+    latencies.sort()
+    return {
+        'rps': len(latencies) / args.duration,
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--name', required=True)
+    parser.add_argument('--ownerid', required=True)
+    parser.add_argument('--key', required=True)
+    parser.add_argument('--ver', default='1.0')
+    parser.add_argument('--varid', default='bench')
+    parser.add_argument('--target', default='app:application')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=int, default=20)
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for mode in args.modes:
+        result = run_mode(mode, args)
+        if result is None:
+            print(f"{mode:<10}{'failed to start or no responses':>38}")
+            continue
+        print(f"{mode:<10}{result['rps']:>10.0f}{result['p50']:>10.1f}"
+              f"{result['p99']:>10.1f}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
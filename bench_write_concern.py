@@ -0,0 +1,91 @@
+"""
+Latency of the durability tiers on the auth path.
+
+Runs against a scratch database on MONGO_URI (a replica set shows the real
+difference; a standalone server treats majority as w:1). First each write
+concern on its own, then the writes a license login makes (session create,
+session validate, log entry, last-login update) all at the client default
+against the tiers from Config:
+
+  python bench_write_concern.py [--iterations 500] [--db SKYLINE_bench]
+"""
+
+import argparse
+import os
+import statistics
+import time
+from datetime import datetime
+
+import pymongo
+from pymongo import WriteConcern
+
+from config import Config
+from models import _write_concern
+
+CONCERNS = {
+    'w:0': WriteConcern(w=0),
+    'w:1': WriteConcern(w=1),
+    'majority': WriteConcern(w='majority'),
+    'majority+j': WriteConcern(w='majority', j=True),
+}
+
+
+def timed(fn, iterations):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.mean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.99) - 1]
+
+
+def login_writes(sessions, logs, users, user_id):
+    def run(i):
+        sid = f'{i:032x}'
+        sessions.insert_one({'session_id': sid, 'validated': False, 'created_at': datetime.utcnow()})
+        sessions.update_one({'session_id': sid}, {'$set': {'validated': True, 'credential': 'KEY'}})
+        logs.insert_one({'username': 'KEY', 'action': 'Logged in via key', 'timestamp': datetime.utcnow()})
+        users.update_one({'_id': user_id}, {'$set': {'last_login': datetime.utcnow()}})
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--db', default='SKYLINE_bench')
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(os.environ['MONGO_URI'])
+    db = client[args.db]
+    hello = client.admin.command('hello')
+    print(f"server: {'replica set ' + hello['setName'] if hello.get('setName') else 'standalone'}")
+    try:
+        print(f"{'insert_one':<14}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, concern in CONCERNS.items():
+            coll = db.get_collection('bench_writes', write_concern=concern)
+            mean, p50, p99 = timed(lambda i: coll.insert_one({'i': i}), args.iterations)
+            print(f"{name:<14}{mean:>10.3f}{p50:>10.3f}{p99:>10.3f}")
+
+        user_id = db.app_users.insert_one({'key': 'KEY'}).inserted_id
+        tiers = {
+            'telemetry': _write_concern(Config.WRITE_CONCERN_TELEMETRY),
+            'sessions': _write_concern(Config.WRITE_CONCERN_SESSIONS),
+        }
+
+        def tiered(name, tier):
+            return db[name] if tiers[tier] is None else db.get_collection(name, write_concern=tiers[tier])
+
+        print(f"\n{'login writes':<14}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        default = timed(login_writes(db.sessions, db.logs, db.app_users, user_id), args.iterations)
+        current = timed(login_writes(tiered('sessions', 'sessions'), tiered('logs', 'telemetry'),
+                                     db.app_users, user_id), args.iterations)
+        for name, (mean, p50, p99) in (('default', default), ('tiered', current)):
+            print(f"{name:<14}{mean:>10.3f}{p50:>10.3f}{p99:>10.3f}")
+        print(f"speed-up (mean): {default[0] / current[0]:.2f}x")
+    finally:
+        client.drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+In-process fan-out for chat channels.
+
+Each worker keeps a ring buffer of the newest messages per channel. Messages
+sent through this worker are published straight into the buffer; messages
+sent through other workers are picked up by one shared "since" query per
+channel every `sync_interval` seconds, however many clients are polling or
+long-polling. Every message carries a cursor (its timestamp in milliseconds)
+that clients hand back to receive only newer messages.
+
+Only channels that exist should be hubbed (callers resolve the name first);
+the hub still keeps at most `max_channels` buffers, evicting the least
+recently used. Long-polls and streams hold a request thread, so at most
+`max_waiters` may block at once per worker (`try_acquire` / `release`).
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class _Channel:
+    def __init__(self, size):
+        self.messages = deque(maxlen=size)
+        self.ids = set()
+        self.cond = threading.Condition()
+        self.primed = False
+        self.complete = False  # True while the buffer holds the whole channel history
+        self.synced_at = 0.0
+        self.syncing = False
+
+    @property
+    def last_cursor(self):
+        return self.messages[-1]['cursor'] if self.messages else 0
+
+    def add(self, message):
+        """Append (or insert in cursor order) unless already buffered. Caller holds cond."""
+        if message['id'] in self.ids:
+            return False
+        if len(self.messages) == self.messages.maxlen:
+            self.ids.discard(self.messages[0]['id'])
+            self.complete = False
+        if not self.messages or message['cursor'] >= self.last_cursor:
+            self.messages.append(message)
+        else:
+            items = sorted([*self.messages, message], key=lambda m: m['cursor'])
+            self.messages.clear()
+            self.messages.extend(items[-self.messages.maxlen:])
+        self.ids.add(message['id'])
+        return True
+
+
+class ChatHub:
+    """`loader(key, since_cursor, limit)` returns messages newer than the cursor, oldest first."""
+
+    def __init__(self, loader, buffer_size=100, sync_interval=2.0, max_channels=10000, max_waiters=2):
+        self.loader = loader
+        self.buffer_size = buffer_size
+        self.sync_interval = sync_interval
+        self.max_channels = max_channels
+        self.max_waiters = max_waiters
+        self._channels = OrderedDict()
+        self._waiters = 0
+        self._lock = threading.Lock()
+
+    def configure(self, buffer_size=None, sync_interval=None, max_channels=None, max_waiters=None):
+        with self._lock:
+            if buffer_size:
+                self.buffer_size = buffer_size
+            if sync_interval is not None:
+                self.sync_interval = sync_interval
+            if max_channels:
+                self.max_channels = max_channels
+            if max_waiters is not None:
+                self.max_waiters = max_waiters
+            self._channels.clear()
+
+    def _channel(self, key):
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                channel = self._channels[key] = _Channel(self.buffer_size)
+                if len(self._channels) > self.max_channels:
+                    # Waiters on the evicted buffer keep polling through since(), which re-creates it
+                    self._channels.popitem(last=False)
+            else:
+                self._channels.move_to_end(key)
+            return channel
+
+    def try_acquire(self):
+        """Claim one of the `max_waiters` blocking slots; False when they are all taken."""
+        with self._lock:
+            if self._waiters >= self.max_waiters:
+                return False
+            self._waiters += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._waiters -= 1
+
+    def forget(self, key):
+        with self._lock:
+            self._channels.pop(key, None)
+
+    def publish(self, key, message):
+        channel = self._channel(key)
+        with channel.cond:
+            if channel.primed and channel.add(message):
+                channel.cond.notify_all()
+
+    def _sync(self, key, channel, force=False):
+        """Pull messages written by other workers; at most one query per interval."""
+        with channel.cond:
+            due = force or time.monotonic() - channel.synced_at >= self.sync_interval
+            if channel.syncing or (channel.primed and not due):
+                return
+            channel.syncing = True
+            primed, since = channel.primed, channel.last_cursor
+        try:
+            if primed:
+                # >= so a message sharing the newest millisecond is not skipped; ids dedupe
+                rows = self.loader(key, since - 1, self.buffer_size)
+            else:
+                rows = self.loader(key, None, self.buffer_size)
+        finally:
+            with channel.cond:
+                channel.syncing = False
+                channel.synced_at = time.monotonic()
+        with channel.cond:
+            if not channel.primed:
+                channel.complete = len(rows) < self.buffer_size
+            added = False
+            for row in rows:
+                added = channel.add(row) or added
+            channel.primed = True
+            if added:
+                channel.cond.notify_all()
+
+    def latest(self, key, limit):
+        """The newest `limit` messages, newest first (the classic chatget view)."""
+        channel = self._channel(key)
+        self._sync(key, channel)
+        with channel.cond:
+            return list(reversed(list(channel.messages)[-limit:]))
+
+    def since(self, key, cursor):
+        """Messages newer than `cursor`, oldest first, or None if the buffer can't tell."""
+        channel = self._channel(key)
+        self._sync(key, channel)
+        with channel.cond:
+            messages = list(channel.messages)
+            if messages and cursor < messages[0]['cursor'] and not channel.complete:
+                return None  # cursor is older than the ring buffer; caller must query
+            return [m for m in messages if m['cursor'] > cursor]
+
+    def wait(self, key, cursor, timeout):
+        """Long-poll: block up to `timeout` seconds for messages newer than `cursor`."""
+        deadline = time.monotonic() + timeout
+        while True:
+            messages = self.since(key, cursor)
+            if messages is None or messages:
+                return messages
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            channel = self._channel(key)  # looked up again in case it was evicted
+            with channel.cond:
+                if channel.last_cursor <= cursor:
+                    channel.cond.wait(min(remaining, self.sync_interval))
@@ -11,4 +11,113 @@ class Config:
     BACKUP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backups')
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
     MAX_CONTENT_LENGTH = 2 * 1024 * 1024  # 2MB max file size
+    # API-only nodes leave index management to `python manage.py ensure-indexes`
+    ENSURE_INDEXES_ON_BOOT = os.environ.get('ENSURE_INDEXES_ON_BOOT', '1') == '1'
+    # Credit transfers use multi-document transactions: '1' / '0', or unset to
+    # detect them (replica set or sharded cluster) on boot
+    MONGO_TRANSACTIONS = {'1': True, '0': False}.get(os.environ.get('MONGO_TRANSACTIONS', ''))
+    # Seconds a worker may serve an application variable from its local cache
+    VAR_CACHE_TTL = int(os.environ.get('VAR_CACHE_TTL', 30))
+    MAX_VARS_PER_REQUEST = int(os.environ.get('MAX_VARS_PER_REQUEST', 100))
+    # Chat fan-out: ring buffer per channel, how often a worker looks for messages
+    # sent through other workers, and long-poll / SSE stream limits (seconds)
+    CHAT_BUFFER_SIZE = int(os.environ.get('CHAT_BUFFER_SIZE', 100))
+    CHAT_SYNC_INTERVAL = float(os.environ.get('CHAT_SYNC_INTERVAL', 2))
+    CHAT_LONGPOLL_MAX = int(os.environ.get('CHAT_LONGPOLL_MAX', 25))
+    CHAT_STREAM_MAX = int(os.environ.get('CHAT_STREAM_MAX', 300))
+    # Chat buffers kept per worker (least recently used evicted), and how many
+    # long-polls / streams may block at once per worker: half the gthread
+    # threads so plain API calls keep a thread, or half the gevent connections
+    CHAT_MAX_CHANNELS = int(os.environ.get('CHAT_MAX_CHANNELS', 10000))
+    CHAT_MAX_WAITERS = int(os.environ.get('CHAT_MAX_WAITERS', int(os.environ.get('GUNICORN_CONNECTIONS', 1000)) // 2
+                                          if os.environ.get('GUNICORN_WORKER_CLASS') == 'gevent'
+                                          else max(1, int(os.environ.get('GUNICORN_THREADS', 4)) // 2)))
+    # Default per-channel retention, and how many sends (per worker) between trims
+    CHAT_MAX_MESSAGES = int(os.environ.get('CHAT_MAX_MESSAGES', 1000))
+    CHAT_MAX_AGE_DAYS = int(os.environ.get('CHAT_MAX_AGE_DAYS', 30))
+    CHAT_TRIM_EVERY = int(os.environ.get('CHAT_TRIM_EVERY', 50))
+    # Outbound event webhooks
+    WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 10000))
+    WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 8))
+    WEBHOOK_PER_HOST = int(os.environ.get('WEBHOOK_PER_HOST', 4))
+    WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 5))
+    WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', 5))
+    # Most events waiting for a retry per worker; further failures are dead-lettered
+    WEBHOOK_RETRY_QUEUE_SIZE = int(os.environ.get('WEBHOOK_RETRY_QUEUE_SIZE', 10000))
+    # Longest a stopping worker spends flushing queued and retrying webhook events
+    WEBHOOK_SHUTDOWN_TIMEOUT = float(os.environ.get('WEBHOOK_SHUTDOWN_TIMEOUT', 10))
+    # Client `webhook` action: upstream timeout and largest reply relayed
+    WEBHOOK_PROXY_TIMEOUT = float(os.environ.get('WEBHOOK_PROXY_TIMEOUT', 5))
+    WEBHOOK_PROXY_MAX_BYTES = int(os.environ.get('WEBHOOK_PROXY_MAX_BYTES', 1024 * 1024))
+    # Application files: per-worker cache of the GridFS copies, largest file accepted,
+    # files up to FILE_INLINE_MAX are returned hex-encoded in the `file` reply
+    # (KeyAuth SDKs), larger ones get a download link valid FILE_LINK_TTL seconds
+    FILE_CACHE_DIR = os.environ.get('FILE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'file_cache'))
+    FILE_MAX_BYTES = int(os.environ.get('FILE_MAX_BYTES', 512 * 1024 * 1024))
+    FILE_INLINE_MAX = int(os.environ.get('FILE_INLINE_MAX', 1024 * 1024))
+    FILE_LINK_TTL = int(os.environ.get('FILE_LINK_TTL', 300))
+    FILE_FETCH_TIMEOUT = float(os.environ.get('FILE_FETCH_TIMEOUT', 30))
+    # Online users: seen within PRESENCE_WINDOW seconds, tracked in PRESENCE_BUCKET
+    # slices, heartbeats shared between workers every PRESENCE_FLUSH_INTERVAL
+    PRESENCE_WINDOW = int(os.environ.get('PRESENCE_WINDOW', 600))
+    PRESENCE_BUCKET = int(os.environ.get('PRESENCE_BUCKET', 60))
+    PRESENCE_FLUSH_INTERVAL = float(os.environ.get('PRESENCE_FLUSH_INTERVAL', 10))
+    # Usage rollups: seconds between merges into `analytics`, days of buckets kept
+    ANALYTICS_FLUSH_INTERVAL = float(os.environ.get('ANALYTICS_FLUSH_INTERVAL', 10))
+    ANALYTICS_HOURLY_DAYS = int(os.environ.get('ANALYTICS_HOURLY_DAYS', 14))
+    ANALYTICS_DAILY_DAYS = int(os.environ.get('ANALYTICS_DAILY_DAYS', 400))
+    # Bulk user/license import: largest upload, rows per insert_many, and the
+    # Werkzeug method used to hash plaintext passwords (pre-hashed rows skip it)
+    IMPORT_MAX_BYTES = int(os.environ.get('IMPORT_MAX_BYTES', 256 * 1024 * 1024))
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+    IMPORT_HASH_METHOD = os.environ.get('IMPORT_HASH_METHOD', 'scrypt')
+    # Background jobs: rows per chunk, pause between chunks (seconds) to spare the
+    # primary, how often idle runners look for work, and how long a claim lasts
+    # without a checkpoint before another process resumes the job
+    JOB_CHUNK_SIZE = int(os.environ.get('JOB_CHUNK_SIZE', 1000))
+    JOB_CHUNK_PAUSE = float(os.environ.get('JOB_CHUNK_PAUSE', 0.05))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 5))
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 60))
+    # Expired keys: how often the sweep runs (seconds, 0 = only on demand), how
+    # long after expiry a key is moved to app_users_archive (so recently lapsed
+    # keys can still be renewed), and the "expiring soon" horizon in days
+    EXPIRY_SWEEP_INTERVAL = int(os.environ.get('EXPIRY_SWEEP_INTERVAL', 3600))
+    EXPIRED_ARCHIVE_DAYS = int(os.environ.get('EXPIRED_ARCHIVE_DAYS', 30))
+    EXPIRING_SOON_DAYS = int(os.environ.get('EXPIRING_SOON_DAYS', 7))
+    # Per-worker cache of fetchStats user / key counts (seconds)
+    STATS_CACHE_TTL = int(os.environ.get('STATS_CACHE_TTL', 30))
+    # Remembered misses for unknown app name/owner pairs and session ids:
+    # entries per worker and seconds before a miss is looked up again
+    NEGATIVE_CACHE_SIZE = int(os.environ.get('NEGATIVE_CACHE_SIZE', 100000))
+    NEGATIVE_CACHE_TTL = int(os.environ.get('NEGATIVE_CACHE_TTL', 15))
+    # Generated license keys: PREFIX-XXXXX-XXXXX-XXXXX-XXXXX with an embedded
+    # per-app checksum ('checksum'), or the old PREFIX-8hex-8hex-8hex ('legacy')
+    LICENSE_KEY_PREFIX = os.environ.get('LICENSE_KEY_PREFIX', 'SKYLINE')
+    LICENSE_KEY_FORMAT = os.environ.get('LICENSE_KEY_FORMAT', 'checksum')
+    # Offline tokens (apps with "Offline Tokens" on, needs `cryptography`): default
+    # seconds a client may trust a token before logging in again, days revocations
+    # are kept (also the cap on any app's refresh interval), entries per fetch
+    TOKEN_REFRESH_INTERVAL = int(os.environ.get('TOKEN_REFRESH_INTERVAL', 86400))
+    TOKEN_REVOCATION_DAYS = int(os.environ.get('TOKEN_REVOCATION_DAYS', 30))
+    TOKEN_REVOCATION_PAGE = int(os.environ.get('TOKEN_REVOCATION_PAGE', 1000))
+    # App users' last_login / last_ip: written in bulk every LOGIN_FLUSH_INTERVAL
+    # seconds, and at most once per user every LOGIN_WRITE_INTERVAL seconds
+    LOGIN_WRITE_INTERVAL = int(os.environ.get('LOGIN_WRITE_INTERVAL', 300))
+    LOGIN_FLUSH_INTERVAL = float(os.environ.get('LOGIN_FLUSH_INTERVAL', 10))
+    # Write durability per operation class: w for telemetry (logs, presence),
+    # sessions (sessions, chat messages) and critical writes (credits, license
+    # creation; also the commit of credit transactions), e.g. 0, 1 or majority.
+    # Empty = the MONGO_URI default. Critical writes are journaled unless disabled
+    WRITE_CONCERN_TELEMETRY = os.environ.get('WRITE_CONCERN_TELEMETRY', '0')
+    WRITE_CONCERN_SESSIONS = os.environ.get('WRITE_CONCERN_SESSIONS', '1')
+    WRITE_CONCERN_CRITICAL = os.environ.get('WRITE_CONCERN_CRITICAL', 'majority')
+    WRITE_CONCERN_CRITICAL_JOURNAL = os.environ.get('WRITE_CONCERN_CRITICAL_JOURNAL', '1') == '1'
+    # Password hashing pool: processes per web worker (0 = hash inline), hashes
+    # allowed in flight, and seconds to wait for a slot / a result. Every worker
+    # has its own pool, so the default splits the cores between the workers
+    # (WEB_CONCURRENCY, same default as gunicorn.conf.py)
+    HASH_PROCESSES = int(os.environ.get('HASH_PROCESSES', max(1, (os.cpu_count() or 1) // int(
+        os.environ.get('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1)))))
+    HASH_MAX_PENDING = int(os.environ.get('HASH_MAX_PENDING', 256))
+    HASH_TIMEOUT = float(os.environ.get('HASH_TIMEOUT', 10))
 
@@ -0,0 +1,76 @@
+"""
+Content-addressed local storage for application files.
+
+This is a per-worker cache; the data layer keeps the canonical copy in GridFS
+and fills the cache from it on a miss.
+
+Blobs live at <root>/<sha256[:2]>/<sha256> and are written through a temp
+file that is renamed into place, so a half-written download is never served
+and identical uploads are stored once. Data is copied in chunks while being
+hashed; nothing is held in memory whole.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from http_client import ResponseTooLarge, get_session
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FileStore:
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def exists(self, digest):
+        return bool(digest) and os.path.isfile(self.path(digest))
+
+    def put_stream(self, stream):
+        """Copy a file-like object into the store; returns (sha256, size)."""
+        return self.put_chunks(iter(lambda: stream.read(CHUNK_SIZE), b''))
+
+    def put_chunks(self, chunks):
+        os.makedirs(self.root, exist_ok=True)
+        sha, size = hashlib.sha256(), 0
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ResponseTooLarge(f'over {self.max_bytes} bytes')
+                    sha.update(chunk)
+                    out.write(chunk)
+            digest = sha.hexdigest()
+            os.makedirs(os.path.dirname(self.path(digest)), exist_ok=True)
+            os.replace(tmp, self.path(digest))
+            return digest, size
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def fetch(self, url, timeout=30.0):
+        """Download `url` into the store; returns (sha256, size)."""
+        resp = get_session().get(url, stream=True, timeout=(timeout, timeout))
+        try:
+            resp.raise_for_status()
+            return self.put_chunks(resp.iter_content(chunk_size=CHUNK_SIZE))
+        finally:
+            resp.close()
+
+    def read(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+
+    def delete(self, digest):
+        try:
+            os.unlink(self.path(digest))
+        except FileNotFoundError:
+            pass
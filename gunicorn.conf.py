@@ -0,0 +1,84 @@
+"""
+Gunicorn configuration for the SKYLINE web / API service.
+Usage: gunicorn -c gunicorn.conf.py app:application
+
+Every setting can be overridden from the environment:
+  GUNICORN_WORKER_CLASS  gthread (default), gevent or sync
+  WEB_CONCURRENCY        number of worker processes (default: 2 * CPUs + 1)
+  GUNICORN_THREADS       threads per gthread worker (default: 4)
+  GUNICORN_CONNECTIONS   greenlets per gevent worker (default: 1000)
+  GUNICORN_TIMEOUT       hard worker timeout in seconds (default: 120)
+  GUNICORN_KEEPALIVE     HTTP keep-alive in seconds (default: 5)
+  GUNICORN_MAX_REQUESTS  recycle a worker after N requests (default: 10000, 0 = never)
+  GUNICORN_PRELOAD       1/0 - load the app once in the master (default: 1)
+"""
+
+import gc
+import multiprocessing
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+
+if worker_class == 'gevent':
+    # pymongo and requests only cooperate with gevent once the standard
+    # library is patched, and with preload_app the app (and its MongoClient)
+    # is imported in the master before gunicorn's own worker patching runs.
+    from gevent import monkey
+    monkey.patch_all()
+
+_cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', _cpus * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4)) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 1000))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers periodically; the jitter stops them all restarting at once.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max(max_requests // 10, 0)
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+accesslog = None
+errorlog = '-'
+
+
+def when_ready(server):
+    # Move everything the preloaded app allocated into the permanent
+    # generation so the workers' collectors never touch (and copy) those pages.
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from models import db
+        db.reconnect()
+
+
+def post_worker_init(worker):
+    from models import db
+    # Fork the hashing processes before the request and job threads start
+    db.hasher.start()
+    # Background jobs (bulk operations, scheduled expiry sweep) run in every worker
+    if db.db is not None:
+        db.jobs.ensure_started()
+
+
+def worker_exit(server, worker):
+    # Write out heartbeats, rollups and last logins still buffered in this worker
+    from models import db
+    if db.db is not None:
+        db.presence.stop()
+        db.presence.flush()
+        db.rollups.stop()
+        db.rollups.flush()
+        db.logins.stop()
+        db.logins.flush(force=True)
+        # Bounded: whatever is still undelivered at the deadline is dead-lettered
+        db.webhook_dispatcher.shutdown()
+    db.hasher.shutdown()
@@ -0,0 +1,145 @@
+"""
+Password hashing off the request thread.
+
+scrypt / pbkdf2 are deliberately CPU-heavy. Run inline they hold a worker
+thread (and, under gevent, the whole hub) for the full hash. HashService
+sends them to a process pool instead: the request thread only waits on a
+future, so other requests keep doing I/O meanwhile and hashing spreads over
+all cores whatever the number of web workers.
+
+The number of hashes in flight is bounded. A request that cannot get a slot,
+or whose hash does not finish, within `timeout` seconds gets HashingBusy
+rather than queueing without limit. With processes=0 everything runs inline
+(CLI tools, tests).
+
+Each gunicorn worker has its own pool, so HASH_PROCESSES defaults to the
+cores divided by the workers. The pool is started in post_worker_init,
+before the worker's request and job threads exist, so its processes are not
+forked from a busy multithreaded process; a pool replaced after a crash is.
+Under gevent (monkey-patched) the pool's helper threads are greenlets and
+waiting on a result yields to the hub, so other connections keep being
+served while a hash runs.
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _generate(password, method):
+    return generate_password_hash(password, method=method) if method else generate_password_hash(password)
+
+
+def _generate_many(passwords, method):
+    return [_generate(p, method) for p in passwords]
+
+
+def _check(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+class HashService:
+    def __init__(self, processes=None, max_pending=256, timeout=10.0):
+        self.processes = (os.cpu_count() or 1) if processes is None else processes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, processes=None, max_pending=None, timeout=None):
+        with self._lock:
+            if processes is not None:
+                self.processes = processes or 0
+            if max_pending:
+                self.max_pending = max_pending
+                self._slots = threading.BoundedSemaphore(max_pending)
+            if timeout:
+                self.timeout = timeout
+            self._shutdown_pool()
+
+    def generate(self, password, method=None):
+        return self._run(_generate, password, method)
+
+    def generate_many(self, passwords, method=None):
+        """Hash a batch (e.g. generated license keys), split across the pool processes."""
+        passwords = list(passwords)
+        if not self.processes or len(passwords) < 2:
+            return [self.generate(p, method) for p in passwords]
+        size = -(-len(passwords) // self.processes)
+        futures = [self._submit(_generate_many, passwords[i:i + size], method)
+                   for i in range(0, len(passwords), size)]
+        return [h for future in futures for h in self._result(future, self.timeout * size)]
+
+    def check(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(_check, pwhash, password)
+
+    def start(self):
+        """Create the pool and its processes now rather than on the first hash."""
+        if self.processes:
+            self._executor().submit(int).result(timeout=self.timeout)
+
+    def shutdown(self):
+        with self._lock:
+            self._shutdown_pool()
+
+    def _run(self, fn, *args):
+        if not self.processes:
+            return fn(*args)
+        return self._result(self._submit(fn, *args), self.timeout)
+
+    def _submit(self, fn, *args):
+        slots = self._slots
+        if not slots.acquire(timeout=self.timeout):
+            raise HashingBusy('Server busy, please try again.')
+        try:
+            future = self._executor().submit(fn, *args)
+        except BrokenProcessPool:
+            slots.release()
+            self._reset()
+            raise HashingBusy('Server busy, please try again.')
+        except BaseException:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def _result(self, future, timeout):
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise HashingBusy('Server busy, please try again.')
+        except BrokenProcessPool:
+            self._reset()
+            raise HashingBusy('Server busy, please try again.')
+
+    def _reset(self):
+        # A pool process died (e.g. OOM-killed): start a fresh pool next time
+        with self._lock:
+            self._shutdown_pool()
+
+    def _executor(self):
+        # Pools don't survive fork: each (gunicorn) worker process creates its own.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(self.processes)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def _shutdown_pool(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+        self._pid = None
@@ -0,0 +1,67 @@
+"""
+Shared outbound HTTP client.
+
+One keep-alive `requests.Session` per worker process, so webhook deliveries
+and proxied calls reuse TCP/TLS connections instead of dialling per request.
+"""
+
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 32))
+POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 32))
+
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+
+def get_session():
+    """The process-wide pooled session (recreated after a fork)."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS,
+                                      pool_maxsize=POOL_MAXSIZE, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['User-Agent'] = 'SKYLINE-Auth'
+                _session, _session_pid = session, pid
+    return _session
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+def fetch(method, url, data=None, headers=None, timeout=5.0, max_bytes=1024 * 1024):
+    """Request `url` and return (status, body bytes), refusing bodies over `max_bytes`.
+
+    `timeout` bounds connecting and each read; the whole download is also cut
+    off once it has taken longer than 2 * timeout.
+    """
+    deadline = time.monotonic() + 2 * timeout
+    resp = get_session().request(method, url, data=data, headers=headers,
+                                 timeout=(timeout, timeout), stream=True, allow_redirects=False)
+    try:
+        length = resp.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise ResponseTooLarge(f'{length} bytes')
+        chunks, size = [], 0
+        for chunk in resp.iter_content(chunk_size=16384):
+            size += len(chunk)
+            if size > max_bytes:
+                raise ResponseTooLarge(f'over {max_bytes} bytes')
+            if time.monotonic() > deadline:
+                raise requests.Timeout('download took too long')
+            chunks.append(chunk)
+        return resp.status_code, b''.join(chunks)
+    finally:
+        resp.close()
@@ -0,0 +1,137 @@
+"""
+Parsing and validation for bulk user / license imports (panel upload and
+`python manage.py import`).
+
+Rows are read lazily from a binary stream, so memory is bounded by the write
+chunk, not the file. Recognised columns / keys:
+
+  key            required (aliases: username, license)
+  password       plaintext, hashed on import
+  password_hash  already hashed by Werkzeug (pbkdf2:/scrypt:), stored as-is
+  type           'license' or 'user' (default: license unless a password is given)
+  hwid, hwid_lock, status ('active' / 'banned')
+  expiry         ISO date/datetime or unix timestamp; or `days` from now
+  created_at     ISO date/datetime or unix timestamp
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+HASH_PREFIXES = ('pbkdf2:', 'scrypt:')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'on')
+
+
+def detect_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def iter_rows(stream, fmt):
+    """Yield (line number, row dict or None, parse error or None) from a binary stream."""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {k.strip().lower(): (v or '').strip() for k, v in row.items() if k}, None
+        return
+    for line_no, line in enumerate(text, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f'invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, 'expected a JSON object'
+            continue
+        yield line_no, {str(k).lower(): v for k, v in row.items()}, None
+
+
+def _parse_time(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        return datetime.utcfromtimestamp(int(value))
+    value = str(value).replace('Z', '')
+    parsed = datetime.fromisoformat(value)
+    return parsed.replace(tzinfo=None)
+
+
+def _flag(value, default):
+    if value in (None, ''):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def build_user(row, defaults, now, hash_password=None):
+    """Turn one row into an app_users document; returns (doc, error).
+
+    `defaults` holds app_id, package_id, created_by, duration_days, hwid_lock
+    and optionally hash_method. `hash_password(secret)` overrides how
+    plaintext passwords are hashed (the data layer passes its hashing pool).
+    """
+    key = str(row.get('key') or row.get('username') or row.get('license') or '').strip()
+    if not key:
+        return None, 'missing key'
+    if len(key) > 256:
+        return None, 'key longer than 256 characters'
+
+    password_hash = str(row.get('password_hash') or '').strip()
+    password = row.get('password')
+    password = str(password) if password not in (None, '') else None
+    if password_hash and not password_hash.startswith(HASH_PREFIXES):
+        return None, 'unsupported password_hash format (expected a Werkzeug pbkdf2/scrypt hash)'
+
+    kind = str(row.get('type') or '').strip().lower()
+    if kind not in ('', 'license', 'user'):
+        return None, f'unknown type "{kind}"'
+    is_license = kind == 'license' or (not kind and not password and not password_hash)
+    if not password_hash:
+        # Licenses log in with the key itself as the password
+        secret = key if is_license and not password else password
+        if not secret:
+            return None, 'user rows need a password or password_hash'
+        if hash_password:
+            password_hash = hash_password(secret)
+        else:
+            password_hash = generate_password_hash(secret, method=defaults.get('hash_method', 'scrypt'))
+
+    try:
+        expiry = _parse_time(row.get('expiry'))
+        if expiry is None:
+            days = row.get('days')
+            days = int(days) if days not in (None, '') else defaults['duration_days']
+            expiry = now + timedelta(days=days)
+        created_at = _parse_time(row.get('created_at')) or now
+    except (TypeError, ValueError, OverflowError) as e:
+        return None, f'invalid date: {e}'
+
+    status = str(row.get('status') or 'active').strip().lower()
+    if status not in ('active', 'banned'):
+        return None, f'unknown status "{status}"'
+
+    return {
+        'app_id': defaults['app_id'],
+        'key': key,
+        'password': password_hash,
+        'hwid': str(row.get('hwid') or ''),
+        'hwid_lock': _flag(row.get('hwid_lock'), defaults['hwid_lock']),
+        'expiry': expiry,
+        'package_id': defaults['package_id'],
+        'created_by': defaults['created_by'],
+        'created_at': created_at,
+        'is_active': status == 'active',
+        'is_license': is_license,
+    }, None
@@ -0,0 +1,239 @@
+"""
+Background jobs for long-running maintenance (bulk license operations,
+expiry sweeps, cascade deletes).
+
+Jobs are documents in the `jobs` collection, so any process can run them:
+a runner claims a queued job by taking a time-limited lease, and the handler
+reports progress through `ctx.checkpoint(...)`, which also persists where it
+got to and renews the lease. If the process dies, the lease runs out and the
+next runner to poll resumes the job from its last checkpoint. Handlers must
+therefore be idempotent per chunk.
+
+Periodic work (e.g. the expiry sweep) is scheduled with `schedule(kind,
+interval)`: every runner tries to enqueue the job for the current time slot,
+and a unique (kind, slot) index lets exactly one insert win, so the job runs
+once per interval however many processes poll.
+"""
+
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import pymongo
+from pymongo.errors import DuplicateKeyError
+
+ACTIVE = ('queued', 'running', 'cancelling')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """What a handler sees: its params, the saved checkpoint, and progress reporting."""
+
+    def __init__(self, runner, job):
+        self.runner = runner
+        self.job = job
+        self.params = job.get('params', {})
+        self.state = job.get('checkpoint') or {}
+        self.done = job.get('progress', {}).get('done', 0)
+
+    def set_total(self, total):
+        self.runner._update(self.job['_id'], {'progress.total': total})
+
+    def checkpoint(self, state, done=0):
+        """Persist `state` (resume point) and add `done` processed items; raises JobCancelled."""
+        self.state = state
+        self.done += done
+        job = self.runner._collection().find_one_and_update(
+            {'_id': self.job['_id'], 'lease.owner': self.runner.owner},
+            {'$set': {'checkpoint': state, 'progress.done': self.done, 'updated_at': datetime.utcnow(),
+                      'lease.until': datetime.utcnow() + timedelta(seconds=self.runner.lease_seconds)}},
+            projection={'status': 1}, return_document=pymongo.ReturnDocument.AFTER)
+        if job is None:
+            raise JobCancelled('lease lost')
+        if job['status'] == 'cancelling':
+            raise JobCancelled('cancelled')
+        if self.runner.chunk_pause:
+            time.sleep(self.runner.chunk_pause)
+
+
+class JobRunner:
+    """`get_collection()` returns the jobs collection; handlers are registered per kind."""
+
+    def __init__(self, get_collection, poll_interval=5.0, lease_seconds=60, chunk_pause=0.0, autostart=True):
+        self.get_collection = get_collection
+        self.autostart = autostart  # False: only run() / run_pending() run jobs (CLI, tests)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.chunk_pause = chunk_pause
+        self.handlers = {}
+        self.schedules = {}  # kind -> [interval, params, title, next check]
+        self._pid = None
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        self._stop = False
+
+    @property
+    def owner(self):
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def configure(self, **settings):
+        for name, value in settings.items():
+            if value is not None:
+                setattr(self, name, value)
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def schedule(self, kind, interval, params=None, title=None):
+        """Run `kind` once every `interval` seconds across all runners (0 disables)."""
+        if interval:
+            self.schedules[kind] = [interval, params or {}, title, 0]
+        else:
+            self.schedules.pop(kind, None)
+
+    # ── Producer side ────────────────────────────────────────────────
+
+    def submit(self, kind, params, created_by=None, title=None):
+        job_id = self._insert(kind, params, created_by=created_by, title=title)
+        self.ensure_started()
+        self._wake.set()
+        return job_id
+
+    def enqueue_due(self, now=None):
+        """Enqueue scheduled jobs whose slot has not been claimed yet; returns how many."""
+        now = now or time.time()
+        queued = 0
+        for kind, entry in list(self.schedules.items()):
+            interval, params, title, next_check = entry
+            if now < next_check:
+                continue
+            slot = int(now // interval)
+            entry[3] = (slot + 1) * interval
+            try:
+                self._insert(kind, params, title=title, slot=slot)
+                queued += 1
+            except DuplicateKeyError:
+                pass  # another process already queued this slot
+        return queued
+
+    def _insert(self, kind, params, created_by=None, title=None, slot=None):
+        if kind not in self.handlers:
+            raise ValueError(f'unknown job kind {kind!r}')
+        now = datetime.utcnow()
+        doc = {
+            'kind': kind,
+            'title': title or kind,
+            'params': params,
+            'status': 'queued',
+            'progress': {'done': 0, 'total': None},
+            'checkpoint': None,
+            'lease': None,
+            'created_by': created_by,
+            'created_at': now,
+            'updated_at': now,
+        }
+        if slot is not None:
+            doc['slot'] = slot
+        return self._collection().insert_one(doc).inserted_id
+
+    def cancel(self, job_id):
+        coll = self._collection()
+        coll.update_one({'_id': job_id, 'status': 'queued'},
+                        {'$set': {'status': 'cancelled', 'updated_at': datetime.utcnow()}})
+        coll.update_one({'_id': job_id, 'status': 'running'},
+                        {'$set': {'status': 'cancelling', 'updated_at': datetime.utcnow()}})
+
+    # ── Runner side ──────────────────────────────────────────────────
+
+    def ensure_started(self):
+        # Threads don't survive fork: start lazily in whichever process needs one.
+        if not self.autostart or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._stop = False
+            threading.Thread(target=self._loop, name='job-runner', daemon=True).start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stop = True
+        self._wake.set()
+
+    def run(self, job_id):
+        """Run one job in the calling thread if it can be claimed; returns True if it ran."""
+        job = self._claim(job_id)
+        if job is None:
+            return False
+        self._run(job)
+        return True
+
+    def run_pending(self):
+        """Run claimable jobs in the calling thread until none are left; returns how many ran."""
+        ran = 0
+        while True:
+            job = self._claim()
+            if job is None:
+                return ran
+            self._run(job)
+            ran += 1
+
+    def _loop(self):
+        while not self._stop:
+            try:
+                self.enqueue_due()
+                if self.run_pending():
+                    continue
+            except Exception:
+                traceback.print_exc()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _collection(self):
+        return self.get_collection()
+
+    def _claim(self, job_id=None):
+        now = datetime.utcnow()
+        match = {'_id': job_id} if job_id is not None else {}
+        return self._collection().find_one_and_update(
+            {**match, 'kind': {'$in': list(self.handlers)},
+             '$or': [{'status': 'queued', 'lease': None},
+                     # Resume jobs whose runner died (its lease ran out)
+                     {'status': {'$in': list(ACTIVE)}, 'lease.until': {'$lt': now}}]},
+            {'$set': {'lease': {'owner': self.owner, 'until': now + timedelta(seconds=self.lease_seconds)},
+                      'updated_at': now}},
+            sort=[('created_at', 1)],
+            return_document=pymongo.ReturnDocument.AFTER)
+
+    def _run(self, job):
+        ctx = JobContext(self, job)
+        if job['status'] == 'cancelling':
+            self._finish(job, 'cancelled')
+            return
+        if job['status'] == 'queued':
+            job['status'] = 'running'
+            self._update(job['_id'], {'status': 'running', 'started_at': datetime.utcnow()})
+        try:
+            result = self.handlers[job['kind']](ctx)
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            self._finish(job, 'failed', error=f'{e.__class__.__name__}: {e}')
+        else:
+            self._finish(job, 'done', result=result)
+
+    def _finish(self, job, status, **fields):
+        self._collection().update_one(
+            {'_id': job['_id'], 'lease.owner': self.owner},
+            {'$set': {'status': status, 'lease': None, 'finished_at': datetime.utcnow(),
+                      'updated_at': datetime.utcnow(), **fields}})
+
+    def _update(self, job_id, fields):
+        fields['updated_at'] = datetime.utcnow()
+        self._collection().update_one({'_id': job_id}, {'$set': fields})
@@ -0,0 +1,72 @@
+"""
+License key format.
+
+Generated keys look like PREFIX-XXXXX-XXXXX-XXXXX-XXXXX: 16 random Crockford
+base32 characters (80 bits) followed by a 4-character (20-bit) HMAC of them,
+keyed with the app's `key_salt`. handle_api can therefore reject a mistyped
+or made-up key without touching the database: a key with the configured
+prefix and this shape whose checksum does not match was never issued by the
+app. Keys of the same shape under another prefix (imported, another vendor's)
+and keys of apps without a salt are always looked up.
+
+Keys generated before (PREFIX-8hex-8hex-8hex), custom and imported keys carry
+no checksum. They are looked up as before, unless the app turns on strict
+keys, in which case only checksummed keys and legacy generated keys pass.
+"""
+
+import hashlib
+import hmac
+import re
+import secrets
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32: no I, L, O, U
+BODY_LENGTH = 16
+CHECK_LENGTH = 4
+
+_GROUP = '[0-9A-HJKMNP-TV-Z]{5}'
+_CHECKSUMMED = re.compile(rf'^([A-Z0-9]{{1,16}})-({_GROUP})-({_GROUP})-({_GROUP})-({_GROUP})$')
+_LEGACY = re.compile(r'^[A-Z0-9]{1,16}-[0-9A-F]{8}-[0-9A-F]{8}-[0-9A-F]{8}$')
+
+
+def new_salt():
+    return secrets.token_hex(16)
+
+
+def generate(salt, prefix='SKYLINE'):
+    body = ''.join(secrets.choice(ALPHABET) for _ in range(BODY_LENGTH))
+    raw = body + _checksum(salt, body)
+    return prefix + '-' + '-'.join(raw[i:i + 5] for i in range(0, len(raw), 5))
+
+
+def generate_legacy(prefix='SKYLINE'):
+    return f"{prefix}-{secrets.token_hex(4).upper()}-{secrets.token_hex(4).upper()}-{secrets.token_hex(4).upper()}"
+
+
+def classify(key, salt, prefix='SKYLINE'):
+    """'valid' / 'forged' for our checksummed keys, 'legacy' for old generated keys, else 'other'."""
+    match = _CHECKSUMMED.match(key or '')
+    if match and salt and match.group(1) == prefix:
+        raw = ''.join(match.groups()[1:])
+        body, check = raw[:BODY_LENGTH], raw[BODY_LENGTH:]
+        if hmac.compare_digest(check, _checksum(salt, body)):
+            return 'valid'
+        return 'forged'
+    if _LEGACY.match(key or ''):
+        return 'legacy'
+    return 'other'
+
+
+def precheck(key, salt, strict=False, prefix='SKYLINE'):
+    """False when `key` cannot belong to the app, so the lookup can be skipped."""
+    kind = classify(key, salt, prefix)
+    if kind == 'forged':
+        return False
+    if strict and kind == 'other':
+        return False
+    return bool(key)
+
+
+def _checksum(salt, body):
+    digest = hmac.new(salt.encode(), body.encode(), hashlib.sha256).digest()
+    bits = int.from_bytes(digest[:3], 'big') >> (24 - 5 * CHECK_LENGTH)
+    return ''.join(ALPHABET[(bits >> shift) & 31] for shift in range(5 * (CHECK_LENGTH - 1), -1, -5))
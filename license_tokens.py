@@ -0,0 +1,112 @@
+"""
+Offline license tokens.
+
+On a successful login the API can hand the client a compact Ed25519-signed
+token binding the key, HWID, license expiry and app. A client holding the
+app's public key verifies it locally and only needs the auth server again
+once the token's refresh time passes, instead of on every launch.
+
+A token is `v1.<payload>.<signature>`, both parts unpadded base64url; the
+payload is compact JSON:
+
+  app  app id            key  credential (license key or username)
+  hwid bound HWID        exp  license expiry (unix, 0 = none)
+  iat  issued at         ref  refresh by (unix): verify fails after this
+  rev  revocation cursor when issued
+
+Revocations (bans, deletes, HWID resets, HWID blacklists) are published as
+an incremental, per-app numbered list of hashed values (`revocation_hash`),
+so clients fetch only entries past their cursor and banned keys are not
+disclosed. Entries at or below a token's `rev` predate it (e.g. a ban since
+lifted) and do not apply to it. The `cryptography` package is optional:
+without it tokens are simply not issued.
+"""
+
+import base64
+import hashlib
+import json
+import time
+from datetime import timezone
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+except ImportError:  # optional: no offline tokens
+    Ed25519PrivateKey = None
+
+VERSION = 'v1'
+
+
+def available():
+    return Ed25519PrivateKey is not None
+
+
+def new_keypair():
+    """(private, public) raw Ed25519 keys, hex encoded."""
+    key = Ed25519PrivateKey.generate()
+    raw = serialization.Encoding.Raw
+    private = key.private_bytes(raw, serialization.PrivateFormat.Raw, serialization.NoEncryption())
+    public = key.public_key().public_bytes(raw, serialization.PublicFormat.Raw)
+    return private.hex(), public.hex()
+
+
+def issue(private_hex, app_id, key, hwid, expiry, refresh, rev=0, now=None):
+    """Sign a token for `key` on `hwid`; `expiry` is a (naive UTC) datetime or None, `refresh` seconds."""
+    now = int(now or time.time())
+    claims = {
+        'app': str(app_id),
+        'key': key,
+        'hwid': hwid or '',
+        'exp': int(_utc(expiry).timestamp()) if expiry else 0,
+        'iat': now,
+        'ref': now + int(refresh),
+        'rev': rev,
+    }
+    payload = json.dumps(claims, separators=(',', ':')).encode()
+    signature = Ed25519PrivateKey.from_private_bytes(bytes.fromhex(private_hex)).sign(payload)
+    return f'{VERSION}.{_b64(payload)}.{_b64(signature)}'
+
+
+def verify(token, public_hex, app_id=None, hwid=None, now=None):
+    """Claims of a valid, current token (for `app_id` / `hwid` when given), else None."""
+    try:
+        version, payload, signature = token.split('.')
+        if version != VERSION:
+            return None
+        payload = _unb64(payload)
+        Ed25519PublicKey.from_public_bytes(bytes.fromhex(public_hex)).verify(_unb64(signature), payload)
+        claims = json.loads(payload)
+    except (AttributeError, ValueError, InvalidSignature):
+        return None
+    now = now or time.time()
+    if now >= claims['ref'] or (claims['exp'] and now >= claims['exp']):
+        return None
+    if app_id is not None and claims['app'] != str(app_id):
+        return None
+    if hwid is not None and claims['hwid'] and claims['hwid'] != hwid:
+        return None
+    return claims
+
+
+def revocation_hash(value):
+    return hashlib.sha256(value.encode()).hexdigest()[:32]
+
+
+def is_revoked(claims, revocations):
+    """True when a revocation entry ({'seq', 'hash'}) newer than the token names its key or HWID."""
+    revoked = {r['hash'] for r in revocations if r['seq'] > claims['rev']}
+    return any(revocation_hash(v) in revoked for v in (claims['key'], claims['hwid']) if v)
+
+
+def _utc(moment):
+    # Stored datetimes are naive UTC; .timestamp() alone would read them as local time
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
@@ -0,0 +1,99 @@
+"""
+Write-behind for app users' `last_login` / `last_ip`.
+
+These fields only feed the panel and exports, yet every client login used to
+rewrite the user document. LoginTracker keeps the latest login per user in
+memory and a background thread writes them in one bulk write every
+`flush_interval` seconds, a given user at most once per `interval` seconds:
+later logins inside the interval just replace the pending values, which go
+out once it has passed.
+A crashed worker loses at most those pending timestamps. HWID binding is not
+tracked here; it is written synchronously by the login itself.
+"""
+
+import os
+import threading
+import time
+import traceback
+
+
+class LoginTracker:
+    """`flush(entries)` persists [(user_id, last_login, ip)], times in epoch seconds."""
+
+    def __init__(self, flush, interval=300, flush_interval=10.0, autostart=True):
+        self.flush_fn = flush
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.autostart = autostart  # False: only explicit flush() calls write
+        self._pending = {}   # user_id -> (seen, ip)
+        self._written = {}   # user_id -> when it was last flushed
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+
+    def configure(self, interval=None, flush_interval=None):
+        with self._lock:
+            if interval is not None:
+                self.interval = interval
+            if flush_interval is not None:
+                self.flush_interval = flush_interval
+
+    def record(self, user_id, ip=None, now=None):
+        now = now or time.time()
+        with self._lock:
+            self._pending[user_id] = (now, ip)
+        self.ensure_started()
+
+    def ensure_started(self):
+        # Threads don't survive fork: start lazily in whichever process records.
+        if not self.autostart or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            threading.Thread(target=self._loop, name='login-flush', daemon=True).start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def written(self, user_id):
+        """Note a login already persisted by another write (e.g. HWID binding)."""
+        with self._lock:
+            self._pending.pop(user_id, None)
+            self._written[user_id] = time.time()
+
+    def flush(self, force=False, now=None):
+        """Write pending logins whose user is due (all of them with `force`); returns how many."""
+        now = now or time.time()
+        with self._lock:
+            cutoff = now - self.interval
+            due = {uid: entry for uid, entry in self._pending.items()
+                   if force or self._written.get(uid, 0) <= cutoff}
+            for uid in due:
+                del self._pending[uid]
+                self._written[uid] = now
+            # Users not written within the interval need no throttling entry
+            for uid in [u for u, t in self._written.items() if t <= cutoff and u not in self._pending]:
+                del self._written[uid]
+        if not due:
+            return 0
+        try:
+            self.flush_fn([(uid, seen, ip) for uid, (seen, ip) in due.items()])
+        except Exception:
+            # Keep them for the next attempt unless newer logins replaced them
+            with self._lock:
+                for uid, entry in due.items():
+                    self._pending.setdefault(uid, entry)
+                    self._written.pop(uid, None)
+            return 0
+        return len(due)
@@ -0,0 +1,148 @@
+"""
+One-shot maintenance commands for SKYLINE.
+
+  python manage.py ensure-indexes     Create / update all MongoDB indexes
+  python manage.py trim-chats         Apply every chat channel's retention now
+  python manage.py import FILE --app APP_ID --package PACKAGE_ID --admin USERNAME
+                                      Bulk-import users / licenses from CSV or NDJSON
+  python manage.py rebuild-credits    Reset cached credit balances from the credit ledger
+  python manage.py run-jobs [--loop]  Run queued background jobs (bulk operations, ...)
+  python manage.py sweep-expired      Archive keys that expired over EXPIRED_ARCHIVE_DAYS ago
+  python manage.py expiring [--days N] [--app APP_ID]
+                                      List keys expiring within N days
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from flask import Flask
+
+from config import Config
+from importer import detect_format
+from models import db
+
+
+def _init_db():
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    db.init_app(app, ensure_indexes=False)
+    db.jobs.autostart = False  # jobs run in the foreground via run() / run_pending()
+    return app
+
+
+def cmd_ensure_indexes(args):
+    db.ensure_indexes()
+    print("Indexes are up to date.")
+
+
+def cmd_trim_chats(args):
+    removed = db.trim_chat_channels()
+    print(f"Removed {removed} chat message(s).")
+
+
+def cmd_import(args):
+    admin = db.db.admins.find_one({'username': args.admin})
+    if not admin:
+        print(f"No admin named {args.admin!r}.", file=sys.stderr)
+        return 1
+    fmt = args.format or detect_format(args.file)
+    with open(args.file, 'rb') as f:
+        job_id, error = db.start_import(
+            args.app, args.package, admin['_id'], f, fmt, filename=os.path.basename(args.file),
+            chunk_size=args.chunk_size, hwid_lock=not args.no_hwid_lock,
+            hash_method=Config.IMPORT_HASH_METHOD)
+    if error:
+        print(error, file=sys.stderr)
+        return 1
+    db.jobs.run(job_id)
+    job = db.get_job(job_id)
+    if job['status'] != 'done':
+        print(f"Import {job['status']}: {job.get('error', '')}", file=sys.stderr)
+        return 1
+    report = job['result']
+    for line, message in report['errors']:
+        print(f"line {line}: {message}", file=sys.stderr)
+    print(f"Inserted {report['inserted']}, duplicates {report['duplicates']}, "
+          f"invalid {report['invalid']}, failed {report['failed']}.")
+    return 0
+
+
+def cmd_sweep_expired(args):
+    job_id = db.sweep_expired()
+    db.jobs.run(job_id)
+    job = db.get_job(job_id)
+    if job['status'] != 'done':
+        print(f"Sweep {job['status']}: {job.get('error', '')}", file=sys.stderr)
+        return 1
+    print(f"Archived {job['result']['archived']} expired key(s).")
+    return 0
+
+
+def cmd_expiring(args):
+    for user in db.get_expiring_users(days=args.days, app_id=args.app, limit=args.limit):
+        print(f"{user['expiry']:%Y-%m-%d %H:%M}  {user['key']}")
+    return 0
+
+
+def cmd_rebuild_credits(args):
+    changed = db.rebuild_credit_balances()
+    print(f"Corrected {changed} balance(s).")
+    return 0
+
+
+def cmd_run_jobs(args):
+    while True:
+        db.jobs.enqueue_due()
+        ran = db.jobs.run_pending()
+        if ran:
+            print(f"Ran {ran} job(s).")
+        if not args.loop:
+            return 0
+        time.sleep(db.jobs.poll_interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('ensure-indexes', help='create / update all MongoDB indexes')
+    p.set_defaults(func=cmd_ensure_indexes)
+
+    p = sub.add_parser('trim-chats', help="apply every chat channel's retention now")
+    p.set_defaults(func=cmd_trim_chats)
+
+    p = sub.add_parser('import', help='bulk-import users / licenses from CSV or NDJSON')
+    p.add_argument('file')
+    p.add_argument('--app', required=True, help='application id')
+    p.add_argument('--package', required=True, help='package id (default duration)')
+    p.add_argument('--admin', required=True, help='username recorded as creator')
+    p.add_argument('--format', choices=('csv', 'ndjson'), help='default: from the file extension')
+    p.add_argument('--chunk-size', type=int, default=Config.IMPORT_CHUNK_SIZE)
+    p.add_argument('--no-hwid-lock', action='store_true', help='default hwid_lock off for rows without one')
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser('sweep-expired', help='archive long-expired keys now')
+    p.set_defaults(func=cmd_sweep_expired)
+
+    p = sub.add_parser('expiring', help='list keys expiring soon')
+    p.add_argument('--days', type=int, default=Config.EXPIRING_SOON_DAYS)
+    p.add_argument('--app', help='application id (default: all)')
+    p.add_argument('--limit', type=int, default=500)
+    p.set_defaults(func=cmd_expiring)
+
+    p = sub.add_parser('rebuild-credits', help='reset cached credit balances from the ledger')
+    p.set_defaults(func=cmd_rebuild_credits)
+
+    p = sub.add_parser('run-jobs', help='run queued background jobs in this process')
+    p.add_argument('--loop', action='store_true', help='keep polling instead of exiting when idle')
+    p.set_defaults(func=cmd_run_jobs)
+
+    args = parser.parse_args(argv)
+    _init_db()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,42 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import secrets
 import json
 import os
+import gridfs
 import pymongo
+from collections import Counter
+from bson.binary import Binary
 from bson.objectid import ObjectId
+from pymongo import UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from cache import TTLCache, MISSING, SingleFlight
+from chat_hub import ChatHub
+from webhook_dispatcher import WebhookDispatcher
+from webhook_proxy import WebhookProxy
+from file_store import FileStore
+from presence import PresenceTracker
+from login_tracker import LoginTracker
+from analytics import HyperLogLog, PERIODS, Rollups
+from importer import build_user, iter_rows
+from jobs import JobRunner
+from hashing import HashService
+import license_keys
+import license_tokens
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class _InsufficientCredits(Exception):
+    pass
+
+
+def _write_concern(w, journal=False):
+    """WriteConcern for a configured `w` ('0', '1', 'majority', ...); None keeps the client default."""
+    if w in (None, ''):
+        return None
+    w = int(w) if str(w).isdigit() else w
+    return WriteConcern(w=w, j=True if journal and w != 0 else None)
 
 
 class Database:
@@ -12,19 +44,218 @@ class Database:
         self.client = None
         self.db = None
         self.mode = 'mongo'
-    
-    def init_app(self, app):
+        self._mongo_uri = None
+        self._db_name = None
+        self.transactions = False
+        # Durability tier -> WriteConcern (see _tiered); unset tiers use the client default
+        self.write_concerns = {}
+        self._tier_collections = {}
+        self.hasher = HashService(processes=0)
+        self.key_prefix = 'SKYLINE'
+        self.key_format = 'checksum'
+        self.token_refresh = 86400
+        self.token_revocation_days = 30
+        self._var_cache = TTLCache(maxsize=10000, ttl=30)
+        self._chat_channel_cache = TTLCache(maxsize=10000, ttl=30)
+        self.chat_hub = ChatHub(self._load_chat_since)
+        self.chat_max_messages = 1000
+        self.chat_max_age = 30 * 86400
+        self.chat_trim_every = 50
+        self._chat_sends = {}
+        self._webhook_cache = TTLCache(maxsize=10000, ttl=30)
+        self.webhook_dispatcher = WebhookDispatcher(self._webhook_targets, self._webhook_dead_letter)
+        self.webhook_proxy = WebhookProxy()
+        self.file_store = FileStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'file_cache'))
+        self.file_fetch_timeout = 30
+        self._file_flight = SingleFlight()
+        # Concurrent identical reads (e.g. every client re-running init after a
+        # release) share one in-flight query instead of each hitting Mongo
+        self._flight = SingleFlight()
+        # Recent misses, so repeated bogus app / session ids are rejected without a query
+        self._app_misses = TTLCache(maxsize=100000, ttl=15)
+        self._session_misses = TTLCache(maxsize=100000, ttl=15)
+        self.presence = PresenceTracker(self._flush_presence, self._load_presence)
+        self.rollups = Rollups(self._merge_rollup)
+        self.logins = LoginTracker(self._flush_logins)
+        self.jobs = JobRunner(lambda: self.db.jobs)
+        self.jobs.register('users.bulk', self._job_bulk_users)
+        self.jobs.register('licenses.sweep', self._job_sweep_expired)
+        self.jobs.register('apps.delete', self._job_delete_app)
+        self.jobs.register('users.import', self._job_import_users)
+        self.job_chunk_size = 1000
+        self._stats_cache = TTLCache(maxsize=10000, ttl=30)
+        self.expired_archive_days = 30
+        self.expiring_soon_days = 7
+        self.analytics_retention = {'hour': 14 * 86400, 'day': 400 * 86400}
+
+    def init_app(self, app, ensure_indexes=None):
         mongo_uri = app.config.get('MONGO_URI')
         if not mongo_uri:
             raise RuntimeError('MONGO_URI is required for MongoDB')
+        self._mongo_uri = mongo_uri
+        self._db_name = app.config.get('DATABASE_NAME', 'SKYLINE')
         self.client = pymongo.MongoClient(mongo_uri)
-        db_name = app.config.get('DATABASE_NAME', 'SKYLINE')
-        self.db = self.client[db_name]
+        self.db = self.client[self._db_name]
+        self.transactions = app.config.get('MONGO_TRANSACTIONS')
+        if self.transactions is None:
+            self.transactions = self._supports_transactions()
+        self.write_concerns = {
+            'telemetry': _write_concern(app.config.get('WRITE_CONCERN_TELEMETRY')),
+            'sessions': _write_concern(app.config.get('WRITE_CONCERN_SESSIONS')),
+            'critical': _write_concern(app.config.get('WRITE_CONCERN_CRITICAL'),
+                                       app.config.get('WRITE_CONCERN_CRITICAL_JOURNAL', True)),
+        }
+        self._tier_collections = {}
+        self._var_cache = TTLCache(maxsize=10000, ttl=app.config.get('VAR_CACHE_TTL', 30))
+        self.key_prefix = app.config.get('LICENSE_KEY_PREFIX', 'SKYLINE')
+        self.key_format = app.config.get('LICENSE_KEY_FORMAT', 'checksum')
+        self.token_refresh = app.config.get('TOKEN_REFRESH_INTERVAL', 86400)
+        self.token_revocation_days = app.config.get('TOKEN_REVOCATION_DAYS', 30)
+        self.hasher.configure(processes=app.config.get('HASH_PROCESSES'),
+                              max_pending=app.config.get('HASH_MAX_PENDING'),
+                              timeout=app.config.get('HASH_TIMEOUT'))
+        self.chat_hub.configure(buffer_size=app.config.get('CHAT_BUFFER_SIZE', 100),
+                                sync_interval=app.config.get('CHAT_SYNC_INTERVAL', 2.0),
+                                max_channels=app.config.get('CHAT_MAX_CHANNELS'),
+                                max_waiters=app.config.get('CHAT_MAX_WAITERS'))
+        self.chat_max_messages = app.config.get('CHAT_MAX_MESSAGES', 1000)
+        self.chat_max_age = app.config.get('CHAT_MAX_AGE_DAYS', 30) * 86400
+        self.chat_trim_every = app.config.get('CHAT_TRIM_EVERY', 50)
+        self.webhook_dispatcher.configure(
+            queue_size=app.config.get('WEBHOOK_QUEUE_SIZE'),
+            workers=app.config.get('WEBHOOK_WORKERS'),
+            per_host=app.config.get('WEBHOOK_PER_HOST'),
+            max_attempts=app.config.get('WEBHOOK_MAX_ATTEMPTS'),
+            timeout=app.config.get('WEBHOOK_TIMEOUT'),
+            shutdown_timeout=app.config.get('WEBHOOK_SHUTDOWN_TIMEOUT'),
+            max_retry_events=app.config.get('WEBHOOK_RETRY_QUEUE_SIZE'),
+        )
+        self.webhook_proxy.configure(timeout=app.config.get('WEBHOOK_PROXY_TIMEOUT'),
+                                     max_bytes=app.config.get('WEBHOOK_PROXY_MAX_BYTES'))
+        self.file_store = FileStore(app.config.get('FILE_CACHE_DIR', self.file_store.root),
+                                    app.config.get('FILE_MAX_BYTES', self.file_store.max_bytes))
+        self.file_fetch_timeout = app.config.get('FILE_FETCH_TIMEOUT', 30)
+        self.presence.configure(window=app.config.get('PRESENCE_WINDOW'),
+                                bucket=app.config.get('PRESENCE_BUCKET'),
+                                flush_interval=app.config.get('PRESENCE_FLUSH_INTERVAL'))
+        self.rollups.configure(flush_interval=app.config.get('ANALYTICS_FLUSH_INTERVAL'))
+        self.logins.configure(interval=app.config.get('LOGIN_WRITE_INTERVAL'),
+                              flush_interval=app.config.get('LOGIN_FLUSH_INTERVAL'))
+        self.jobs.configure(poll_interval=app.config.get('JOB_POLL_INTERVAL'),
+                            lease_seconds=app.config.get('JOB_LEASE_SECONDS'),
+                            chunk_pause=app.config.get('JOB_CHUNK_PAUSE'))
+        self.job_chunk_size = app.config.get('JOB_CHUNK_SIZE', 1000)
+        self._stats_cache = TTLCache(maxsize=10000, ttl=app.config.get('STATS_CACHE_TTL', 30))
+        self._app_misses = TTLCache(maxsize=app.config.get('NEGATIVE_CACHE_SIZE', 100000),
+                                    ttl=app.config.get('NEGATIVE_CACHE_TTL', 15))
+        self._session_misses = TTLCache(maxsize=app.config.get('NEGATIVE_CACHE_SIZE', 100000),
+                                        ttl=app.config.get('NEGATIVE_CACHE_TTL', 15))
+        self.expired_archive_days = app.config.get('EXPIRED_ARCHIVE_DAYS', 30)
+        self.expiring_soon_days = app.config.get('EXPIRING_SOON_DAYS', 7)
+        self.jobs.schedule('licenses.sweep', app.config.get('EXPIRY_SWEEP_INTERVAL', 3600),
+                           title='Archive expired licenses')
+        self.analytics_retention = {'hour': app.config.get('ANALYTICS_HOURLY_DAYS', 14) * 86400,
+                                    'day': app.config.get('ANALYTICS_DAILY_DAYS', 400) * 86400}
+        if ensure_indexes is None:
+            ensure_indexes = app.config.get('ENSURE_INDEXES_ON_BOOT', True)
+        if ensure_indexes:
+            self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Create every index the data layer relies on (idempotent).
+
+        Runs on boot for the full panel app; API-only nodes skip it and rely on
+        `python manage.py ensure-indexes` being run once per deploy.
+        """
         self.db.admins.create_index('username', unique=True)
         self.db.apps.create_index('secret_key', unique=True)
+        self.db.apps.create_index([('owner_id', 1), ('name', 1)])
         self.db.app_users.create_index('key', unique=True)
+        self.db.app_users.create_index([('app_id', 1), ('created_by', 1)])
+        self.db.app_users.create_index('created_by')
+        self.db.app_users.create_index('expiry')
+        self.db.app_users.create_index([('app_id', 1), ('expiry', 1)])
+        self.db.app_users.create_index('bulk_job', sparse=True)  # only rows of a chunk in flight
+        self.db.app_users_archive.create_index([('app_id', 1), ('key', 1)])
         self.db.sessions.create_index('session_id', unique=True)
+        self.db.sessions.create_index([('app_id', 1), ('credential', 1)])
         self.db.sessions.create_index('created_at', expireAfterSeconds=86400) # Auto-delete sessions after 24h
+        self.db.app_variables.create_index([('app_id', 1), ('varid', 1)], unique=True)
+        self.db.chat_throttle.create_index([('channel_id', 1), ('author', 1)], unique=True)
+        self.db.chat_throttle.create_index('last_sent', expireAfterSeconds=86400)
+        self.db.chat_messages.create_index([('channel_id', 1), ('timestamp', -1)])
+        self.db.chat_messages.create_index('expire_at', expireAfterSeconds=0)  # per-channel max age
+        self.db.chats.create_index([('app_id', 1), ('name', 1)])
+        self.db.packages.create_index('app_id')
+        self.db.logs.create_index([('app_id', 1), ('timestamp', -1)])
+        self.db.blacklists.create_index([('app_id', 1), ('item', 1)])
+        self.db.webhooks.create_index([('app_id', 1), ('events', 1)])
+        self.db.webhooks.create_index([('app_id', 1), ('webid', 1)])
+        self.db.files.create_index([('app_id', 1), ('file_id', 1)])
+        self.db.files.create_index('sha256', sparse=True)
+        self.db.presence.create_index([('app_id', 1), ('credential', 1)], unique=True)
+        self.db.presence.create_index([('app_id', 1), ('flushed_at', 1)])
+        self.db.presence.create_index('last_seen', expireAfterSeconds=86400)
+        self.db.analytics.create_index([('app_id', 1), ('period', 1), ('start', 1)], unique=True)
+        self.db.analytics.create_index('expire_at', expireAfterSeconds=0)
+        self.db.jobs.create_index([('status', 1), ('created_at', 1)])
+        self.db.jobs.create_index([('created_by', 1), ('created_at', -1)])
+        # One scheduled run per (kind, time slot), whichever process enqueues it first
+        self.db.jobs.create_index([('kind', 1), ('slot', 1)], unique=True,
+                                  partialFilterExpression={'slot': {'$exists': True}})
+        self.db.webhook_dead_letters.create_index([('app_id', 1), ('created_at', -1)])
+        self.db.webhook_dead_letters.create_index('created_at', expireAfterSeconds=30 * 86400)
+        self.db.credit_ledger.create_index([('admin_id', 1), ('created_at', -1)])
+        self.db.token_revocations.create_index([('app_id', 1), ('seq', 1)], unique=True)
+        # Older entries only concern tokens past their refresh time (token_refresh is capped to this)
+        self.db.token_revocations.create_index('created_at', expireAfterSeconds=self.token_revocation_days * 86400)
+        self.migrate_app_variables()
+        self.migrate_credit_ledger()
+
+    def migrate_app_variables(self):
+        """Move variables still embedded in app documents into `app_variables`."""
+        for app in self.db.apps.find({'variables': {'$gt': {}}}, {'variables': 1}):
+            ops = [
+                UpdateOne({'app_id': app['_id'], 'varid': varid},
+                          {'$setOnInsert': {'data': vardata, 'updated_at': self._now()}},
+                          upsert=True)
+                for varid, vardata in app['variables'].items()
+            ]
+            if ops:
+                self.db.app_variables.bulk_write(ops, ordered=False)
+            self.db.apps.update_one({'_id': app['_id']}, {'$unset': {'variables': ""}})
+
+    def reconnect(self):
+        """Open a fresh MongoClient in a forked worker.
+
+        MongoClient is not fork-safe: with gunicorn's preload_app the client
+        created in the master must not be shared with the workers.
+        """
+        if not self._mongo_uri:
+            return
+        self.client = pymongo.MongoClient(self._mongo_uri)
+        self.db = self.client[self._db_name]
+
+    def _supports_transactions(self):
+        # Multi-document transactions need a replica set or a sharded cluster
+        try:
+            hello = self.client.admin.command('hello')
+        except Exception:
+            return False
+        return bool(hello.get('setName')) or hello.get('msg') == 'isdbgrid'
+
+    def _tiered(self, name, tier):
+        """Collection `name` writing with durability `tier`'s write concern.
+
+        'telemetry' (logs, presence, last login: losing a few is harmless),
+        'sessions' (sessions, chat) and 'critical' (credits, license creation).
+        """
+        coll = self._tier_collections.get((name, tier))
+        if coll is None or coll.database is not self.db:  # reconnect() replaces self.db
+            concern = self.write_concerns.get(tier)
+            coll = self.db[name] if concern is None else self.db.get_collection(name, write_concern=concern)
+            self._tier_collections[(name, tier)] = coll
+        return coll
 
     def _to_id(self, val):
         if isinstance(val, ObjectId):
@@ -47,7 +278,7 @@ class Database:
                 return None
             doc = {
                 'username': username,
-                'password': generate_password_hash(password),
+                'password': self.hasher.generate(password),
                 'email': email,
                 'role': role,
                 'credits': 0,
@@ -65,7 +296,7 @@ class Database:
     def verify_admin(self, username, password):
         if self.mode == 'mongo':
             admin = self.db.admins.find_one({'username': username, 'is_active': True})
-            if admin and check_password_hash(admin.get('password', ''), password):
+            if admin and self.hasher.check(admin.get('password', ''), password):
                 admin['_id'] = admin['_id']
                 return admin
             return None
@@ -73,7 +304,7 @@ class Database:
     def verify_app_user(self, key, password):
         if self.mode == 'mongo':
             user = self.db.app_users.find_one({'key': key})
-            if user and check_password_hash(user.get('password', ''), password):
+            if user and self.hasher.check(user.get('password', ''), password):
                 return user
             return None
 
@@ -103,7 +334,7 @@ class Database:
             if 'email' in data:
                 update['email'] = data['email']
             if 'password' in data and data['password']:
-                update['password'] = generate_password_hash(data['password'])
+                update['password'] = self.hasher.generate(data['password'])
             if 'is_active' in data:
                 update['is_active'] = data['is_active']
             if 'profile_pic' in data:
@@ -139,7 +370,6 @@ class Database:
                 'secret_key': secrets.token_hex(32),
                 'owner_id': self._to_id(owner_id),
                 'version': '1.0',
-                'variables': {},
                 'created_at': self._now(),
                 'is_active': True,
                 # New compatibility fields
@@ -152,9 +382,18 @@ class Database:
                 'download_link': "",
                 'force_encryption': False, # Setting to False by default for easier initial testing
                 'session_expiry': 3600,
-                'minHwid': 0
+                'minHwid': 0,
+                # HMAC key for generated license keys' checksums (never rotated, unlike secret_key)
+                'key_salt': license_keys.new_salt(),
+                'strict_keys': False,
+                # Signed offline tokens on login (keypair created when first enabled)
+                'offline_tokens': False,
+                'token_refresh': self.token_refresh,
+                # Bumped on every client-visible change (settings, version, variables)
+                'config_version': 1
             }
             res = self.db.apps.insert_one(doc)
+            self._app_misses.delete((name, doc['owner_id']))
             return str(res.inserted_id)
 
     def update_app_settings(self, app_id, data):
@@ -165,23 +404,118 @@ class Database:
                 'name', 'version', 'is_active', 'is_paused', 
                 'hwid_check', 'vpn_block', 'hash_check', 
                 'app_disabled_msg', 'download_link', 
-                'force_encryption', 'session_expiry', 'server_hash', 'minHwid'
+                'force_encryption', 'session_expiry', 'server_hash', 'minHwid', 'strict_keys',
+                'offline_tokens', 'token_refresh'
             ]
             for field in allowed:
                 if field in data:
                     update_fields[field] = data[field]
             
             if update_fields:
-                self.db.apps.update_one({'_id': oid}, {'$set': update_fields})
+                if update_fields.get('offline_tokens'):
+                    self.get_token_keys(app_id)
+                self.db.apps.update_one({'_id': oid}, {'$set': update_fields, '$inc': {'config_version': 1}})
+                if 'name' in update_fields:
+                    self._app_misses.delete_where(lambda key: key[0] == update_fields['name'])
                 return True
             return False
 
     def update_app_version(self, app_id, version):
         if self.mode == 'mongo':
             oid = self._to_id(app_id)
-            self.db.apps.update_one({'_id': oid}, {'$set': {'version': version}})
+            self.db.apps.update_one({'_id': oid}, {'$set': {'version': version}, '$inc': {'config_version': 1}})
             return True
 
+    def get_app_for_api(self, name, owner_id):
+        """The app handle_api serves, by (name, owner id); deleted apps never match."""
+        if self.mode == 'mongo':
+            oid = self._to_id(owner_id)
+            if oid is None or self._app_misses.get((name, oid), None):
+                return None
+            app = self._flight.do(('app', name, oid), lambda: self.db.apps.find_one(
+                {'name': name, 'owner_id': oid, 'deleted_at': None}))
+            if not app:
+                self._app_misses.set((name, oid), True)
+                return None
+            # Callers share the fetched document; give each its own copy
+            return dict(app)
+
+    def get_key_salt(self, app_id):
+        """The app's license key salt, created on first use for apps that predate it."""
+        if self.mode == 'mongo':
+            oid = self._to_id(app_id)
+            self.db.apps.update_one({'_id': oid, 'key_salt': None},
+                                    {'$set': {'key_salt': license_keys.new_salt()}})
+            app = self.db.apps.find_one({'_id': oid}, {'key_salt': 1})
+            return app.get('key_salt') if app else None
+
+    def generate_license_key(self, key_salt):
+        if self.key_format == 'legacy':
+            return license_keys.generate_legacy(self.key_prefix)
+        return license_keys.generate(key_salt, self.key_prefix)
+
+    # ── Offline tokens ───────────────────────────────────────────────
+
+    def get_token_keys(self, app_id):
+        """The app's (private, public) token keys, created on first use; (None, None) without cryptography."""
+        if self.mode == 'mongo':
+            if not license_tokens.available():
+                return None, None
+            oid = self._to_id(app_id)
+            private, public = license_tokens.new_keypair()
+            self.db.apps.update_one({'_id': oid, 'token_key': None},
+                                    {'$set': {'token_key': private, 'token_public_key': public}})
+            app = self.db.apps.find_one({'_id': oid}, {'token_key': 1, 'token_public_key': 1})
+            return (app.get('token_key'), app.get('token_public_key')) if app else (None, None)
+
+    def issue_token(self, app, credential, hwid, expiry):
+        """A signed offline token for a user who just logged in, or None if the app doesn't issue them."""
+        if not app.get('offline_tokens') or not license_tokens.available():
+            return None
+        private = app.get('token_key') or self.get_token_keys(app['_id'])[0]
+        return license_tokens.issue(private, app['_id'], credential, hwid, expiry, self.token_refresh_for(app),
+                                    rev=app.get('revocation_seq', 0))
+
+    def token_refresh_for(self, app):
+        # Capped so revocations are never pruned before the tokens they revoke run out
+        return min(int(app.get('token_refresh') or self.token_refresh), self.token_revocation_days * 86400)
+
+    def revoke_tokens(self, app_id, keys=(), hwids=()):
+        """Publish key / HWID revocations for offline tokens; a no-op for apps that never issued any."""
+        if self.mode == 'mongo':
+            values = [('key', v) for v in dict.fromkeys(keys) if v] + [('hwid', v) for v in dict.fromkeys(hwids) if v]
+            if not values:
+                return 0
+            # Reserve a block of sequence numbers on the app so clients can page by cursor
+            app = self.db.apps.find_one_and_update(
+                {'_id': self._to_id(app_id), 'token_key': {'$ne': None}},
+                {'$inc': {'revocation_seq': len(values)}},
+                projection={'revocation_seq': 1}, return_document=pymongo.ReturnDocument.AFTER)
+            if not app:
+                return 0
+            first, now = app['revocation_seq'] - len(values) + 1, self._now()
+            self.db.token_revocations.insert_many([
+                {'app_id': app['_id'], 'seq': first + i, 'kind': kind,
+                 'hash': license_tokens.revocation_hash(value), 'created_at': now}
+                for i, (kind, value) in enumerate(values)])
+            return len(values)
+
+    def _revoke_user_tokens(self, users):
+        by_app = {}
+        for user in users:
+            by_app.setdefault(user.get('app_id'), []).extend((user.get('key'), user.get('username')))
+        for app_id, creds in by_app.items():
+            self.revoke_tokens(app_id, keys=creds)
+
+    def get_revocations(self, app, since=0, limit=1000):
+        """Revocations after cursor `since`, oldest first; no query when the client is up to date."""
+        if self.mode == 'mongo':
+            if since >= app.get('revocation_seq', 0):
+                return []
+            return list(self.db.token_revocations.find(
+                {'app_id': app['_id'], 'seq': {'$gt': since}}, {'_id': 0, 'seq': 1, 'hash': 1})
+                .sort('seq', 1).limit(limit))
+
     def get_app_by_details(self, name, secret, owner_id):
         if self.mode == 'mongo':
             # Strict validation
@@ -196,63 +530,107 @@ class Database:
     def get_app_stats(self, app_id):
         if self.mode == 'mongo':
             oid = self._to_id(app_id)
-            num_users = self.db.app_users.count_documents({'app_id': oid})
-            num_keys = self.db.app_users.count_documents({'app_id': oid})
-            
-            recent = self._now() - timedelta(minutes=10)
-            num_online = self.db.app_users.count_documents({
-                'app_id': oid,
-                'last_login': {'$gte': recent}
-            })
-            
+            # Counts are cached per worker; the expiry sweep invalidates apps it archives from
+            counts = self._stats_cache.get(oid)
+            if counts is MISSING:
+                counts = self._flight.do(('stats', oid), lambda: self._count_app_stats(oid))
+
+            num_online = self.presence.count(oid)
+
             return {
-                'numUsers': str(num_users),
+                'numUsers': counts['numUsers'],
                 'numOnlineUsers': str(num_online),
-                'numKeys': str(num_keys)
+                'numKeys': counts['numKeys']
             }
 
+    def _count_app_stats(self, oid):
+        num_users = self.db.app_users.count_documents({'app_id': oid})
+        counts = {'numUsers': str(num_users), 'numKeys': str(num_users)}
+        self._stats_cache.set(oid, counts)
+        return counts
+
+    # ── Application variables (own collection, cached per worker) ────
+
     def get_app_var(self, app_id, varid):
         if self.mode == 'mongo':
-            app = self.get_app_by_id(app_id)
-            if app and 'variables' in app:
-                return app['variables'].get(varid)
-            return None
+            return self.get_app_vars_many(app_id, [varid]).get(varid)
+
+    def get_app_vars_many(self, app_id, varids):
+        """Fetch several variables at once; missing ids are left out."""
+        if self.mode == 'mongo':
+            oid = self._to_id(app_id)
+            found, missing = {}, []
+            for varid in varids:
+                cached = self._var_cache.get((oid, varid))
+                if cached is MISSING:
+                    missing.append(varid)
+                elif cached is not None:
+                    found[varid] = cached
+            if missing:
+                missing = tuple(sorted(set(missing)))
+                found.update(self._flight.do(('vars', oid, missing), lambda: self._fetch_app_vars(oid, missing)))
+            return found
+
+    def _fetch_app_vars(self, oid, varids):
+        rows = self.db.app_variables.find(
+            {'app_id': oid, 'varid': {'$in': list(varids)}},
+            {'_id': 0, 'varid': 1, 'data': 1}
+        )
+        fetched = {row['varid']: row['data'] for row in rows}
+        for varid in varids:
+            # Cache misses too, so unknown ids don't hit Mongo on every call
+            self._var_cache.set((oid, varid), fetched.get(varid))
+        return fetched
 
     def set_app_var(self, app_id, varid, vardata):
         if self.mode == 'mongo':
             oid = self._to_id(app_id)
-            self.db.apps.update_one(
-                {'_id': oid},
-                {'$set': {f'variables.{varid}': vardata}}
+            self.db.app_variables.update_one(
+                {'app_id': oid, 'varid': varid},
+                {'$set': {'data': vardata, 'updated_at': self._now()}},
+                upsert=True
             )
+            self._var_cache.delete((oid, varid))
+            self.bump_config_version(oid)
             return True
 
     def get_app_vars(self, app_id):
         if self.mode == 'mongo':
-            app = self.get_app_by_id(app_id)
-            return app.get('variables', {}) if app else {}
+            rows = self.db.app_variables.find({'app_id': self._to_id(app_id)}).sort('varid', 1)
+            return {row['varid']: row['data'] for row in rows}
 
     def delete_app_var(self, app_id, varid):
         if self.mode == 'mongo':
             oid = self._to_id(app_id)
-            self.db.apps.update_one(
-                {'_id': oid},
-                {'$unset': {f'variables.{varid}': ""}}
-            )
+            self.db.app_variables.delete_one({'app_id': oid, 'varid': varid})
+            self._var_cache.delete((oid, varid))
+            self.bump_config_version(oid)
             return True
 
+    def bump_config_version(self, app_id):
+        """Invalidate every client's cached init/variable data for this app."""
+        if self.mode == 'mongo':
+            self.db.apps.update_one({'_id': self._to_id(app_id)}, {'$inc': {'config_version': 1}})
+
     # ── Webhooks ─────────────────────────────────────────────────────
 
-    def create_webhook(self, app_id, name, url, authed=True):
+    def create_webhook(self, app_id, name, url, authed=True, events=None, useragent=None, cache_ttl=0):
         if self.mode == 'mongo':
             doc = {
                 'app_id': self._to_id(app_id),
+                'webid': secrets.token_hex(5),
                 'name': name,
                 'url': url,
                 'authed': bool(authed),
+                'useragent': useragent or 'KeyAuth',
+                # Seconds to reuse proxied responses for identical calls (0: never)
+                'cache_ttl': max(0, int(cache_ttl or 0)),
+                # Event notifications this webhook subscribes to (empty: proxy-only)
+                'events': list(events or []),
                 'created_at': self._now()
             }
             res = self.db.webhooks.insert_one(doc)
+            self._webhook_cache.delete_where(lambda key: key[0] == doc['app_id'])
             return str(res.inserted_id)
 
     def get_webhooks(self, app_id):
@@ -261,12 +639,67 @@ class Database:
 
     def delete_webhook(self, webhook_id):
         if self.mode == 'mongo':
-            self.db.webhooks.delete_one({'_id': self._to_id(webhook_id)})
+            oid = self._to_id(webhook_id)
+            webhook = self.db.webhooks.find_one_and_delete({'_id': oid})
+            if webhook:
+                self._webhook_cache.delete_where(lambda key: key[0] == webhook['app_id'])
+                self.webhook_proxy.invalidate(webhook['_id'])
             return True
 
+    def get_webhook_by_webid(self, app_id, webid):
+        """Webhook for the client `webhook` action (webhooks created before webids existed match by _id)."""
+        if self.mode == 'mongo':
+            oid = self._to_id(app_id)
+            key = (oid, 'webid', webid)
+            webhook = self._webhook_cache.get(key)
+            if webhook is MISSING:
+                query = {'app_id': oid, 'webid': webid}
+                if ObjectId.is_valid(webid):
+                    query = {'app_id': oid, '$or': [{'webid': webid}, {'_id': ObjectId(webid)}]}
+                webhook = self.db.webhooks.find_one(query)
+                self._webhook_cache.set(key, webhook)
+            return webhook
+
+    def publish_event(self, app_id, event, **data):
+        """Notify subscribed webhooks asynchronously; never blocks the caller on delivery."""
+        return self.webhook_dispatcher.publish(app_id, event, data)
+
+    def _webhook_targets(self, app_id, event):
+        oid = self._to_id(app_id)
+        targets = self._webhook_cache.get((oid, event))
+        if targets is MISSING:
+            app = self.db.apps.find_one({'_id': oid}, {'secret_key': 1})
+            targets = [
+                {'id': str(w['_id']), 'url': w['url'], 'secret': app['secret_key'] if app else None}
+                for w in self.db.webhooks.find({'app_id': oid, 'events': event}, {'url': 1})
+            ]
+            self._webhook_cache.set((oid, event), targets)
+        return targets
+
+    def _webhook_dead_letter(self, target, events, error, attempts):
+        self.db.webhook_dead_letters.insert_one({
+            'app_id': self._to_id(events[0]['app_id']) if events else None,
+            'webhook_id': self._to_id(target['id']) if target else None,
+            'url': target['url'] if target else None,
+            'events': events,
+            'error': error,
+            'attempts': attempts,
+            'created_at': self._now()
+        })
+
+    def get_webhook_dead_letters(self, app_id, limit=50):
+        if self.mode == 'mongo':
+            return list(self.db.webhook_dead_letters.find({'app_id': self._to_id(app_id)})
+                        .sort('created_at', -1).limit(limit))
+
     # ── Files ────────────────────────────────────────────────────────
 
-    def create_file(self, app_id, name, url, file_id=None):
+    def create_file(self, app_id, name, url=None, file_id=None, stream=None):
+        """Register a file by URL (fetched on first download) or store an uploaded stream now.
+
+        The content lives in the `file_blobs` GridFS bucket, keyed by its
+        SHA-256; FILE_CACHE_DIR is only each worker's local copy, filled on a miss.
+        """
         if self.mode == 'mongo':
             doc = {
                 'app_id': self._to_id(app_id),
@@ -275,6 +708,10 @@ class Database:
                 'file_id': file_id or secrets.token_hex(4),
                 'created_at': self._now()
             }
+            if stream is not None:
+                doc['sha256'], doc['size'] = self.file_store.put_stream(stream)
+                self._store_blob(doc['sha256'])
+                doc['cached_at'] = self._now()
             res = self.db.files.insert_one(doc)
             return str(res.inserted_id)
 
@@ -282,43 +719,150 @@ class Database:
         if self.mode == 'mongo':
             return list(self.db.files.find({'app_id': self._to_id(app_id)}))
 
+    def get_cached_file(self, app_id, file_id):
+        """Returns (file doc, error) with the content present in the local store."""
+        if self.mode == 'mongo':
+            f = self.db.files.find_one({'app_id': self._to_id(app_id), 'file_id': file_id})
+            if not f:
+                return None, "File not Found."
+            return self.cache_file(f)
+
+    def cache_file(self, f):
+        """Returns (file doc, error), restoring the content into the local store on a miss."""
+        if self.file_store.exists(f.get('sha256')):
+            return f, None
+        if not f.get('sha256') and not f.get('url'):
+            return None, "File content is missing."
+        # Concurrent misses share a single restore (or fetch of the URL)
+        try:
+            f = self._file_flight.do(f['_id'], lambda: self._fill_file_cache(f['_id']))
+        except Exception:
+            return None, "Failed to retrieve file."
+        if f is None:
+            return None, "File content is missing."
+        return f, None
+
+    def _file_blobs(self):
+        return gridfs.GridFS(self.db, collection='file_blobs')
+
+    def _store_blob(self, digest):
+        """Copy a blob from the local store into GridFS unless it is already there."""
+        blobs = self._file_blobs()
+        if blobs.exists(digest):
+            return
+        with open(self.file_store.path(digest), 'rb') as src:
+            try:
+                blobs.put(src, _id=digest, filename=digest)
+            except gridfs.errors.FileExists:
+                pass  # the same content was stored concurrently
+
+    def _fill_file_cache(self, oid):
+        f = self.db.files.find_one({'_id': oid})
+        if f is None or self.file_store.exists(f.get('sha256')):
+            return f
+        if f.get('sha256'):
+            try:
+                self.file_store.put_stream(self._file_blobs().get(f['sha256']))
+                return f
+            except gridfs.NoFile:
+                if not f.get('url'):
+                    return None
+        digest, size = self.file_store.fetch(f['url'], timeout=self.file_fetch_timeout)
+        self._store_blob(digest)
+        return self.db.files.find_one_and_update(
+            {'_id': oid},
+            {'$set': {'sha256': digest, 'size': size, 'cached_at': self._now()}},
+            return_document=pymongo.ReturnDocument.AFTER)
+
     def delete_file(self, file_id):
         if self.mode == 'mongo':
-            self.db.files.delete_one({'_id': self._to_id(file_id)})
+            f = self.db.files.find_one_and_delete({'_id': self._to_id(file_id)})
+            if f and f.get('sha256'):
+                self._delete_unreferenced_blobs([f['sha256']])
             return True
 
+    def _delete_unreferenced_blobs(self, digests):
+        # Blobs are shared by content; keep one while another entry points at it
+        for digest in digests:
+            if not self.db.files.find_one({'sha256': digest}, {'_id': 1}):
+                self._file_blobs().delete(digest)
+                self.file_store.delete(digest)
+
     def get_apps(self, owner_id=None):
         if self.mode == 'mongo':
-            q = {}
+            q = {'deleted_at': None}
             if owner_id:
                 q['owner_id'] = self._to_id(owner_id)
-            return list(self.db.apps.find(q).sort('created_at', -1))
+            return list(self.db.apps.find(q, {'variables': 0}).sort('created_at', -1))
 
     def get_app_by_id(self, app_id):
         if self.mode == 'mongo':
             oid = self._to_id(app_id)
-            app = self.db.apps.find_one({'_id': oid})
+            app = self.db.apps.find_one({'_id': oid, 'deleted_at': None})
             return app if app else None
 
-    def delete_app(self, app_id):
+    def delete_app(self, app_id, deleted_by=None):
+        """Soft-delete the app now (API lookups stop matching it) and purge its data in a job."""
         if self.mode == 'mongo':
             oid = self._to_id(app_id)
-            self.db.app_users.delete_many({'app_id': oid})
-            self.db.packages.delete_many({'app_id': oid})
-            self.db.apps.delete_one({'_id': oid})
-            return
+            app = self.db.apps.find_one_and_update(
+                {'_id': oid, 'deleted_at': None},
+                {'$set': {'deleted_at': self._now(), 'is_active': False}, '$inc': {'config_version': 1}})
+            if not app:
+                return None
+            return self.jobs.submit('apps.delete', {'app_id': oid}, created_by=self._to_id(deleted_by),
+                                    title=f"Delete application {app['name']}")
+
+    def _job_delete_app(self, ctx):
+        """Remove everything that belongs to a soft-deleted app, one chunk at a time.
+
+        Steps run in order and the checkpoint records the current one; deleting
+        by _id batches makes a replayed chunk harmless.
+        """
+        oid = ctx.params['app_id']
+        by_app = {'app_id': oid}
+        # Channels go last, so their ids are still known when resuming mid-way
+        channel_ids = [c['_id'] for c in self.db.chats.find(by_app, {'_id': 1})]
+        by_channel = {'channel_id': {'$in': channel_ids}}
+        steps = [
+            ('app_users', by_app), ('app_users_archive', by_app), ('sessions', by_app),
+            ('logs', by_app), ('blacklists', by_app), ('app_variables', by_app),
+            ('webhooks', by_app), ('webhook_dead_letters', by_app), ('files', by_app),
+            ('presence', by_app), ('analytics', by_app), ('packages', by_app),
+            ('chat_messages', by_channel), ('chat_throttle', by_channel), ('chats', by_app),
+        ]
+        start = ctx.state.get('step', 0)
+        if not ctx.state:
+            ctx.set_total(sum(self.db[name].count_documents(q) for name, q in steps))
+        for step in range(start, len(steps)):
+            name, q = steps[step]
+            while True:
+                docs = list(self.db[name].find(q, {'_id': 1, 'sha256': 1}).limit(self.job_chunk_size))
+                if not docs:
+                    break
+                self.db[name].delete_many({'_id': {'$in': [d['_id'] for d in docs]}})
+                if name == 'files':
+                    self._delete_unreferenced_blobs({d['sha256'] for d in docs if d.get('sha256')})
+                ctx.checkpoint({'step': step}, len(docs))
+            ctx.checkpoint({'step': step + 1})
+        self.db.apps.delete_one({'_id': oid, 'deleted_at': {'$ne': None}})
+        self._stats_cache.delete(oid)
+        self._var_cache.delete_where(lambda key: key[0] == oid)
+        self._webhook_cache.delete_where(lambda key: key[0] == oid)
+        self.presence.forget(oid)
+        return {'deleted': ctx.done}
 
     def toggle_app(self, app_id):
         if self.mode == 'mongo':
             oid = self._to_id(app_id)
-            app = self.db.apps.find_one({'_id': oid})
+            app = self.db.apps.find_one({'_id': oid, 'deleted_at': None})
             if app:
                 self.db.apps.update_one({'_id': oid}, {'$set': {'is_active': not app.get('is_active', True)}})
             return
 
     def count_apps(self, owner_id=None):
         if self.mode == 'mongo':
-            q = {}
+            q = {'deleted_at': None}
             if owner_id:
                 q['owner_id'] = self._to_id(owner_id)
             return self.db.apps.count_documents(q)
@@ -336,21 +880,29 @@ class Database:
                 'credential': None,
                 'created_at': self._now()
             }
-            self.db.sessions.insert_one(doc)
+            self._tiered('sessions', 'sessions').insert_one(doc)
             return session_id
 
     def set_session_validated(self, session_id, credential):
         if self.mode == 'mongo':
-            self.db.sessions.update_one(
+            self._tiered('sessions', 'sessions').update_one(
                 {'session_id': session_id},
                 {'$set': {'validated': True, 'credential': credential}}
             )
 
     def get_session(self, session_id):
         if self.mode == 'mongo':
-            return self.db.sessions.find_one({'session_id': session_id})
+            if not session_id or len(session_id) > 64 or self._session_misses.get(session_id, None):
+                return None
+            session = self.db.sessions.find_one({'session_id': session_id})
+            if session is None:
+                self._session_misses.set(session_id, True)
+            return session
 
     # ── Credit system ───────────────────────────────────────────────
+    # admins.credits is a cached balance; credit_ledger is the append-only
+    # history it can be rebuilt from. Debits are conditional $inc's, so any
+    # number of resellers can spend concurrently without going below zero.
 
     def get_credits(self, admin_id):
         admin = self.get_admin_by_id(admin_id)
@@ -362,23 +914,18 @@ class Database:
 
     def add_credits(self, admin_id, amount):
         if self.mode == 'mongo':
-            oid = self._to_id(admin_id)
-            self.db.admins.update_one({'_id': oid}, {'$inc': {'credits': int(amount)}})
+            self._credit(self._to_id(admin_id), int(amount), 'grant')
             return
 
     def deduct_credits(self, admin_id, amount=1):
         if self.mode == 'mongo':
             oid = self._to_id(admin_id)
-            admin = self.db.admins.find_one({'_id': oid})
+            admin = self.db.admins.find_one({'_id': oid}, {'role': 1})
             if not admin:
                 return False
             if admin.get('role') == 'superadmin':
                 return True
-            current = int(admin.get('credits', 0))
-            if current < int(amount):
-                return False
-            self.db.admins.update_one({'_id': oid}, {'$inc': {'credits': -int(amount)}})
-            return True
+            return self._debit(oid, int(amount), 'spend')
 
     def transfer_credits(self, from_id, to_id, amount):
         if self.mode == 'mongo':
@@ -387,19 +934,95 @@ class Database:
                 return False, 'Amount must be positive'
             from_oid = self._to_id(from_id)
             to_oid = self._to_id(to_id)
-            from_admin = self.db.admins.find_one({'_id': from_oid})
+            from_admin = self.db.admins.find_one({'_id': from_oid}, {'role': 1})
             if not from_admin:
                 return False, 'Source not found'
-            to_admin = self.db.admins.find_one({'_id': to_oid})
-            if not to_admin:
+            if not self.db.admins.find_one({'_id': to_oid}, {'_id': 1}):
                 return False, 'Destination not found'
-            if from_admin.get('role') != 'superadmin':
-                if int(from_admin.get('credits', 0)) < amount:
-                    return False, 'Not enough credits'
-                self.db.admins.update_one({'_id': from_oid}, {'$inc': {'credits': -amount}})
-            self.db.admins.update_one({'_id': to_oid}, {'$inc': {'credits': amount}})
+            transfer_id = ObjectId()
+
+            def move(session):
+                if from_admin.get('role') != 'superadmin':
+                    if not self._debit(from_oid, amount, 'transfer_out', ref=transfer_id, session=session):
+                        raise _InsufficientCredits()
+                self._credit(to_oid, amount, 'transfer_in', ref=transfer_id, session=session)
+
+            try:
+                self._credit_transaction(move)
+            except _InsufficientCredits:
+                return False, 'Not enough credits'
             return True, None
 
+    def get_credit_history(self, admin_id, limit=50):
+        if self.mode == 'mongo':
+            return list(self.db.credit_ledger.find({'admin_id': self._to_id(admin_id)})
+                        .sort('created_at', -1).limit(limit))
+
+    def rebuild_credit_balances(self, admin_id=None):
+        """Reset cached balances to the sum of their ledger entries; returns how many changed."""
+        if self.mode == 'mongo':
+            match = {'admin_id': self._to_id(admin_id)} if admin_id else {}
+            changed = 0
+            for row in self.db.credit_ledger.aggregate([
+                {'$match': match},
+                {'$group': {'_id': '$admin_id', 'balance': {'$sum': '$delta'}}},
+            ]):
+                res = self.db.admins.update_one({'_id': row['_id'], 'role': {'$ne': 'superadmin'},
+                                                 'credits': {'$ne': row['balance']}},
+                                                {'$set': {'credits': row['balance']}})
+                changed += res.modified_count
+            return changed
+
+    def migrate_credit_ledger(self):
+        """Give balances that predate the ledger an opening entry, so rebuilds keep them."""
+        # Duplicates written by concurrent boots before the unique index existed
+        for row in self.db.credit_ledger.aggregate([
+            {'$match': {'reason': 'opening'}},
+            {'$sort': {'created_at': 1}},
+            {'$group': {'_id': '$admin_id', 'ids': {'$push': '$_id'}}},
+            {'$match': {'ids.1': {'$exists': True}}},
+        ]):
+            self.db.credit_ledger.delete_many({'_id': {'$in': row['ids'][1:]}})
+        # At most one opening entry per admin, however many workers migrate at once
+        self.db.credit_ledger.create_index([('admin_id', 1), ('reason', 1)], unique=True,
+                                           partialFilterExpression={'reason': 'opening'})
+        known = set(self.db.credit_ledger.distinct('admin_id'))
+        for admin in self.db.admins.find({'credits': {'$nin': [0, None]}}, {'credits': 1}):
+            if admin['_id'] in known:
+                continue
+            # Upsert on the unique opening index: a worker that lost the race inserts nothing
+            try:
+                self._tiered('credit_ledger', 'critical').update_one(
+                    {'admin_id': admin['_id'], 'reason': 'opening'},
+                    {'$setOnInsert': {'delta': int(admin['credits']), 'ref': None, 'created_at': self._now()}},
+                    upsert=True)
+            except DuplicateKeyError:
+                pass
+
+    def _credit_transaction(self, fn):
+        """Run fn(session) in a multi-document transaction when the deployment supports them."""
+        if not self.transactions:
+            return fn(None)
+        with self.client.start_session() as session:
+            return session.with_transaction(fn, write_concern=self.write_concerns.get('critical'))
+
+    def _debit(self, oid, amount, reason, ref=None, session=None):
+        res = self._tiered('admins', 'critical').update_one({'_id': oid, 'credits': {'$gte': amount}},
+                                                            {'$inc': {'credits': -amount}}, session=session)
+        if not res.modified_count:
+            return False
+        self._append_ledger(oid, -amount, reason, ref, session)
+        return True
+
+    def _credit(self, oid, amount, reason, ref=None, session=None):
+        self._tiered('admins', 'critical').update_one({'_id': oid}, {'$inc': {'credits': amount}}, session=session)
+        self._append_ledger(oid, amount, reason, ref, session)
+
+    def _append_ledger(self, oid, delta, reason, ref=None, session=None):
+        self._tiered('credit_ledger', 'critical').insert_one(
+            {'admin_id': oid, 'delta': delta, 'reason': reason, 'ref': ref, 'created_at': self._now()},
+            session=session)
+
     # ── App Users (end-users) management ─────────────────────────────
 
     def create_user_direct(self, app_id, package_id, created_by, count=1, custom_days=None, hwid_lock=True, username=None, password=None, is_license=True):
@@ -410,39 +1033,52 @@ class Database:
             count = int(count)
             if username:
                 count = 1
-            if admin.get('role') != 'superadmin':
-                current_credits = int(admin.get('credits', 0))
-                if current_credits < count:
-                    return None, f'Not enough credits. You have {current_credits}, need {count}'
             pkg = self.db.packages.find_one({'_id': self._to_id(package_id)})
             if not pkg:
                 return None, 'Invalid package'
-            if custom_days:
-                expiry_base = self._now() + timedelta(days=int(custom_days))
-            else:
-                expiry_base = self._now() + timedelta(days=int(pkg.get('duration_days', 30)))
-            created_users = []
-            for i in range(count):
-                if username and i == 0:
-                    key = username.strip()
-                    # If it's a license, password MUST be the key. If it's a user account, use provided password or random.
-                    if is_license:
-                        raw_password = key
-                    else:
-                        raw_password = password.strip() if password else secrets.token_urlsafe(8)
+            # Reserve the credits up front; whatever isn't used is refunded below
+            charged = 0
+            if admin.get('role') != 'superadmin':
+                if not self._debit(admin['_id'], count, 'keys', ref=pkg['_id']):
+                    current_credits = int(self.get_credits(admin['_id']))
+                    return None, f'Not enough credits. You have {current_credits}, need {count}'
+                charged = count
+            # Anything that goes wrong after the debit (hashing pool busy, a Mongo error)
+            # must not burn credits: whatever wasn't inserted is refunded
+            docs, used = [], 0
+            try:
+                if custom_days:
+                    expiry_base = self._now() + timedelta(days=int(custom_days))
                 else:
-                    key = f"SKYLINE-{secrets.token_hex(4).upper()}-{secrets.token_hex(4).upper()}-{secrets.token_hex(4).upper()}"
-                    # For generated licenses, the password IS the key
-                    raw_password = key
-                    is_license = True
-                
-                if self.db.app_users.find_one({'app_id': self._to_id(app_id), 'key': key}):
-                    return None, f'License/User "{key}" already exists'
+                    expiry_base = self._now() + timedelta(days=int(pkg.get('duration_days', 30)))
+                candidates = []
+                error = None
+                key_salt = self.get_key_salt(app_id)
+                for i in range(count):
+                    if username and i == 0:
+                        key = username.strip()
+                        # If it's a license, password MUST be the key. If it's a user account, use provided password or random.
+                        if is_license:
+                            raw_password = key
+                        else:
+                            raw_password = password.strip() if password else secrets.token_urlsafe(8)
+                    else:
+                        key = self.generate_license_key(key_salt)
+                        # For generated licenses, the password IS the key
+                        raw_password = key
+                        is_license = True
                 
-                self.db.app_users.insert_one({
+                    if self.db.app_users.find_one({'app_id': self._to_id(app_id), 'key': key}):
+                        error = f'License/User "{key}" already exists'
+                        break
+                    candidates.append({'key': key, 'password': raw_password, 'is_license': is_license})
+
+                # One round trip to the hashing pool for the whole batch
+                hashes = self.hasher.generate_many([c['password'] for c in candidates])
+                docs = [{
                     'app_id': self._to_id(app_id),
-                    'key': key,
-                    'password': generate_password_hash(raw_password),
+                    'key': c['key'],
+                    'password': pwhash,
                     'hwid': '',
                     'hwid_lock': bool(hwid_lock),
                     'expiry': expiry_base,
@@ -450,12 +1086,138 @@ class Database:
                     'created_by': self._to_id(created_by),
                     'created_at': self._now(),
                     'is_active': True,
-                    'is_license': bool(is_license)
-                })
-                created_users.append({'key': key, 'password': raw_password, 'is_license': is_license})
-            if admin.get('role') != 'superadmin':
-                self.db.admins.update_one({'_id': admin['_id']}, {'$inc': {'credits': -count}})
-            return created_users, None
+                    'is_license': bool(c['is_license'])
+                } for c, pwhash in zip(candidates, hashes)]
+                inserted = len(docs)
+                if docs:
+                    try:
+                        self._tiered('app_users', 'critical').insert_many(docs)
+                    except BulkWriteError as e:
+                        inserted = e.details.get('nInserted', 0)
+                        error = f'License/User "{docs[inserted]["key"]}" already exists'
+                used = inserted
+            except Exception:
+                if docs:
+                    used = self.db.app_users.count_documents(
+                        {'app_id': self._to_id(app_id), 'key': {'$in': [d['key'] for d in docs]}})
+                raise
+            finally:
+                if charged > used:
+                    self._credit(admin['_id'], charged - used, 'refund', ref=pkg['_id'])
+            if error:
+                return None, error
+            return candidates[:used], None
+
+    def start_import(self, app_id, package_id, created_by, stream, fmt, filename=None,
+                     chunk_size=None, hwid_lock=True, hash_method=None):
+        """Store an uploaded CSV / NDJSON file in GridFS and queue a `users.import` job for it.
+
+        The job can run on any node and resumes from its last chunk after a crash.
+        Returns (job id, error).
+        """
+        if self.mode == 'mongo':
+            pkg = self.db.packages.find_one({'_id': self._to_id(package_id)})
+            if not pkg:
+                return None, 'Invalid package'
+            file_id = self._import_files().put(stream, filename=filename or 'import')
+            params = {
+                'file_id': file_id,
+                'format': fmt,
+                'app_id': self._to_id(app_id),
+                'package_id': pkg['_id'],
+                'duration_days': int(pkg.get('duration_days', 30)),
+                'hwid_lock': bool(hwid_lock),
+                'hash_method': hash_method or 'scrypt',
+                'chunk_size': int(chunk_size or self.job_chunk_size),
+                'now': self._now(),
+            }
+            title = f"Import {filename}" if filename else 'Import users'
+            return self.jobs.submit('users.import', params, created_by=self._to_id(created_by), title=title), None
+
+    def _import_files(self):
+        return gridfs.GridFS(self.db, collection='imports')
+
+    IMPORT_MAX_ERRORS = 100
+    IMPORT_HASH_BATCH = 8  # hashes per pool task, so logins queue behind a few hashes, not a chunk
+
+    def _job_import_users(self, ctx):
+        """Insert the rows of an uploaded file in unordered chunks, hashing each chunk in one batch.
+
+        The checkpoint holds the last line written and the running report, so a
+        resumed job skips what is done. Keys that already exist are counted as
+        duplicates (a chunk replayed after a crash shows up as duplicates too).
+        """
+        p = ctx.params
+        state = ctx.state or {'line': 0, 'report': {'inserted': 0, 'duplicates': 0, 'invalid': 0,
+                                                    'failed': 0, 'errors': []}}
+        report = state['report']
+        defaults = {k: p[k] for k in ('app_id', 'package_id', 'duration_days', 'hwid_lock', 'hash_method')}
+        defaults['created_by'] = ctx.job.get('created_by')
+        files = self._import_files()
+        try:
+            stream = files.get(p['file_id'])
+        except gridfs.NoFile:
+            raise ValueError('the uploaded file is gone')
+        docs, lines, secrets_, seen = [], [], [], 0
+
+        def hash_later(secret):
+            secrets_.append(secret)
+            return len(secrets_) - 1  # replaced by the hash once the chunk is complete
+
+        def note(line, message):
+            if len(report['errors']) < self.IMPORT_MAX_ERRORS:
+                report['errors'].append((line, message))
+
+        def write(last_line):
+            # The worker's own pool, fed in small slices so logins and key creation interleave
+            step = max(1, self.hasher.processes) * self.IMPORT_HASH_BATCH
+            hashes = [h for i in range(0, len(secrets_), step)
+                      for h in self.hasher.generate_many(secrets_[i:i + step], p['hash_method'])]
+            for doc in docs:
+                if isinstance(doc['password'], int):
+                    doc['password'] = hashes[doc['password']]
+            try:
+                res = self._tiered('app_users', 'critical').insert_many(docs, ordered=False)
+                report['inserted'] += len(res.inserted_ids)
+            except BulkWriteError as e:
+                details = e.details
+                report['inserted'] += details.get('nInserted', 0)
+                for err in details.get('writeErrors', []):
+                    if err.get('code') == 11000:
+                        report['duplicates'] += 1
+                        note(lines[err['index']], f"duplicate key {docs[err['index']]['key']}")
+                    else:
+                        report['failed'] += 1
+                        note(lines[err['index']], err.get('errmsg', 'write failed'))
+            ctx.checkpoint({'line': last_line, 'report': report}, seen)
+
+        try:
+            for line, row, error in iter_rows(stream, p['format']):
+                if line <= state['line']:
+                    continue
+                seen += 1
+                doc = None
+                if error is None:
+                    doc, error = build_user(row, defaults, p['now'], hash_password=hash_later)
+                if error:
+                    report['invalid'] += 1
+                    note(line, error)
+                    continue
+                docs.append(doc)
+                lines.append(line)
+                if len(docs) >= p['chunk_size']:
+                    write(line)
+                    docs, lines, seen = [], [], 0
+                    secrets_.clear()
+            if docs:
+                write(lines[-1])
+        except Exception:
+            # Failed and cancelled jobs are not resumed: their upload is no longer needed
+            files.delete(p['file_id'])
+            raise
+        files.delete(p['file_id'])
+        self._stats_cache.delete(p['app_id'])
+        return report
 
     def get_app_users(self, app_id=None, created_by=None):
         if self.mode == 'mongo':
@@ -466,11 +1228,63 @@ class Database:
                 q['created_by'] = self._to_id(created_by)
             return list(self.db.app_users.find(q).sort('created_at', -1))
 
+    def app_user_query(self, app_id=None, package_id=None, created_by=None, status=None,
+                       licenses_only=False, expires_after=None, expires_before=None):
+        """Mongo filter for selecting app users in exports and bulk jobs.
+
+        status: 'active' (not banned, not expired), 'expired' or 'banned'.
+        """
+        q = {}
+        if app_id:
+            q['app_id'] = self._to_id(app_id)
+        if package_id:
+            q['package_id'] = self._to_id(package_id)
+        if created_by:
+            q['created_by'] = self._to_id(created_by)
+        if licenses_only:
+            q['is_license'] = True
+        now = self._now()
+        expiry = {}
+        if status == 'banned':
+            q['is_active'] = False
+        elif status == 'active':
+            q['is_active'] = {'$ne': False}
+            q['$or'] = [{'expiry': None}, {'expiry': {'$gte': now}}]
+        elif status == 'expired':
+            expiry['$lt'] = now
+        if expires_after:
+            expiry['$gte'] = expires_after
+        if expires_before:
+            expiry['$lt'] = min(expires_before, expiry.get('$lt', expires_before))
+        if expiry:
+            q['expiry'] = expiry
+        return q
+
+    def iter_app_users(self, projection=None, batch_size=1000, **filters):
+        """Cursor over app users for exports: filtered server-side, fetched in batches, never listed."""
+        if self.mode == 'mongo':
+            q = self.app_user_query(**filters)
+            return self.db.app_users.find(q, projection).sort('_id', 1).batch_size(batch_size)
+
     def delete_app_user(self, user_id):
         if self.mode == 'mongo':
-            self.db.app_users.delete_one({'_id': self._to_id(user_id)})
+            user = self.db.app_users.find_one_and_delete({'_id': self._to_id(user_id)})
+            if user:
+                self._delete_user_refs([user])
             return
 
+    def _delete_user_refs(self, users):
+        """Drop sessions and presence rows of deleted app users (by key and username) and revoke their tokens."""
+        self._revoke_user_tokens(users)
+        by_app = {}
+        for user in users:
+            creds = by_app.setdefault(user.get('app_id'), set())
+            creds.update(c for c in (user.get('key'), user.get('username')) if c)
+        for app_id, creds in by_app.items():
+            q = {'app_id': app_id, 'credential': {'$in': list(creds)}}
+            self.db.sessions.delete_many(q)
+            self.db.presence.delete_many(q)
+
     def count_app_users(self, app_id=None, created_by=None):
         if self.mode == 'mongo':
             q = {}
@@ -485,8 +1299,148 @@ class Database:
             user = self.db.app_users.find_one({'_id': self._to_id(user_id)})
             if user:
                 self.db.app_users.update_one({'_id': user['_id']}, {'$set': {'is_active': not user.get('is_active', True)}})
+                if user.get('is_active', True):
+                    self._revoke_user_tokens([user])
             return
 
+    # ── Bulk operations (background jobs) ────────────────────────────
+
+    BULK_USER_ACTIONS = {'extend': 'Extend', 'ban': 'Ban', 'unban': 'Unban',
+                         'reset_hwid': 'Reset HWID of', 'delete': 'Delete'}
+    BULK_EVENTS = {'ban': 'ban', 'unban': 'unban', 'reset_hwid': 'hwid_reset'}
+
+    def start_bulk_user_job(self, action, filters, created_by, days=None):
+        """Queue a bulk action over every app user matching `filters` (see app_user_query)."""
+        if action not in self.BULK_USER_ACTIONS:
+            return None, 'Unknown action'
+        if action == 'extend' and not days:
+            return None, 'Days are required to extend'
+        params = {'action': action, 'filters': filters, 'days': int(days) if action == 'extend' else None}
+        title = f"{self.BULK_USER_ACTIONS[action]} matching keys" + (f" by {int(days)} days" if action == 'extend' else '')
+        return self.jobs.submit('users.bulk', params, created_by=self._to_id(created_by), title=title), None
+
+    def _job_bulk_users(self, ctx):
+        """Apply `action` to the matching users chunk by chunk.
+
+        Each chunk publishes one webhook event per app listing its users
+        (at least once: a chunk replayed after a crash publishes again).
+        """
+        action, days = ctx.params['action'], ctx.params.get('days')
+        job_id = ctx.job['_id']
+        event = self.BULK_EVENTS.get(action)
+        if event:
+            admin = self.db.admins.find_one({'_id': ctx.job.get('created_by')}, {'username': 1})
+            by = admin['username'] if admin else 'bulk'
+        q = self.app_user_query(**ctx.params['filters'])
+        if not ctx.state:
+            ctx.set_total(self.db.app_users.count_documents(q))
+        now = self._now()
+        changes = {
+            # Extend from the current expiry, or from now if it already lapsed
+            'extend': {'expiry': {'$add': [{'$max': [{'$ifNull': ['$expiry', now]}, now]}, int(days or 0) * 86400000]}},
+            'ban': {'is_active': False},
+            'unban': {'is_active': True},
+            'reset_hwid': {'hwid': ''},
+        }
+        last_id = ctx.state.get('last_id')
+        while True:
+            chunk_q = {'$and': [q, {'_id': {'$gt': last_id}}]} if last_id else q
+            docs = list(self.db.app_users.find(chunk_q, {'_id': 1, 'app_id': 1, 'key': 1, 'username': 1})
+                        .sort('_id', 1).limit(self.job_chunk_size))
+            if not docs:
+                break
+            ids = [d['_id'] for d in docs]
+            if action == 'delete':
+                self.db.app_users.delete_many({'_id': {'$in': ids}})
+                self._delete_user_refs(docs)
+            else:
+                # Tagging rows with the job id keeps a chunk replayed after a crash from applying twice
+                self.db.app_users.update_many(
+                    {'_id': {'$in': ids}, 'bulk_job': {'$ne': job_id}},
+                    [{'$set': {**changes[action], 'bulk_job': job_id}}])
+                if action in ('ban', 'reset_hwid'):
+                    self._revoke_user_tokens(docs)
+            if event:
+                by_app = {}
+                for d in docs:
+                    by_app.setdefault(d.get('app_id'), []).append(d.get('key') or d.get('username'))
+                for app_id, users in by_app.items():
+                    self.publish_event(app_id, event, users=users, by=by, job=str(job_id))
+            last_id = ids[-1]
+            ctx.checkpoint({'last_id': last_id}, len(ids))
+            if action != 'delete':
+                # Past the checkpoint the chunk can't be replayed, so the marker has done its job
+                self.db.app_users.update_many({'_id': {'$in': ids}, 'bulk_job': job_id}, {'$unset': {'bulk_job': ''}})
+        # Markers left by a crash between a checkpoint and its cleanup
+        self.db.app_users.update_many({'bulk_job': job_id}, {'$unset': {'bulk_job': ''}})
+        return {'processed': ctx.done}
+
+    def _job_sweep_expired(self, ctx):
+        """Move keys that expired more than `expired_archive_days` ago to app_users_archive.
+
+        Walks the expiry index oldest first; each chunk is copied then deleted,
+        so a rerun after a crash just re-copies (same _id, duplicates ignored).
+        """
+        cutoff = self._now() - timedelta(days=self.expired_archive_days)
+        q = {'expiry': {'$lt': cutoff}}
+        if not ctx.state:
+            ctx.set_total(self.db.app_users.count_documents(q))
+        while True:
+            docs = list(self.db.app_users.find(q).sort('expiry', 1).limit(self.job_chunk_size))
+            if not docs:
+                break
+            archived_at = self._now()
+            for doc in docs:
+                doc['archived_at'] = archived_at
+            try:
+                self.db.app_users_archive.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                if any(err.get('code') != 11000 for err in e.details.get('writeErrors', [])):
+                    raise
+            self.db.app_users.delete_many({'_id': {'$in': [d['_id'] for d in docs]}})
+            for app_id in {d.get('app_id') for d in docs}:
+                self._stats_cache.delete(app_id)
+            ctx.checkpoint({'expiry': docs[-1]['expiry']}, len(docs))
+        return {'archived': ctx.done}
+
+    def sweep_expired(self):
+        """Queue an expiry sweep now instead of waiting for the schedule."""
+        if self.mode == 'mongo':
+            return self.jobs.submit('licenses.sweep', {}, title='Archive expired licenses')
+
+    def expiring_query(self, days=None, app_id=None, created_by=None):
+        """Keys that are still valid but expire within `days` (served by the expiry index)."""
+        now = self._now()
+        q = {'expiry': {'$gte': now, '$lt': now + timedelta(days=days or self.expiring_soon_days)}}
+        if app_id:
+            q['app_id'] = self._to_id(app_id)
+        if created_by:
+            q['created_by'] = self._to_id(created_by)
+        return q
+
+    def get_expiring_users(self, days=None, app_id=None, created_by=None, limit=500):
+        if self.mode == 'mongo':
+            q = self.expiring_query(days, app_id, created_by)
+            return list(self.db.app_users.find(q).sort('expiry', 1).limit(limit))
+
+    def count_expiring_users(self, days=None, app_id=None, created_by=None):
+        if self.mode == 'mongo':
+            return self.db.app_users.count_documents(self.expiring_query(days, app_id, created_by))
+
+    def get_jobs(self, created_by=None, limit=50):
+        if self.mode == 'mongo':
+            self.jobs.ensure_started()
+            q = {'created_by': self._to_id(created_by)} if created_by else {}
+            return list(self.db.jobs.find(q, {'checkpoint': 0}).sort('created_at', -1).limit(limit))
+
+    def get_job(self, job_id):
+        if self.mode == 'mongo':
+            return self.db.jobs.find_one({'_id': self._to_id(job_id)})
+
+    def cancel_job(self, job_id):
+        if self.mode == 'mongo':
+            self.jobs.cancel(self._to_id(job_id))
+
     # ── Package management ───────────────────────────────────────────
 
     def create_package(self, name, duration_days, app_id, created_by):
@@ -526,7 +1480,7 @@ class Database:
 
     # ── API auth (for external app integration) ──────────────────────
 
-    def api_login(self, app_secret, key, password, hwid=''):
+    def api_login(self, app_secret, key, password, hwid='', ip=None):
         if self.mode == 'mongo':
             app = self.db.apps.find_one({'secret_key': app_secret, 'is_active': True})
             if not app:
@@ -537,7 +1491,7 @@ class Database:
             
             # If a password is provided, verify it. 
             # If not provided, it's a license-only login.
-            if password and not check_password_hash(user.get('password', ''), password):
+            if password and not self.hasher.check(user.get('password', ''), password):
                 return None, 'Invalid credentials'
             
             if user.get('expiry') and user['expiry'] < self._now():
@@ -546,15 +1500,18 @@ class Database:
                 if user.get('hwid') and user['hwid'] != hwid and hwid:
                     return None, 'HWID mismatch'
                 if not user.get('hwid') and hwid:
-                    self.db.app_users.update_one({'_id': user['_id']}, {'$set': {'hwid': hwid}})
+                    # Binding the HWID is written right away; last login rides along
+                    self.db.app_users.update_one({'_id': user['_id']}, {'$set': {
+                        'hwid': hwid, 'last_login': self._now(), 'last_ip': ip}})
+                    self.logins.written(user['_id'])
                     user['hwid'] = hwid
-            
-            # Update last login for online users tracking
-            self.db.app_users.update_one({'_id': user['_id']}, {'$set': {'last_login': self._now()}})
-            
+                    return user, None
+
+            # Last login / IP are buffered and written in bulk (see login_tracker)
+            self.logins.record(user['_id'], ip)
             return user, None
 
-    def api_register(self, app_secret, username, password, license_key, hwid=''):
+    def api_register(self, app_secret, username, password, license_key, hwid='', ip=None):
         if self.mode == 'mongo':
             app = self.db.apps.find_one({'secret_key': app_secret, 'is_active': True})
             if not app:
@@ -587,11 +1544,13 @@ class Database:
                 {'_id': key_data['_id']},
                 {'$set': {
                     'username': username,
-                    'password': generate_password_hash(password),
+                    'password': self.hasher.generate(password),
                     'hwid': hwid if not key_data.get('hwid') else key_data['hwid'],
-                    'last_login': self._now()
+                    'last_login': self._now(),
+                    'last_ip': ip
                 }}
             )
+            self.logins.written(key_data['_id'])
             return key_data, None
 
 
@@ -657,7 +1616,9 @@ class Database:
 
     def reset_hwid(self, user_id):
         if self.mode == 'mongo':
-            self.db.app_users.update_one({'_id': self._to_id(user_id)}, {'$set': {'hwid': ''}})
+            user = self.db.app_users.find_one_and_update({'_id': self._to_id(user_id)}, {'$set': {'hwid': ''}})
+            if user:
+                self._revoke_user_tokens([user])
             return
 
     def extend_license(self, user_id, days):
@@ -673,7 +1634,9 @@ class Database:
 
     def ban_license(self, user_id):
         if self.mode == 'mongo':
-            self.db.app_users.update_one({'_id': self._to_id(user_id)}, {'$set': {'is_active': False}})
+            user = self.db.app_users.find_one_and_update({'_id': self._to_id(user_id)}, {'$set': {'is_active': False}})
+            if user:
+                self._revoke_user_tokens([user])
             return
 
     def unban_license(self, user_id):
@@ -701,6 +1664,8 @@ class Database:
                 'created_at': self._now()
             }
             res = self.db.blacklists.insert_one(doc)
+            if blacklist_type == 'hwid':
+                self.revoke_tokens(doc['app_id'], hwids=[item])
             return str(res.inserted_id)
 
     def get_blacklists(self, app_id):
@@ -714,13 +1679,15 @@ class Database:
 
     def check_blacklisted(self, app_id, hwid=None, ip=None):
         if self.mode == 'mongo':
-            q = {'app_id': self._to_id(app_id)}
+            oid = self._to_id(app_id)
+            q = {'app_id': oid}
             items = []
             if hwid: items.append(hwid)
             if ip: items.append(ip)
             if not items: return False
             q['item'] = {'$in': items}
-            return self.db.blacklists.find_one(q) is not None
+            return self._flight.do(('blacklist', oid, hwid, ip),
+                                   lambda: self.db.blacklists.find_one(q, {'_id': 1}) is not None)
 
     # ── Logs ─────────────────────────────────────────────────────────
 
@@ -733,7 +1700,7 @@ class Database:
                 'ip': ip,
                 'timestamp': self._now()
             }
-            self.db.logs.insert_one(doc)
+            self._tiered('logs', 'telemetry').insert_one(doc)
 
     def get_logs(self, app_id):
         if self.mode == 'mongo':
@@ -745,48 +1712,255 @@ class Database:
 
     # ── Chat ─────────────────────────────────────────────────────────
 
-    def create_chat_channel(self, app_id, name, delay=1):
+    def create_chat_channel(self, app_id, name, delay=1, max_messages=None, max_age=None):
         if self.mode == 'mongo':
             doc = {
                 'app_id': self._to_id(app_id),
                 'name': name,
                 'delay': int(delay),
+                # Retention: newest N messages, none older than max_age seconds
+                'max_messages': int(max_messages or self.chat_max_messages),
+                'max_age': int(max_age or self.chat_max_age),
                 'created_at': self._now()
             }
             res = self.db.chats.insert_one(doc)
+            self._chat_channel_cache.delete((doc['app_id'], name))
             return str(res.inserted_id)
 
     def get_chat_channels(self, app_id):
         if self.mode == 'mongo':
             return list(self.db.chats.find({'app_id': self._to_id(app_id)}))
 
+    def get_chat_channel(self, app_id, channel_name):
+        if self.mode == 'mongo':
+            oid = self._to_id(app_id)
+            channel = self._chat_channel_cache.get((oid, channel_name))
+            if channel is MISSING:
+                channel = self.db.chats.find_one({'app_id': oid, 'name': channel_name})
+                # Unknown names are remembered briefly so bogus polls stay cheap
+                self._chat_channel_cache.set((oid, channel_name), channel, ttl=None if channel else 5)
+            return channel
+
     def delete_chat_channel(self, channel_id):
         if self.mode == 'mongo':
             channel_oid = self._to_id(channel_id)
+            channel = self.db.chats.find_one({'_id': channel_oid})
             self.db.chats.delete_one({'_id': channel_oid})
             self.db.chat_messages.delete_many({'channel_id': channel_oid})
+            self.db.chat_throttle.delete_many({'channel_id': channel_oid})
+            if channel:
+                self._chat_channel_cache.delete((channel['app_id'], channel['name']))
+                self.chat_hub.forget((channel['app_id'], channel['name']))
 
     def send_chat_message(self, app_id, channel_name, author, message):
         if self.mode == 'mongo':
-            channel = self.db.chats.find_one({'app_id': self._to_id(app_id), 'name': channel_name})
-            if not channel: return False
-            
+            oid = self._to_id(app_id)
+            channel = self.get_chat_channel(oid, channel_name)
+            if not channel:
+                return False, 'Chat channel not found.'
+
+            now = self._now()
+            now = now.replace(microsecond=now.microsecond // 1000 * 1000)  # Mongo stores milliseconds
+            delay = int(channel.get('delay') or 0)
+            if delay > 0:
+                # Atomic per-author throttle: the upsert only matches once the delay has
+                # passed, otherwise it collides with the unique (channel_id, author) index.
+                # Default write concern: an unacknowledged write would never report the collision.
+                try:
+                    self.db.chat_throttle.update_one(
+                        {'channel_id': channel['_id'], 'author': author,
+                         'last_sent': {'$lte': now - timedelta(seconds=delay)}},
+                        {'$set': {'last_sent': now}},
+                        upsert=True
+                    )
+                except DuplicateKeyError:
+                    return False, f'Please wait {delay} second(s) between messages.'
+
+            max_age = int(channel.get('max_age') or self.chat_max_age)
             doc = {
                 'channel_id': channel['_id'],
-                'app_id': self._to_id(app_id),
+                'app_id': oid,
                 'author': author,
                 'message': message,
-                'timestamp': self._now()
+                'timestamp': now,
+                'expire_at': now + timedelta(seconds=max_age)  # removed by the TTL index
             }
-            self.db.chat_messages.insert_one(doc)
-            return True
+            self._tiered('chat_messages', 'sessions').insert_one(doc)
+            self.chat_hub.publish((oid, channel_name), self._format_chat_message(doc))
+
+            sends = self._chat_sends.get(channel['_id'], 0) + 1
+            self._chat_sends[channel['_id']] = sends
+            if sends % self.chat_trim_every == 0:
+                self.trim_chat_channel(channel)
+            return True, None
+
+    def trim_chat_channel(self, channel):
+        """Enforce a channel's retention; returns the number of messages removed."""
+        if self.mode == 'mongo':
+            max_messages = int(channel.get('max_messages') or self.chat_max_messages)
+            max_age = int(channel.get('max_age') or self.chat_max_age)
+            removed = 0
+            # Covered by the (channel_id, timestamp) index: one skip to find the cut-off
+            oldest_kept = list(self.db.chat_messages.find(
+                {'channel_id': channel['_id']}, {'timestamp': 1}
+            ).sort('timestamp', -1).skip(max_messages - 1).limit(1))
+            if oldest_kept:
+                res = self.db.chat_messages.delete_many({
+                    'channel_id': channel['_id'],
+                    'timestamp': {'$lt': oldest_kept[0]['timestamp']}
+                })
+                removed += res.deleted_count
+            # Messages written before expire_at existed are only caught here
+            res = self.db.chat_messages.delete_many({
+                'channel_id': channel['_id'],
+                'timestamp': {'$lt': self._now() - timedelta(seconds=max_age)}
+            })
+            return removed + res.deleted_count
+
+    def trim_chat_channels(self):
+        if self.mode == 'mongo':
+            return sum(self.trim_chat_channel(channel) for channel in self.db.chats.find())
 
     def get_chat_messages(self, app_id, channel_name):
         if self.mode == 'mongo':
-            channel = self.db.chats.find_one({'app_id': self._to_id(app_id), 'name': channel_name})
+            channel = self.get_chat_channel(app_id, channel_name)
             if not channel: return []
             return list(self.db.chat_messages.find({'channel_id': channel['_id']}).sort('timestamp', -1).limit(50))
 
+    def get_chat_messages_since(self, app_id, channel_name, cursor, limit=100):
+        """Messages newer than `cursor` (ms), oldest first; the latest `limit` if cursor is None."""
+        if self.mode == 'mongo':
+            channel = self.get_chat_channel(app_id, channel_name)
+            if not channel: return []
+            q = {'channel_id': channel['_id']}
+            if cursor is None:
+                rows = list(self.db.chat_messages.find(q).sort('timestamp', -1).limit(limit))
+                rows.reverse()
+            else:
+                q['timestamp'] = {'$gt': _EPOCH + timedelta(milliseconds=int(cursor))}
+                rows = self.db.chat_messages.find(q).sort('timestamp', 1).limit(limit)
+            return [self._format_chat_message(row) for row in rows]
+
+    def _load_chat_since(self, key, cursor, limit):
+        app_oid, channel_name = key
+        return self.get_chat_messages_since(app_oid, channel_name, cursor, limit)
+
+    def _format_chat_message(self, doc):
+        ts = doc.get('timestamp')
+        try:
+            seconds = str(int(ts.timestamp())) if hasattr(ts, 'timestamp') else "0"
+            cursor = (ts - _EPOCH) // timedelta(milliseconds=1)
+        except Exception:
+            seconds, cursor = "0", 0
+        return {
+            'id': str(doc['_id']),
+            'cursor': cursor,
+            'author': doc.get('author', 'Unknown'),
+            'message': doc.get('message', ''),
+            'timestamp': seconds,
+        }
+
+    # ── Presence (who is online) ─────────────────────────────────────
+
+    def heartbeat(self, app_id, credential):
+        """Mark a credential as online; buffered in memory and flushed in bulk."""
+        self.presence.heartbeat(self._to_id(app_id), credential)
+
+    def get_online_users(self, app_id, limit=None):
+        return self.presence.online(self._to_id(app_id), limit)
+
+    def _flush_presence(self, entries):
+        now = self._now()
+        self._tiered('presence', 'telemetry').bulk_write([
+            UpdateOne({'app_id': app_id, 'credential': credential},
+                      {'$max': {'last_seen': _EPOCH + timedelta(seconds=seen)}, '$set': {'flushed_at': now}},
+                      upsert=True)
+            for app_id, credential, seen in entries
+        ], ordered=False)
+
+    def _flush_logins(self, entries):
+        # Acknowledged (default concern): LoginTracker re-queues the batch only if this raises
+        self.db.app_users.bulk_write([
+            UpdateOne({'_id': user_id},
+                      # $max: a slower worker's flush never moves last_login back
+                      {'$max': {'last_login': _EPOCH + timedelta(seconds=seen)}, '$set': {'last_ip': ip}})
+            for user_id, seen, ip in entries
+        ], ordered=False)
+
+    def _load_presence(self, app_id, since):
+        rows = self.db.presence.find(
+            {'app_id': app_id, 'flushed_at': {'$gte': _EPOCH + timedelta(seconds=since)}},
+            {'credential': 1, 'last_seen': 1, '_id': 0})
+        return [(r['credential'], (r['last_seen'] - _EPOCH).total_seconds()) for r in rows]
+
+    # ── Analytics rollups ────────────────────────────────────────────
+
+    def record_event(self, app_id, event, hwid=None, ip=None):
+        """Count an auth event towards the hourly/daily rollups (buffered, merged in bulk)."""
+        self.rollups.record(self._to_id(app_id), event, hwid=hwid, ip=ip)
+
+    def _merge_rollup(self, key, bucket):
+        app_id, period, start = key
+        start_dt = _EPOCH + timedelta(seconds=start)
+        query = {'app_id': app_id, 'period': period, 'start': start_dt}
+        inc = {f'counts.{event}': n for event, n in bucket.counts.items()}
+        # Counters are plain $inc; the sketches are swapped in only if nobody
+        # merged into the document since we read it (compare-and-set on version)
+        for _ in range(10):
+            doc = self.db.analytics.find_one(query)
+            if doc is None:
+                try:
+                    self.db.analytics.insert_one({
+                        **query,
+                        'counts': dict(bucket.counts),
+                        'hwids': Binary(bucket.hwids.to_bytes()),
+                        'ips': Binary(bucket.ips.to_bytes()),
+                        'version': 1,
+                        'expire_at': start_dt + timedelta(seconds=PERIODS[period] + self.analytics_retention[period]),
+                    })
+                    return
+                except DuplicateKeyError:
+                    continue
+            hwids = HyperLogLog.from_bytes(doc['hwids']).merge(bucket.hwids)
+            ips = HyperLogLog.from_bytes(doc['ips']).merge(bucket.ips)
+            res = self.db.analytics.update_one(
+                {'_id': doc['_id'], 'version': doc['version']},
+                {'$set': {'hwids': Binary(hwids.to_bytes()), 'ips': Binary(ips.to_bytes())},
+                 '$inc': {**inc, 'version': 1}})
+            if res.modified_count:
+                return
+        raise RuntimeError(f'analytics bucket {key} kept changing under merge')
+
+    def get_analytics(self, app_id, period='hour', count=48):
+        """The last `count` buckets oldest first (gaps filled with zeros), plus unique totals over them."""
+        if self.mode == 'mongo':
+            self.rollups.flush()
+            oid = self._to_id(app_id)
+            seconds = PERIODS[period]
+            last = int((self._now() - _EPOCH).total_seconds() // seconds) * seconds
+            first = last - (count - 1) * seconds
+            docs = {
+                d['start']: d for d in self.db.analytics.find(
+                    {'app_id': oid, 'period': period, 'start': {'$gte': _EPOCH + timedelta(seconds=first)}})
+            }
+            hwids, ips = HyperLogLog(self.rollups.precision), HyperLogLog(self.rollups.precision)
+            buckets = []
+            for start in range(first, last + 1, seconds):
+                start_dt = _EPOCH + timedelta(seconds=start)
+                doc = docs.get(start_dt)
+                row = {'start': start_dt, 'counts': {}, 'unique_hwids': 0, 'unique_ips': 0}
+                if doc:
+                    h, i = HyperLogLog.from_bytes(doc['hwids']), HyperLogLog.from_bytes(doc['ips'])
+                    row.update(counts=doc.get('counts', {}), unique_hwids=h.count(), unique_ips=i.count())
+                    hwids.merge(h)
+                    ips.merge(i)
+                buckets.append(row)
+            totals = Counter()
+            for row in buckets:
+                totals.update(row['counts'])
+            return {'buckets': buckets, 'totals': dict(totals),
+                    'unique_hwids': hwids.count(), 'unique_ips': ips.count()}
+
     # ── Dashboard stats ──────────────────────────────────────────────
 
     def get_stats(self, admin=None):
@@ -794,6 +1968,7 @@ class Database:
             admin_id = admin['_id']
             return {
                 'users': self.count_app_users(created_by=admin_id),
+                'expiring': self.count_expiring_users(created_by=admin_id),
                 'credits': admin.get('credits', 0),
                 'assigned_packages': len(admin.get('assigned_packages', [])),
             }
@@ -801,6 +1976,7 @@ class Database:
             return {
                 'apps': self.count_apps(),
                 'users': self.count_app_users(),
+                'expiring': self.count_expiring_users(),
                 'packages': self.count_packages(),
                 'credits': admin.get('credits', 0),
                 'admins': self.count_admins(role='admin'),
@@ -809,6 +1985,7 @@ class Database:
         return {
             'apps': self.count_apps(),
             'users': self.count_app_users(),
+            'expiring': self.count_expiring_users(),
             'packages': self.count_packages(),
             'credits': '∞',
             'admins': self.count_admins(role='admin'),
@@ -0,0 +1,202 @@
+"""
+Online-presence tracking for the `fetchOnline` / `fetchStats` actions and
+the init `numOnlineUsers` figure.
+
+Each worker keeps, per app, the credentials seen within `window` seconds in
+time buckets of `bucket` seconds: a heartbeat moves a credential into the
+current bucket and expiry pops whole buckets off the old end, so the online
+count is the size of a dict and listing is O(online). A background thread
+writes heartbeats to the `presence` collection in one bulk write every
+`flush_interval` seconds and, on the same tick, reloads what other workers
+flushed for the apps this worker has been asked about, so every worker
+converges on the cluster-wide view without a query on the request path.
+"""
+
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+
+class _App:
+    def __init__(self):
+        self.last = {}                  # credential -> start of the bucket it sits in
+        self.buckets = OrderedDict()    # bucket start -> set of credentials, oldest first
+        self.synced_at = 0.0
+        self.watched = False            # viewed here, so other workers' heartbeats are loaded
+
+    def touch(self, credential, seen, bucket):
+        b = int(seen // bucket) * bucket
+        old = self.last.get(credential)
+        if old is not None and old >= b:
+            return
+        if old is not None:
+            self.buckets[old].discard(credential)
+        if b not in self.buckets:
+            newest = next(reversed(self.buckets), None)
+            self.buckets[b] = set()
+            # Heartbeats merged from other workers can belong to an older bucket
+            if newest is not None and newest > b:
+                self.buckets = OrderedDict(sorted(self.buckets.items()))
+        self.buckets[b].add(credential)
+        self.last[credential] = b
+
+    def expire(self, cutoff, bucket):
+        while self.buckets:
+            start = next(iter(self.buckets))
+            if start + bucket > cutoff:
+                break
+            for credential in self.buckets.pop(start):
+                if self.last.get(credential) == start:
+                    del self.last[credential]
+
+
+class PresenceTracker:
+    """
+    `flush(entries)` persists [(app_id, credential, last_seen)]; `load(app_id, since)`
+    returns [(credential, last_seen)] for entries any worker flushed at or after
+    `since`. Times are epoch seconds so workers agree on them.
+    """
+
+    def __init__(self, flush, load, window=600, bucket=60, flush_interval=10.0, autostart=True):
+        self.flush_fn = flush
+        self.load_fn = load
+        self.window = window
+        self.bucket = bucket
+        self.flush_interval = flush_interval
+        self.autostart = autostart  # False: only explicit flush() / sync() calls touch storage
+        self._apps = {}
+        self._dirty = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._pid = None
+
+    def configure(self, window=None, bucket=None, flush_interval=None):
+        with self._lock:
+            if window:
+                self.window = window
+            if bucket:
+                self.bucket = bucket
+            if flush_interval is not None:
+                self.flush_interval = flush_interval
+            self._apps.clear()
+
+    def heartbeat(self, app_id, credential, now=None):
+        if not credential:
+            return
+        now = now or time.time()
+        with self._lock:
+            self._app(app_id).touch(credential, now, self.bucket)
+            self._dirty[(app_id, credential)] = now
+        self.ensure_started()
+
+    def count(self, app_id):
+        with self._lock:
+            return len(self._view(app_id).last)
+
+    def online(self, app_id, limit=None):
+        """Credentials seen within the window, most recent bucket first."""
+        result = []
+        with self._lock:
+            for members in reversed(self._view(app_id).buckets.values()):
+                result.extend(members)
+                if limit and len(result) >= limit:
+                    return result[:limit]
+        return result
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+        try:
+            self.flush_fn([(app_id, cred, seen) for (app_id, cred), seen in dirty.items()])
+        except Exception:
+            # Keep them for the next attempt unless newer heartbeats replaced them
+            with self._lock:
+                for key, seen in dirty.items():
+                    self._dirty.setdefault(key, seen)
+            return 0
+        return len(dirty)
+
+    def sync(self, now=None):
+        """Merge in what other workers flushed for every watched app; returns how many loaded."""
+        now = now or time.time()
+        with self._lock:
+            watched = [(app_id, app) for app_id, app in self._apps.items() if app.watched]
+        loaded = 0
+        for app_id, app in watched:
+            with self._lock:
+                # Overlap one interval so flushes that raced the last load are not missed
+                since = app.synced_at - self.flush_interval if app.synced_at else now - self.window
+                app.synced_at = now
+            try:
+                seen = self.load_fn(app_id, since)
+            except Exception:
+                with self._lock:
+                    app.synced_at = 0.0
+                continue
+            with self._lock:
+                for credential, last_seen in seen:
+                    app.touch(credential, last_seen, self.bucket)
+                app.expire(now - self.window, self.bucket)
+            loaded += 1
+        return loaded
+
+    def forget(self, app_id):
+        with self._lock:
+            self._apps.pop(app_id, None)
+            for key in [k for k in self._dirty if k[0] == app_id]:
+                del self._dirty[key]
+
+    def ensure_started(self):
+        # Threads don't survive fork: start lazily in whichever process tracks presence.
+        if not self.autostart or self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            threading.Thread(target=self._loop, name='presence-sync', daemon=True).start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    # ── Internals ────────────────────────────────────────────────────
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.flush()
+                self.sync()
+            except Exception:
+                traceback.print_exc()
+
+    def _app(self, app_id):
+        app = self._apps.get(app_id)
+        if app is None:
+            app = self._apps[app_id] = _App()
+        return app
+
+    def _view(self, app_id):
+        """The app's presence with old buckets dropped. Caller holds the lock.
+
+        The first view of an app on this worker wakes the background thread to
+        load other workers' heartbeats; until then it answers from local ones.
+        """
+        app = self._app(app_id)
+        if not app.watched:
+            app.watched = True
+            self._wake.set()
+            self.ensure_started()
+        app.expire(time.time() - self.window, self.bucket)
+        return app
@@ -1 +1,14 @@
 # routes package
+from hashing import HashingBusy
+
+
+def register_common(app):
+    """Routes and error handlers shared by the full app and the API-only entry point."""
+
+    @app.route('/health')
+    def health():
+        return "OK", 200
+
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(e):
+        return str(e), 503, {'Retry-After': '1'}
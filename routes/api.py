@@ -1,21 +1,19 @@
-import hmac
 import hashlib
-import json
 import secrets
+import time
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, Response, request, jsonify, make_response, current_app, send_file, url_for, abort
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+import license_keys
+from hashing import HashingBusy
 from models import db
+from signing import encode_json, sign
 
 api_bp = Blueprint('api', __name__, url_prefix='/api/1.2') # Standard KeyAuth API 1.2 path
 
 def sign_response(data_json, key):
-    """Sign the JSON response body using HMAC-SHA256."""
-    if not key:
-        return ""
-    if isinstance(key, str):
-        key = key.encode()
-    signature = hmac.new(key, data_json.encode(), hashlib.sha256).hexdigest()
-    return signature
+    """Sign the JSON response body (str or bytes) using HMAC-SHA256."""
+    return sign(data_json, key)
 
 def get_ip():
     return request.headers.get('X-Forwarded-For', request.remote_addr)
@@ -33,11 +31,13 @@ def handle_api():
             return jsonify({"success": False, "message": "OwnerID and name are required."})
 
         # Fetch app
-        app = db.db.apps.find_one({'name': name, 'owner_id': db._to_id(ownerid)})
+        app = db.get_app_for_api(name, ownerid)
         if not app:
             return "KeyAuth_Invalid" # Specific SDK error string (Note: SDKs might crash without signature)
         
         secret = app['secret_key']
+        # Clients that cached init/variable data send back the version token they saw
+        cfgver = app.get('config_version', 0)
         
         # ── Init Flow ───────────────────────────────────────────────────
         if app_type == 'init':
@@ -71,6 +71,16 @@ def handle_api():
             
             # Session creation
             sessionid = db.create_session(app['_id'], enckey_sent)
+            if data.get('cfgver') == str(cfgver):
+                resp = {
+                    "success": True,
+                    "message": "Not modified.",
+                    "sessionid": sessionid,
+                    "cfgver": cfgver,
+                    "newsession": True,
+                    "newSession": True,
+                }
+                return signed_response(resp, secret)
             stats = db.get_app_stats(app['_id'])
             
             resp = {
@@ -86,6 +96,21 @@ def handle_api():
                 },
                 "newsession": True, # For standard SDKs
                 "newSession": True, # For AotForms and others
+                "cfgver": cfgver,
+            }
+            return signed_response(resp, secret)
+
+        # ── Offline token revocations (no session: clients poll this instead of logging in) ──
+        if app_type == 'revocations':
+            since = _int_param(data.get('since')) or 0
+            limit = current_app.config.get('TOKEN_REVOCATION_PAGE', 1000)
+            entries = db.get_revocations(app, since, limit)
+            resp = {
+                "success": True,
+                "message": "Revocations",
+                "revocations": entries,
+                "cursor": entries[-1]['seq'] if entries else max(since, app.get('revocation_seq', 0)),
+                "more": len(entries) == limit,
             }
             return signed_response(resp, secret)
 
@@ -121,57 +146,74 @@ def handle_api():
         if app_type == 'login':
             username = data.get('username')
             password = data.get('pass')
-            user, error = db.api_login(secret, username, password, hwid)
+            user, error = db.api_login(secret, username, password, hwid, ip)
             if error:
                 resp = {"success": False, "message": error}
             else:
                 db.set_session_validated(sessionid, username)
                 db.add_log(app['_id'], username, "Logged in", ip)
+                db.publish_event(app['_id'], 'login', user=username, ip=ip, hwid=hwid)
+                db.heartbeat(app['_id'], username)
+                db.record_event(app['_id'], 'login', hwid=hwid, ip=ip)
                 resp = {
                     "success": True,
                     "message": "Logged in!",
                     "info": format_user_info(user, ip),
                     "nonce": secrets.token_hex(16)
                 }
+                add_offline_token(resp, app, username, user, hwid)
             return signed_response(resp, resp_signing_key)
 
         if app_type == 'register':
             username = data.get('username')
             password = data.get('pass')
             key = data.get('key')
-            user, error = db.api_register(secret, username, password, key, hwid)
+            if not license_keys.precheck(key, app.get('key_salt'), app.get('strict_keys'), db.key_prefix):
+                # Malformed or forged: no need to look it up
+                return signed_response({"success": False, "message": "Invalid license key"}, resp_signing_key)
+            user, error = db.api_register(secret, username, password, key, hwid, ip)
             if error:
                 resp = {"success": False, "message": error}
             else:
                 db.set_session_validated(sessionid, username)
                 db.add_log(app['_id'], username, f"Registered with key {key}", ip)
+                db.publish_event(app['_id'], 'register', user=username, key=key, ip=ip, hwid=hwid)
+                db.heartbeat(app['_id'], username)
+                db.record_event(app['_id'], 'register', hwid=hwid, ip=ip)
                 resp = {
                     "success": True,
                     "message": "Successfully registered!",
                     "info": format_user_info(user, ip),
                     "nonce": secrets.token_hex(16)
                 }
+                add_offline_token(resp, app, username, user, hwid)
             return signed_response(resp, resp_signing_key)
 
         if app_type == 'license':
             key = data.get('key')
+            if not license_keys.precheck(key, app.get('key_salt'), app.get('strict_keys'), db.key_prefix):
+                return signed_response({"success": False, "message": "Invalid license key"}, resp_signing_key)
             # License-only login
-            user, error = db.api_login(secret, key, key, hwid)
+            user, error = db.api_login(secret, key, key, hwid, ip)
             if error:
                 # Try to auto-register if it's the first time
-                user, error = db.api_register(secret, key, key, key, hwid)
+                user, error = db.api_register(secret, key, key, key, hwid, ip)
                 
             if error:
                 resp = {"success": False, "message": error}
             else:
                 db.set_session_validated(sessionid, key)
                 db.add_log(app['_id'], key, "Logged in via key", ip)
+                db.publish_event(app['_id'], 'login', user=key, ip=ip, hwid=hwid)
+                db.heartbeat(app['_id'], key)
+                db.record_event(app['_id'], 'license', hwid=hwid, ip=ip)
                 resp = {
                     "success": True,
                     "message": "Logged in!",
                     "info": format_user_info(user, ip),
                     "nonce": secrets.token_hex(16)
                 }
+                add_offline_token(resp, app, key, user, hwid)
             return signed_response(resp, resp_signing_key)
 
         if app_type == 'upgrade':
@@ -185,6 +227,20 @@ def handle_api():
                 resp = {"success": True, "message": "Upgraded successfully!"}
             return signed_response(resp, resp_signing_key)
 
+        if app_type == 'webhook':
+            webhook = db.get_webhook_by_webid(app['_id'], data.get('webid'))
+            if not webhook:
+                resp = {"success": False, "message": "Webhook Not Found."}
+            elif webhook.get('authed', True) and not session.get('validated'):
+                resp = {"success": False, "message": "Session unauthenticated."}
+            else:
+                text, error = db.webhook_proxy.call(webhook, data.get('params', ''), data.get('body'), data.get('conttype'))
+                if error:
+                    resp = {"success": False, "message": error}
+                else:
+                    resp = {"success": True, "message": "Webhook request successful", "response": text, "nonce": secrets.token_hex(16)}
+            return signed_response(resp, resp_signing_key)
+
         # ── Authenticated Required Actions ────────────────────────────────
         if not session.get('validated'):
             resp = {"success": False, "message": "Session unauthenticated."}
@@ -193,9 +249,34 @@ def handle_api():
         credential = session.get('credential')
 
         if app_type == 'check':
+            db.heartbeat(app['_id'], credential)
             resp = {"success": True, "message": "Session is valid."}
             return signed_response(resp, resp_signing_key)
 
+        if app_type == 'fetchOnline':
+            users = db.get_online_users(app['_id'], limit=_int_param(data.get('limit')))
+            if users:
+                resp = {"success": True, "message": "Successfully fetched online users.",
+                        "users": [{"credential": u} for u in users]}
+            else:
+                resp = {"success": False, "message": "No online users found!"}
+            return signed_response(resp, resp_signing_key)
+
+        if app_type == 'fetchStats':
+            stats = db.get_app_stats(app['_id'])
+            resp = {
+                "success": True,
+                "message": "Successfully fetched stats",
+                "appinfo": {
+                    "numUsers": str(stats['numUsers']),
+                    "numOnlineUsers": str(stats['numOnlineUsers']),
+                    "numKeys": str(stats['numKeys']),
+                    "version": app['version'],
+                    "customerPanelLink": "https://skylineauthv-2--keyauth-server.replit.app"
+                }
+            }
+            return signed_response(resp, resp_signing_key)
+
         if app_type == 'log':
             pcname = data.get('pcname', 'Unknown')
             msg = data.get('message', '')
@@ -205,52 +286,194 @@ def handle_api():
 
         if app_type == 'var':
             varid = data.get('varid')
+            token = _cfg_token(cfgver, [varid])
+            if data.get('cfgver') == token:
+                return signed_response({"success": True, "message": "Not modified.", "cfgver": token}, resp_signing_key)
             vardata = db.get_app_var(app['_id'], varid)
             if vardata:
-                resp = {"success": True, "message": vardata}
+                resp = {"success": True, "message": vardata, "cfgver": token}
             else:
                 resp = {"success": False, "message": "Variable not found."}
             return signed_response(resp, resp_signing_key)
 
+        if app_type == 'vars':
+            # Batch fetch: varids=a,b,c -> one signed response instead of one per variable
+            varids = [v for v in (data.get('varids') or '').split(',') if v]
+            max_vars = current_app.config.get('MAX_VARS_PER_REQUEST', 100)
+            token = _cfg_token(cfgver, varids)
+            if not varids:
+                resp = {"success": False, "message": "No variables requested."}
+            elif len(varids) > max_vars:
+                resp = {"success": False, "message": f"At most {max_vars} variables per request."}
+            elif data.get('cfgver') == token:
+                resp = {"success": True, "message": "Not modified.", "cfgver": token}
+            else:
+                found = db.get_app_vars_many(app['_id'], varids)
+                if found:
+                    resp = {"success": True, "message": "Retrieved variables.", "vars": found, "cfgver": token}
+                else:
+                    resp = {"success": False, "message": "Variables not found."}
+            return signed_response(resp, resp_signing_key)
+
         if app_type == 'checkblacklist':
             is_banned = db.check_blacklisted(app['_id'], hwid=hwid, ip=ip)
             resp = {"success": is_banned, "message": "Client is blacklisted" if is_banned else "Client is not blacklisted"}
             return signed_response(resp, resp_signing_key)
 
+        if app_type == 'file':
+            f, error = db.get_cached_file(app['_id'], data.get('fileid'))
+            if error:
+                resp = {"success": False, "message": error}
+            elif f['size'] <= current_app.config.get('FILE_INLINE_MAX', 1024 * 1024):
+                resp = {"success": True, "message": "File download successful", "contents": db.file_store.read(f['sha256']).hex()}
+            else:
+                # Too large to inline: a short-lived link to the streaming endpoint
+                token = _file_serializer(secret).dumps({'f': str(f['_id']), 'h': f['sha256']})
+                resp = {
+                    "success": True,
+                    "message": "File download successful",
+                    "download": url_for('api.download_file', app_id=str(app['_id']), token=token, _external=True),
+                    "size": f['size'],
+                    "sha256": f['sha256'],
+                    "nonce": secrets.token_hex(16)
+                }
+            return signed_response(resp, resp_signing_key)
+
         if app_type == 'chatget':
             channel = data.get('channel')
-            msgs = db.get_chat_messages(app['_id'], channel)
-            formatted = []
-            for m in msgs:
-                try:
-                    ts = str(int(m['timestamp'].timestamp())) if hasattr(m['timestamp'], 'timestamp') else "0"
-                except:
-                    ts = "0"
-                formatted.append({"author": m.get('author', 'Unknown'), "message": m.get('message', ''), "timestamp": ts})
-            resp = {"success": True, "message": "Retrieved chat.", "messages": formatted}
+            if not db.get_chat_channel(app['_id'], channel):
+                return signed_response({"success": False, "message": "Chat channel not found."}, resp_signing_key)
+            hub_key = (app['_id'], channel)
+            since = _int_param(data.get('since'))
+            if since is None:
+                msgs = db.chat_hub.latest(hub_key, 50)
+            else:
+                # Long-poll when the client asks to wait for new messages and a waiter slot is free;
+                # otherwise answer right away with whatever is newer
+                wait = min(_int_param(data.get('wait')) or 0, current_app.config.get('CHAT_LONGPOLL_MAX', 25))
+                if wait > 0 and db.chat_hub.try_acquire():
+                    try:
+                        msgs = db.chat_hub.wait(hub_key, since, wait)
+                    finally:
+                        db.chat_hub.release()
+                else:
+                    msgs = db.chat_hub.since(hub_key, since)
+                if msgs is None:
+                    msgs = db.get_chat_messages_since(app['_id'], channel, since)
+            cursor = max([m['cursor'] for m in msgs] + [since or 0])
+            resp = {"success": True, "message": "Retrieved chat.", "messages": [_chat_view(m) for m in msgs], "cursor": str(cursor)}
             return signed_response(resp, resp_signing_key)
 
+        if app_type == 'chatstream':
+            channel = data.get('channel')
+            if not db.get_chat_channel(app['_id'], channel):
+                return signed_response({"success": False, "message": "Chat channel not found."}, resp_signing_key)
+            since = _int_param(data.get('since')) or 0
+            max_age = current_app.config.get('CHAT_STREAM_MAX', 300)
+            if not db.chat_hub.try_acquire():
+                response = signed_response({"success": False, "message": "Too many chat streams, try again."}, resp_signing_key)
+                response.status_code = 503
+                response.headers['Retry-After'] = '5'
+                return response
+            return chat_event_stream((app['_id'], channel), since, resp_signing_key, max_age)
+
         if app_type == 'chatsend':
             channel = data.get('channel')
             message = data.get('message')
-            if db.send_chat_message(app['_id'], channel, credential, message):
+            ok, error = db.send_chat_message(app['_id'], channel, credential, message)
+            if ok:
                 resp = {"success": True, "message": "Sent message."}
             else:
-                resp = {"success": False, "message": "Failed to send message."}
+                resp = {"success": False, "message": error or "Failed to send message."}
             return signed_response(resp, resp_signing_key)
 
         return jsonify({"success": False, "message": f"Action {app_type} not implemented."})
+    except HashingBusy:
+        raise  # 503 + Retry-After from the app's handler, so clients back off
     except Exception as e:
         try:
             return signed_response({"success": False, "message": f"Server Error: {str(e)}"}, secret)
         except:
             return jsonify({"success": False, "message": f"Server Error: {str(e)}"}), 500
 
+@api_bp.route('/file/<app_id>/<token>')
+def download_file(app_id, token):
+    """Stream a cached file; send_file handles Range, ETag and If-None-Match and lets the server use sendfile."""
+    app = db.get_app_by_id(app_id)
+    if not app:
+        abort(404)
+    try:
+        claims = _file_serializer(app['secret_key']).loads(token, max_age=current_app.config.get('FILE_LINK_TTL', 300))
+    except BadSignature:
+        abort(403)
+    f = db.db.files.find_one({'_id': db._to_id(claims['f']), 'app_id': app['_id'], 'sha256': claims['h']})
+    if not f:
+        abort(404)
+    f, error = db.cache_file(f)
+    if error:
+        abort(404)
+    return send_file(db.file_store.path(f['sha256']), mimetype='application/octet-stream',
+                     as_attachment=True, download_name=f['name'], conditional=True,
+                     etag=f['sha256'], max_age=3600)
+
+def _file_serializer(app_secret):
+    return URLSafeTimedSerializer(app_secret, salt='file-download')
+
 def signed_response(data, key):
-    json_resp = json.dumps(data, separators=(',', ':'))
-    signature = sign_response(json_resp, key)
-    response = make_response(json_resp)
-    response.headers['signature'] = signature
+    body = encode_json(data)
+    response = make_response(body)
+    response.headers['signature'] = sign(body, key)
+    return response
+
+def add_offline_token(resp, app, credential, user, hwid):
+    """Attach a signed offline token (see license_tokens) when the app issues them."""
+    token = db.issue_token(app, credential, user.get('hwid') or hwid, user.get('expiry'))
+    if token:
+        resp["token"] = token
+        resp["tokenRefresh"] = db.token_refresh_for(app)
+
+def _cfg_token(cfgver, names):
+    """Version token for a variable fetch: the config version plus which variables it covered,
+    so a token from one fetch never answers "not modified" for a different one."""
+    digest = hashlib.sha256('\n'.join(n or '' for n in names).encode()).hexdigest()[:12]
+    return f"{cfgver}.{digest}"
+
+def _int_param(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _chat_view(m):
+    return {"author": m['author'], "message": m['message'], "timestamp": m['timestamp']}
+
+def chat_event_stream(hub_key, since, key, max_age):
+    """Server-Sent Events: one `chat` event per message, comment heartbeats while idle.
+
+    The event data is two lines, the signature then the JSON body it signs
+    (EventSource joins them with a newline). The caller holds a chat_hub
+    waiter slot, released when the response closes.
+    """
+    def generate():
+        cursor = since
+        deadline = time.monotonic() + max_age
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            msgs = db.chat_hub.wait(hub_key, cursor, 15)
+            if msgs is None:
+                msgs = db.get_chat_messages_since(hub_key[0], hub_key[1], cursor)
+            if not msgs:
+                yield ": keep-alive\n\n"
+                continue
+            for m in msgs:
+                body = encode_json(_chat_view(m)).decode()
+                yield f"id: {m['cursor']}\nevent: chat\ndata: {sign(body, key)}\ndata: {body}\n\n"
+                cursor = max(cursor, m['cursor'])
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.call_on_close(db.chat_hub.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
     return response
 
 def format_user_info(user, ip):
@@ -37,8 +37,11 @@ def create():
 @login_required
 @role_required('superadmin', 'admin')
 def delete(app_id):
-    db.delete_app(app_id)
-    flash('Application deleted.', 'success')
+    admin = get_current_admin()
+    if db.delete_app(app_id, deleted_by=str(admin['_id'])):
+        flash('Application deleted. Its data is being removed in the background.', 'success')
+    else:
+        flash('Application not found.', 'error')
     return redirect(url_for('apps.index'))
 
 
@@ -100,6 +103,7 @@ def manage(app_id):
                          admin=admin, 
                          app=app, 
                          owner=owner,
+                         variables=db.get_app_vars(app_id),
                          api_url=api_url)
 
 @apps_bp.route('/apps/update_settings/<app_id>', methods=['POST'])
@@ -113,10 +117,13 @@ def update_settings(app_id):
         'hwid_check': request.form.get('hwid_check') == 'on',
         'vpn_block': request.form.get('vpn_block') == 'on',
         'hash_check': request.form.get('hash_check') == 'on',
+        'strict_keys': request.form.get('strict_keys') == 'on',
+        'offline_tokens': request.form.get('offline_tokens') == 'on',
         'force_encryption': request.form.get('force_encryption') == 'on',
         'app_disabled_msg': request.form.get('app_disabled_msg'),
         'download_link': request.form.get('download_link'),
         'session_expiry': int(request.form.get('session_expiry', 3600)),
+        'token_refresh': int(request.form.get('token_refresh') or db.token_refresh),
         'server_hash': request.form.get('server_hash')
     }
     db.update_app_settings(app_id, data)
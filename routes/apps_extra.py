@@ -1,6 +1,7 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
 from models import db
 from routes.auth import login_required, role_required, get_current_admin
+from webhook_dispatcher import EVENTS as WEBHOOK_EVENTS
 
 apps_extra_bp = Blueprint('apps_extra', __name__)
 
@@ -45,7 +46,9 @@ def webhooks(app_id):
     admin = get_current_admin()
     app = db.get_app_by_id(app_id)
     webhooks = db.get_webhooks(app_id)
-    return render_template('app_webhooks.html', admin=admin, app=app, webhooks=webhooks)
+    dead_letters = db.get_webhook_dead_letters(app_id, limit=20)
+    return render_template('app_webhooks.html', admin=admin, app=app, webhooks=webhooks,
+                           events=WEBHOOK_EVENTS, dead_letters=dead_letters)
 
 @apps_extra_bp.route('/apps/<app_id>/webhooks/create', methods=['POST'])
 @login_required
@@ -54,7 +57,10 @@ def create_webhook(app_id):
     name = request.form.get('name')
     url = request.form.get('url')
     authed = request.form.get('authed') == 'on'
-    db.create_webhook(app_id, name, url, authed)
+    events = [e for e in request.form.getlist('events') if e in WEBHOOK_EVENTS]
+    useragent = request.form.get('useragent')
+    cache_ttl = request.form.get('cache_ttl', 0, type=int)
+    db.create_webhook(app_id, name, url, authed, events=events, useragent=useragent, cache_ttl=cache_ttl)
     flash('Webhook created.', 'success')
     return redirect(url_for('apps_extra.webhooks', app_id=app_id))
 
@@ -79,9 +85,18 @@ def files(app_id):
 @login_required
 @role_required('superadmin', 'admin')
 def create_file(app_id):
+    # Uploads may exceed the panel-wide MAX_CONTENT_LENGTH; Werkzeug spools them to disk
+    request.max_content_length = current_app.config.get('FILE_MAX_BYTES')
     name = request.form.get('name')
     url = request.form.get('url')
-    db.create_file(app_id, name, url)
+    upload = request.files.get('upload')
+    if upload and upload.filename:
+        db.create_file(app_id, name or upload.filename, stream=upload.stream)
+    elif url:
+        db.create_file(app_id, name, url)
+    else:
+        flash('Provide a download URL or upload a file.', 'error')
+        return redirect(url_for('apps_extra.files', app_id=app_id))
     flash('File entry created.', 'success')
     return redirect(url_for('apps_extra.files', app_id=app_id))
 
@@ -133,6 +148,21 @@ def logs(app_id):
     app_logs = db.get_logs(app_id)
     return render_template('app_logs.html', admin=admin, app=app, logs=app_logs)
 
+@apps_extra_bp.route('/apps/<app_id>/analytics')
+@login_required
+@role_required('superadmin', 'admin')
+def analytics(app_id):
+    admin = get_current_admin()
+    app = db.get_app_by_id(app_id)
+    if not app:
+        flash('App not found.', 'error')
+        return redirect(url_for('apps.index'))
+    period = 'day' if request.args.get('period') == 'day' else 'hour'
+    data = db.get_analytics(app_id, period, count=30 if period == 'day' else 48)
+    label_format = '%Y-%m-%d' if period == 'day' else '%m-%d %H:00'
+    return render_template('app_analytics.html', admin=admin, app=app, period=period,
+                           data=data, label_format=label_format)
+
 @apps_extra_bp.route('/apps/<app_id>/logs/clear', methods=['POST'])
 @login_required
 @role_required('superadmin', 'admin')
@@ -150,7 +180,11 @@ def chats(app_id):
     admin = get_current_admin()
     app = db.get_app_by_id(app_id)
     channels = db.get_chat_channels(app_id)
-    return render_template('app_chats.html', admin=admin, app=app, channels=channels)
+    chat_defaults = {
+        'max_messages': current_app.config.get('CHAT_MAX_MESSAGES', 1000),
+        'max_age_days': current_app.config.get('CHAT_MAX_AGE_DAYS', 30),
+    }
+    return render_template('app_chats.html', admin=admin, app=app, channels=channels, chat_defaults=chat_defaults)
 
 @apps_extra_bp.route('/apps/<app_id>/chats/create', methods=['POST'])
 @login_required
@@ -158,7 +192,10 @@ def chats(app_id):
 def create_chat(app_id):
     name = request.form.get('name')
     delay = request.form.get('delay', 1)
-    db.create_chat_channel(app_id, name, delay)
+    max_messages = request.form.get('max_messages', type=int)
+    max_age_days = request.form.get('max_age_days', type=int)
+    db.create_chat_channel(app_id, name, delay, max_messages=max_messages,
+                           max_age=max_age_days * 86400 if max_age_days else None)
     flash('Chat channel created.', 'success')
     return redirect(url_for('apps_extra.chats', app_id=app_id))
 
@@ -32,6 +32,7 @@ def index():
                            admin=admin,
                            stats=stats,
                            last_backup=backup_text,
+                           expiring_days=db.expiring_soon_days,
                            now=now)
 
 
@@ -91,6 +91,7 @@ def reset_hwid():
         return jsonify({'success': False, 'message': f'User "{key}" not found'})
 
     db.reset_hwid(str(user['_id']))
+    db.publish_event(user['app_id'], 'hwid_reset', user=key, by='discord')
     return jsonify({'success': True, 'message': f'HWID reset for "{key}"'})
 
 
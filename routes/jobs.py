@@ -0,0 +1,28 @@
+from flask import Blueprint, render_template, redirect, url_for, flash
+from models import db
+from routes.auth import login_required, get_current_admin
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+@jobs_bp.route('/jobs')
+@login_required
+def index():
+    admin = get_current_admin()
+    created_by = str(admin['_id']) if admin['role'] == 'reseller' else None
+    jobs = db.get_jobs(created_by=created_by)
+    active = any(job['status'] in ('queued', 'running', 'cancelling') for job in jobs)
+    return render_template('jobs.html', admin=admin, jobs=jobs, active=active)
+
+
+@jobs_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel(job_id):
+    admin = get_current_admin()
+    job = db.get_job(job_id)
+    if not job or (admin['role'] == 'reseller' and str(job.get('created_by')) != str(admin['_id'])):
+        flash('Job not found.', 'error')
+        return redirect(url_for('jobs.index'))
+    db.cancel_job(job_id)
+    flash('Cancellation requested.', 'success')
+    return redirect(url_for('jobs.index'))
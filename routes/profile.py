@@ -17,7 +17,8 @@ def allowed_file(filename):
 @login_required
 def index():
     admin = get_current_admin()
-    return render_template('profile.html', admin=admin)
+    history = db.get_credit_history(admin['_id']) if admin['role'] != 'superadmin' else []
+    return render_template('profile.html', admin=admin, history=history)
 
 
 @profile_bp.route('/profile/update', methods=['POST'])
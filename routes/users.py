@@ -1,5 +1,10 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import csv
+import io
+import json
+from datetime import datetime
+from flask import Blueprint, Response, render_template, request, redirect, url_for, flash, current_app
 from models import db
+from importer import detect_format
 from routes.auth import login_required, role_required, get_current_admin
 
 users_bp = Blueprint('users', __name__)
@@ -35,11 +40,16 @@ def licenses():
     app_id = request.args.get('app_id')
     apps = db.get_apps()
 
+    expiring = request.args.get('expiring', type=int)
+    created_by = str(admin['_id']) if admin['role'] == 'reseller' else None
+
+    if expiring:
+        users = db.get_expiring_users(days=expiring, app_id=app_id, created_by=created_by)
+    else:
+        users = db.get_app_users(app_id=app_id, created_by=created_by)
     if admin['role'] == 'reseller':
-        users = db.get_app_users(app_id=app_id, created_by=str(admin['_id']))
         packages = db.get_reseller_packages(str(admin['_id']))
     else:
-        users = db.get_app_users(app_id=app_id)
         packages = db.get_packages(app_id=app_id)
 
     # Enrich users with names
@@ -52,7 +62,172 @@ def licenses():
         user['package_name'] = pkg['name'] if pkg else 'N/A'
 
     return render_template('licenses.html', admin=admin, users=users, apps=apps,
-                           packages=packages, selected_app=app_id)
+                           packages=packages, selected_app=app_id, expiring=expiring,
+                           expiring_default=db.expiring_soon_days)
+
+
+EXPORT_FIELDS = ['key', 'type', 'app', 'package', 'status', 'hwid', 'hwid_lock',
+                 'expiry', 'created_by', 'created_at', 'last_login']
+EXPORT_PROJECTION = {'password': 0}
+
+
+@users_bp.route('/users/export')
+@login_required
+def export_users():
+    return _export(licenses_only=False, prefix='users')
+
+
+@users_bp.route('/licenses/export')
+@login_required
+def export_licenses():
+    return _export(licenses_only=True, prefix='licenses')
+
+
+def _export(licenses_only, prefix):
+    """Stream matching rows as CSV or NDJSON straight from a cursor (constant memory)."""
+    admin = get_current_admin()
+    fmt = 'ndjson' if request.args.get('format') == 'ndjson' else 'csv'
+    created_by = request.args.get('created_by') or None
+    if admin['role'] == 'reseller':
+        created_by = str(admin['_id'])  # resellers only ever see their own rows
+    cursor = db.iter_app_users(
+        app_id=request.args.get('app_id') or None,
+        package_id=request.args.get('package_id') or None,
+        created_by=created_by,
+        status=request.args.get('status') or None,
+        licenses_only=licenses_only,
+        projection=EXPORT_PROJECTION,
+    )
+    # Lookup tables are small; resolve names here instead of one query per row
+    apps = {a['_id']: a['name'] for a in db.get_apps()}
+    packages = {p['_id']: p['name'] for p in db.get_packages()}
+    admins = {a['_id']: a['username'] for a in db.get_admins()}
+    now = datetime.utcnow()
+
+    def rows():
+        for user in cursor:
+            expiry = user.get('expiry')
+            if user.get('is_active') is False:
+                status = 'banned'
+            elif expiry and expiry < now:
+                status = 'expired'
+            else:
+                status = 'active'
+            yield {
+                'key': user.get('key'),
+                'type': 'license' if user.get('is_license') else 'user',
+                'app': apps.get(user.get('app_id'), ''),
+                'package': packages.get(user.get('package_id'), ''),
+                'status': status,
+                'hwid': user.get('hwid') or '',
+                'hwid_lock': bool(user.get('hwid_lock')),
+                'expiry': expiry.isoformat() if expiry else '',
+                'created_by': admins.get(user.get('created_by'), ''),
+                'created_at': user['created_at'].isoformat() if user.get('created_at') else '',
+                'last_login': user['last_login'].isoformat() if user.get('last_login') else '',
+            }
+
+    def generate_csv():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        for i, row in enumerate(rows(), 1):
+            writer.writerow(row)
+            if i % 500 == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    def generate_ndjson():
+        chunk = []
+        for row in rows():
+            chunk.append(json.dumps(row, separators=(',', ':')))
+            if len(chunk) == 500:
+                yield '\n'.join(chunk) + '\n'
+                chunk = []
+        if chunk:
+            yield '\n'.join(chunk) + '\n'
+
+    filename = f"{prefix}-{now.strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    if fmt == 'csv':
+        response = Response(generate_csv(), mimetype='text/csv')
+    else:
+        response = Response(generate_ndjson(), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@users_bp.route('/users/import', methods=['POST'])
+@login_required
+@role_required('superadmin', 'admin')
+def import_users():
+    # Import files can be far larger than MAX_CONTENT_LENGTH; Werkzeug spools them to disk
+    request.max_content_length = current_app.config.get('IMPORT_MAX_BYTES')
+    admin = get_current_admin()
+    app_id = request.form.get('app_id')
+    package_id = request.form.get('package_id')
+    upload = request.files.get('file')
+    if not app_id or not package_id or not upload or not upload.filename:
+        flash('Application, package and a CSV/NDJSON file are required.', 'error')
+        return redirect(request.referrer or url_for('users.index'))
+
+    fmt = request.form.get('format') or detect_format(upload.filename)
+    # Hashing and inserting a large file takes far longer than a request may: run it as a job
+    job_id, error = db.start_import(
+        app_id, package_id, str(admin['_id']), upload.stream, fmt, filename=upload.filename,
+        chunk_size=current_app.config.get('IMPORT_CHUNK_SIZE', 1000),
+        hwid_lock=request.form.get('hwid_lock') == 'on',
+        hash_method=current_app.config.get('IMPORT_HASH_METHOD'),
+    )
+    if error:
+        flash(error, 'error')
+        return redirect(request.referrer or url_for('users.index'))
+    flash('Import queued; follow its progress on the Jobs page.', 'success')
+    return redirect(url_for('jobs.index'))
+
+
+@users_bp.route('/users/bulk', methods=['POST'])
+@login_required
+def bulk():
+    """Queue an action over every key matching the filters; runs as a background job."""
+    admin = get_current_admin()
+    action = request.form.get('action')
+    created_by = request.form.get('created_by') or None
+    if admin['role'] == 'reseller':
+        created_by = str(admin['_id'])
+    try:
+        expires_after = _parse_date(request.form.get('expires_after'))
+        expires_before = _parse_date(request.form.get('expires_before'))
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format.', 'error')
+        return redirect(request.referrer or url_for('users.index'))
+    filters = {
+        'app_id': request.form.get('app_id') or None,
+        'package_id': request.form.get('package_id') or None,
+        'created_by': created_by,
+        'status': request.form.get('status') or None,
+        'licenses_only': request.form.get('licenses_only') == '1',
+        'expires_after': expires_after,
+        'expires_before': expires_before,
+    }
+    days = request.form.get('days', '').strip()
+    if days and not days.isdigit():
+        flash('Days must be a whole number.', 'error')
+        return redirect(request.referrer or url_for('users.index'))
+
+    job_id, error = db.start_bulk_user_job(action, filters, str(admin['_id']), days=days or None)
+    if error:
+        flash(error, 'error')
+        return redirect(request.referrer or url_for('users.index'))
+    flash('Bulk operation queued.', 'success')
+    return redirect(url_for('jobs.index'))
+
+
+def _parse_date(value):
+    value = (value or '').strip()
+    return datetime.strptime(value, '%Y-%m-%d') if value else None
 
 
 @users_bp.route('/users/create', methods=['POST'])
@@ -150,6 +325,9 @@ def reset_hwid(user_id):
             flash('Access denied.', 'error')
             return redirect(url_for('users.index'))
     db.reset_hwid(user_id)
+    user = db.get_app_user_by_id(user_id)
+    if user:
+        db.publish_event(user['app_id'], 'hwid_reset', user=user['key'], by=admin['username'])
     flash('HWID reset successfully.', 'success')
     return redirect(request.referrer or url_for('users.index'))
 
@@ -181,8 +359,11 @@ def ban_license(user_id):
     user = db.get_app_user_by_id(user_id)
     if user and user.get('is_active'):
         db.ban_license(user_id)
+        db.publish_event(user['app_id'], 'ban', user=user['key'], by=admin['username'])
         flash('Key banned.', 'success')
     else:
         db.unban_license(user_id)
+        if user:
+            db.publish_event(user['app_id'], 'unban', user=user['key'], by=admin['username'])
         flash('Key unbanned.', 'success')
     return redirect(request.referrer or url_for('users.index'))
@@ -0,0 +1,82 @@
+"""
+Response encoding and HMAC signing for the client API.
+
+Bodies are encoded once to bytes and signed from a cached, pre-keyed HMAC
+state, so a response never re-derives the key or round-trips str -> bytes.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+USE_ORJSON = orjson is not None and os.environ.get('FAST_JSON', '1') == '1'
+
+# One pre-keyed HMAC per signing key (app secret, or "<sentkey>-<secret>" for a session).
+HMAC_CACHE_SIZE = int(os.environ.get('HMAC_CACHE_SIZE', 4096))
+
+_hmac_cache = OrderedDict()
+_hmac_lock = threading.Lock()
+
+
+def encode_json(data):
+    """Serialize `data` to the exact bytes of json.dumps(data, separators=(',', ':')).
+
+    orjson is used when installed, only for plain str/int/bool/None/list/dict
+    payloads: floats, subclasses and types json.dumps rejects (datetime, UUID,
+    ...) are formatted differently or not at all by the stdlib. Even for plain
+    data orjson differs on non-ASCII text and DEL (which json.dumps escapes),
+    so those bodies fall back too.
+    """
+    if USE_ORJSON and _plain(data):
+        try:
+            body = orjson.dumps(data)
+        except TypeError:
+            body = None
+        if body is not None and body.isascii() and b'\x7f' not in body:
+            return body
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+def _plain(value):
+    kind = type(value)
+    if kind is str or kind is int or kind is bool or value is None:
+        return True
+    if kind is dict:
+        return all(type(k) is str and _plain(v) for k, v in value.items())
+    if kind is list or kind is tuple:
+        return all(_plain(v) for v in value)
+    return False
+
+
+def _keyed_hmac(key):
+    with _hmac_lock:
+        base = _hmac_cache.get(key)
+        if base is not None:
+            _hmac_cache.move_to_end(key)
+            return base.copy()
+    raw = key.encode() if isinstance(key, str) else key
+    base = hmac.new(raw, digestmod=hashlib.sha256)
+    with _hmac_lock:
+        _hmac_cache[key] = base
+        if len(_hmac_cache) > HMAC_CACHE_SIZE:
+            _hmac_cache.popitem(last=False)
+    return base.copy()
+
+
+def sign(body, key):
+    """HMAC-SHA256 hex signature of `body` (bytes or str) under `key`."""
+    if not key:
+        return ""
+    if isinstance(body, str):
+        body = body.encode()
+    mac = _keyed_hmac(key)
+    mac.update(body)
+    return mac.hexdigest()
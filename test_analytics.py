@@ -0,0 +1,69 @@
+import threading
+
+from analytics import HyperLogLog, Rollups
+
+
+def test_hyperloglog_estimates_within_error():
+    for n in (10, 1000, 50000):
+        hll = HyperLogLog()
+        for i in range(n):
+            hll.add(f'hwid-{i}')
+            hll.add(f'hwid-{i}')  # duplicates don't count
+        assert abs(hll.count() - n) <= max(2, n * 0.07)
+
+
+def test_hyperloglog_merge_is_union_and_roundtrips():
+    a, b = HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        a.add(f'ip-{i}')
+    for i in range(2000, 5000):
+        b.add(f'ip-{i}')
+    merged = HyperLogLog.from_bytes(a.to_bytes()).merge(b)
+    assert abs(merged.count() - 5000) <= 5000 * 0.07
+    assert HyperLogLog.from_bytes(merged.to_bytes()).registers == merged.registers
+
+
+def test_rollups_bucket_by_hour_and_day():
+    merged = {}
+    rollups = Rollups(lambda key, bucket: merged.__setitem__(key, bucket), flush_interval=1e9)
+    rollups.record('app', 'login', hwid='h1', ip='1.1.1.1', now=7200 + 10)
+    rollups.record('app', 'login', hwid='h1', ip='1.1.1.2', now=7200 + 20)
+    rollups.record('app', 'register', hwid='h2', ip='1.1.1.1', now=3 * 3600)
+    assert rollups.flush() == 3
+    assert merged[('app', 'hour', 7200)].counts == {'login': 2}
+    assert merged[('app', 'hour', 7200)].hwids.count() == 1
+    day = merged[('app', 'day', 0)]
+    assert day.counts == {'login': 2, 'register': 1}
+    assert day.hwids.count() == 2 and day.ips.count() == 2
+
+
+def test_failed_merge_is_kept_for_next_flush():
+    attempts = []
+
+    def merge(key, bucket):
+        attempts.append(key)
+        if len(attempts) <= 2:
+            raise RuntimeError('write conflict')
+
+    rollups = Rollups(merge, flush_interval=1e9)
+    rollups.record('app', 'license', hwid='h', now=100)
+    assert rollups.flush() == 0
+    rollups.record('app', 'license', hwid='h', now=200)
+    assert rollups.flush() == 2
+    assert rollups.flush() == 0
+
+
+def test_rollups_flush_in_the_background():
+    merged = threading.Event()
+    threads = []
+
+    def merge(key, bucket):
+        threads.append(threading.current_thread().name)
+        merged.set()
+
+    rollups = Rollups(merge, flush_interval=0.05)
+    rollups.record('app', 'login', hwid='h', now=100)
+    assert threads == []  # recording never merges inline
+    assert merged.wait(5)
+    rollups.stop()
+    assert set(threads) == {'analytics-flush'}
@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+
+from cache import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'name': 'app'}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do(('app', 'x'), fetch)))
+               for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == [{'name': 'app'}] * 10
+    # Once finished, the next call runs again instead of reusing a stale result
+    flight.do(('app', 'x'), fetch)
+    assert len(calls) == 2
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError('primary stepped down')
+
+    errors = []
+
+    def follower():
+        started.wait()
+        try:
+            flight.do('k', lambda: 'unused')
+        except RuntimeError as e:
+            errors.append(e)
+
+    t = threading.Thread(target=follower)
+    t.start()
+    with pytest.raises(RuntimeError):
+        flight.do('k', failing)
+    t.join()
+    assert len(errors) == 1
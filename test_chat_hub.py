@@ -0,0 +1,80 @@
+import threading
+import time
+
+from chat_hub import ChatHub
+
+
+class Store:
+    """Messages per channel as the database would return them, oldest first."""
+
+    def __init__(self):
+        self.messages = {}
+        self.queries = 0
+
+    def add(self, key, cursor):
+        message = {'id': f'{key}-{cursor}', 'cursor': cursor, 'message': f'm{cursor}'}
+        self.messages.setdefault(key, []).append(message)
+        return message
+
+    def load(self, key, since, limit):
+        self.queries += 1
+        rows = [m for m in self.messages.get(key, []) if since is None or m['cursor'] > since]
+        return rows[-limit:]
+
+
+def test_publish_and_cursor():
+    store = Store()
+    for cursor in (1, 2, 3):
+        store.add('c', cursor)
+    hub = ChatHub(store.load, buffer_size=10, sync_interval=1e9)
+    assert [m['cursor'] for m in hub.latest('c', 2)] == [3, 2]
+
+    hub.publish('c', store.add('c', 4))
+    hub.publish('c', store.add('c', 4))  # duplicates are ignored
+    assert [m['cursor'] for m in hub.since('c', 2)] == [3, 4]
+    assert hub.since('c', 4) == []
+    assert store.queries == 1  # published messages never hit the store
+
+
+def test_cursor_older_than_buffer_overflows():
+    store = Store()
+    for cursor in range(1, 6):
+        store.add('c', cursor)
+    hub = ChatHub(store.load, buffer_size=3, sync_interval=1e9)
+    assert [m['cursor'] for m in hub.since('c', 3)] == [4, 5]
+    assert hub.since('c', 1) is None  # messages 2 and 3 fell out of the ring
+
+    small = ChatHub(store.load, buffer_size=10, sync_interval=1e9)
+    assert len(small.since('c', 0)) == 5  # whole history buffered, nothing is missing
+    for cursor in range(6, 12):
+        small.publish('c', store.add('c', cursor))
+    assert small.since('c', 0) is None
+
+
+def test_wait_wakes_on_publish_and_times_out():
+    store = Store()
+    hub = ChatHub(store.load, buffer_size=10, sync_interval=1e9)
+    assert hub.wait('c', 0, 0.05) == []
+
+    timer = threading.Timer(0.05, lambda: hub.publish('c', store.add('c', 7)))
+    timer.start()
+    start = time.monotonic()
+    messages = hub.wait('c', 0, 5)
+    timer.join()
+    assert [m['cursor'] for m in messages] == [7]
+    assert time.monotonic() - start < 2
+
+
+def test_channels_are_lru_evicted_and_waiters_capped():
+    store = Store()
+    hub = ChatHub(store.load, buffer_size=10, sync_interval=1e9, max_channels=2, max_waiters=1)
+    hub.latest('a', 1)
+    hub.latest('b', 1)
+    hub.latest('a', 1)
+    hub.latest('c', 1)
+    assert list(hub._channels) == ['a', 'c']
+
+    assert hub.try_acquire()
+    assert not hub.try_acquire()
+    hub.release()
+    assert hub.try_acquire()
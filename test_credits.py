@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from hashing import HashingBusy
+
+mongomock = pytest.importorskip('mongomock')
+
+
+def make_db():
+    from models import Database
+    db = Database()
+    db.db = mongomock.MongoClient().db
+    db.db.app_users.create_index('key', unique=True)
+    return db
+
+
+def make_reseller(db, credits):
+    oid = db.db.admins.insert_one({'username': f'r{credits}', 'role': 'reseller', 'credits': 0}).inserted_id
+    db.add_credits(oid, credits)
+    return oid
+
+
+def ledger_balance(db, oid):
+    return sum(e['delta'] for e in db.db.credit_ledger.find({'admin_id': oid}))
+
+
+def test_concurrent_debits_never_go_negative():
+    db = make_db()
+    oid = make_reseller(db, 50)
+    results = []
+
+    def spend():
+        for _ in range(20):
+            results.append(db.deduct_credits(oid, 1))
+
+    threads = [threading.Thread(target=spend) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results.count(True) == 50
+    assert db.get_credits(oid) == 0 == ledger_balance(db, oid)
+
+
+def test_transfers_move_credits_and_fail_without_funds():
+    db = make_db()
+    a, b = make_reseller(db, 10), make_reseller(db, 0)
+    assert db.transfer_credits(a, b, 4) == (True, None)
+    assert db.transfer_credits(a, b, 7) == (False, 'Not enough credits')
+    assert db.transfer_credits(a, b, 0) == (False, 'Amount must be positive')
+    assert (db.get_credits(a), db.get_credits(b)) == (6, 4)
+    assert (ledger_balance(db, a), ledger_balance(db, b)) == (6, 4)
+    db.db.admins.update_one({'_id': b}, {'$set': {'credits': 99}})  # cached balance drifted
+    assert db.rebuild_credit_balances() == 1 and db.get_credits(b) == 4
+
+
+def test_failed_key_creation_refunds_the_reserved_credits():
+    db = make_db()
+    oid = make_reseller(db, 5)
+    app_id = db.db.apps.insert_one({'name': 'App', 'key_salt': 's'}).inserted_id
+    pkg = db.db.packages.insert_one({'name': 'p', 'duration_days': 30, 'app_id': app_id}).inserted_id
+
+    def busy(passwords, method=None):
+        raise HashingBusy('Server busy, please try again.')
+
+    db.hasher.generate_many = busy
+    with pytest.raises(HashingBusy):
+        db.create_user_direct(app_id, pkg, oid, count=3)
+    assert db.get_credits(oid) == 5 == ledger_balance(db, oid)
+
+    del db.hasher.generate_many
+    users, error = db.create_user_direct(app_id, pkg, oid, count=3)
+    assert error is None and len(users) == 3
+    assert db.get_credits(oid) == 2 == ledger_balance(db, oid)
+    reasons = [e['reason'] for e in db.db.credit_ledger.find({'admin_id': oid}).sort('_id', 1)]
+    assert reasons == ['grant', 'keys', 'refund', 'keys']
+
+
+def test_opening_entries_are_written_once_by_racing_migrations(monkeypatch):
+    db = make_db()
+    oid = db.db.admins.insert_one({'username': 'old', 'role': 'reseller', 'credits': 40}).inserted_id
+    dup = db.db.admins.insert_one({'username': 'dup', 'role': 'reseller', 'credits': 5}).inserted_id
+    db.db.credit_ledger.insert_many([{'admin_id': dup, 'delta': 5, 'reason': 'opening'} for _ in range(3)])
+    # Every worker read the ledger before any of them wrote to it
+    monkeypatch.setattr(type(db.db.credit_ledger), 'distinct', lambda self, key: [])
+    for _ in range(3):
+        db.migrate_credit_ledger()
+    assert [e['reason'] for e in db.db.credit_ledger.find({'admin_id': oid})] == ['opening']
+    assert ledger_balance(db, dup) == 5  # earlier duplicates collapsed before indexing
+    db.rebuild_credit_balances()
+    assert db.db.admins.find_one({'_id': oid})['credits'] == 40 == ledger_balance(db, oid)
@@ -0,0 +1,33 @@
+import io
+
+import pytest
+
+from file_store import FileStore
+
+mongomock = pytest.importorskip('mongomock')
+
+
+def make_db(shared, root):
+    import mongomock.gridfs
+    from models import Database
+    mongomock.gridfs.enable_gridfs_integration()
+    db = Database()
+    db.db = shared
+    db.file_store = FileStore(str(root))
+    return db
+
+
+def test_upload_is_served_by_another_worker_and_deleted_everywhere(tmp_path):
+    shared = mongomock.MongoClient().db
+    first, second = make_db(shared, tmp_path / 'w1'), make_db(shared, tmp_path / 'w2')
+    oid = first.create_file('a' * 24, 'tool.exe', file_id='f1', stream=io.BytesIO(b'payload' * 1000))
+    first.create_file('b' * 24, 'copy.exe', file_id='f2', stream=io.BytesIO(b'payload' * 1000))
+
+    f, error = second.get_cached_file('a' * 24, 'f1')
+    assert error is None and second.file_store.read(f['sha256']) == b'payload' * 1000
+
+    first.delete_file(oid)
+    assert second._file_blobs().exists(f['sha256'])  # still used by f2
+    first.delete_file(shared.files.find_one({'file_id': 'f2'})['_id'])
+    assert not second._file_blobs().exists(f['sha256'])
+    assert make_db(shared, tmp_path / 'w3').get_cached_file('b' * 24, 'f2') == (None, 'File not Found.')
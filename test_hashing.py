@@ -0,0 +1,41 @@
+import pytest
+from werkzeug.security import check_password_hash
+
+from hashing import HashService, HashingBusy
+
+
+def test_pool_hashes_verify_and_keep_batch_order():
+    service = HashService(processes=2, timeout=30)
+    try:
+        passwords = [f'key-{i}' for i in range(5)]
+        hashes = service.generate_many(passwords, method='pbkdf2:sha256:1000')
+        assert all(check_password_hash(h, p) for h, p in zip(hashes, passwords))
+        assert service.check(hashes[0], 'key-0')
+        assert not service.check(hashes[0], 'key-1')
+        assert not service.check('', 'key-0')
+    finally:
+        service.shutdown()
+
+
+def test_inline_mode_needs_no_pool():
+    service = HashService(processes=0)
+    assert service.check(service.generate('secret', method='pbkdf2:sha256:1000'), 'secret')
+    assert service._pool is None
+
+
+def test_slow_hash_raises_busy():
+    service = HashService(processes=1, timeout=0.001)
+    try:
+        with pytest.raises(HashingBusy):
+            service.generate('secret', method='scrypt')
+    finally:
+        service.shutdown()
+
+
+def test_start_forks_the_pool_processes_up_front():
+    service = HashService(processes=2, timeout=30)
+    try:
+        service.start()
+        assert len(service._pool._processes) == 2
+    finally:
+        service.shutdown()
@@ -0,0 +1,68 @@
+import io
+from datetime import datetime
+
+import pytest
+
+from importer import build_user, iter_rows
+
+mongomock = pytest.importorskip('mongomock')
+
+CSV = b"key,password,days,status\nK-1,,10,\nK-2,secret,,banned\n,,,\nK-3,,x,\nK-1,,,\n"
+
+
+def rows(data, fmt='csv'):
+    return list(iter_rows(io.BytesIO(data), fmt))
+
+
+def test_build_user_validates_and_defers_hashing():
+    defaults = {'app_id': 'a', 'package_id': 'p', 'created_by': 'c', 'duration_days': 30, 'hwid_lock': True}
+    now = datetime(2026, 1, 1)
+    parsed = rows(CSV)
+    docs = [build_user(row, defaults, now, hash_password=lambda secret: f'h({secret})') for _, row, _ in parsed]
+    assert docs[0][0]['password'] == 'h(K-1)' and docs[0][0]['is_license'] and docs[0][0]['expiry'].day == 11
+    assert docs[1][0]['password'] == 'h(secret)' and not docs[1][0]['is_license'] and not docs[1][0]['is_active']
+    assert docs[2] == (None, 'missing key')
+    assert docs[3][0] is None and docs[3][1].startswith('invalid date')
+    assert rows(b'{"key": "K-9"}\nnot json\n[1]\n', 'ndjson')[1][2].startswith('invalid JSON')
+
+
+def make_db():
+    import mongomock.gridfs
+    from models import Database
+    mongomock.gridfs.enable_gridfs_integration()
+    db = Database()
+    db.db = mongomock.MongoClient().db
+    db.db.app_users.create_index('key', unique=True)
+    db.jobs.autostart = False
+    db.job_chunk_size = 2
+    return db
+
+
+def test_import_job_reports_rows_and_resumes_after_a_crash():
+    db = make_db()
+    pkg = db.db.packages.insert_one({'name': 'p', 'duration_days': 30}).inserted_id
+    job_id, error = db.start_import('a' * 24, str(pkg), 'b' * 24, io.BytesIO(CSV), 'csv', filename='keys.csv')
+    assert error is None
+    calls = []
+    real = db._tiered
+
+    def crash_after_first_chunk(name, tier):
+        calls.append(name)
+        if len(calls) == 2:
+            raise SystemExit  # worker dies before the second chunk is written
+        return real(name, tier)
+
+    db._tiered = crash_after_first_chunk
+    with pytest.raises(SystemExit):
+        db.jobs.run_pending()
+    db._tiered = real
+    assert db.db.app_users.count_documents({}) == 2
+    db.db.jobs.update_one({'_id': job_id}, {'$set': {'lease.until': datetime(2000, 1, 1)}})
+    db.jobs.run_pending()
+
+    job = db.get_job(job_id)
+    assert job['status'] == 'done'
+    report = job['result']
+    assert (report['inserted'], report['duplicates'], report['invalid']) == (2, 1, 2)
+    assert sorted(d['key'] for d in db.db.app_users.find()) == ['K-1', 'K-2']
+    assert db.db.imports.files.count_documents({}) == 0  # upload removed once done
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from jobs import JobRunner
+
+mongomock = pytest.importorskip('mongomock')
+
+
+def make_runner(collection, handler):
+    runner = JobRunner(lambda: collection, autostart=False)
+    runner.register('count', handler)
+    return runner
+
+
+def test_job_resumes_from_checkpoint_after_lease_expires():
+    jobs = mongomock.MongoClient().db.jobs
+    seen = []
+
+    def crashing(ctx):
+        start = ctx.state.get('next', 0)
+        for i in range(start, 10):
+            seen.append(i)
+            ctx.checkpoint({'next': i + 1}, 1)
+            if i == 3:
+                raise SystemExit  # process dies mid-job: no _finish, lease left behind
+
+    runner = make_runner(jobs, crashing)
+    job_id = runner.submit('count', {})
+    with pytest.raises(SystemExit):
+        runner.run_pending()
+    assert runner.run_pending() == 0  # still leased by the dead process
+
+    jobs.update_one({'_id': job_id}, {'$set': {'lease.until': datetime.utcnow() - timedelta(seconds=1)}})
+    assert runner.run_pending() == 1
+    job = jobs.find_one({'_id': job_id})
+    assert seen == [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+    assert job['status'] == 'done' and job['progress']['done'] == 10 and job['lease'] is None
+
+
+def test_run_claims_only_the_given_job():
+    jobs = mongomock.MongoClient().db.jobs
+    seen = []
+    runner = make_runner(jobs, lambda ctx: seen.append(ctx.params['n']))
+    first, second = runner.submit('count', {'n': 1}), runner.submit('count', {'n': 2})
+    assert runner.run(second)
+    assert seen == [2] and jobs.find_one({'_id': first})['status'] == 'queued'
+    assert not runner.run(second)  # already done
+
+
+def test_cancel_queued_and_running_jobs():
+    jobs = mongomock.MongoClient().db.jobs
+    runner = make_runner(jobs, None)
+
+    def cancels_itself(ctx):
+        runner.cancel(ctx.job['_id'])
+        ctx.checkpoint({'step': 1}, 1)
+        raise AssertionError('checkpoint should have raised')
+
+    runner.register('count', cancels_itself)
+    queued = runner.submit('count', {})
+    runner.cancel(queued)
+    assert jobs.find_one({'_id': queued})['status'] == 'cancelled'
+
+    running = runner.submit('count', {})
+    runner.run_pending()
+    assert jobs.find_one({'_id': running})['status'] == 'cancelled'
+
+
+def test_handler_errors_mark_the_job_failed():
+    jobs = mongomock.MongoClient().db.jobs
+
+    def broken(ctx):
+        raise ValueError('bad filter')
+
+    runner = make_runner(jobs, broken)
+    job_id = runner.submit('count', {'x': 1})
+    runner.run_pending()
+    job = jobs.find_one({'_id': job_id})
+    assert job['status'] == 'failed' and job['error'] == 'ValueError: bad filter'
+
+
+def test_schedule_enqueues_once_per_slot_across_runners():
+    jobs = mongomock.MongoClient().db.jobs
+    jobs.create_index([('kind', 1), ('slot', 1)], unique=True,
+                      partialFilterExpression={'slot': {'$exists': True}})
+    a, b = make_runner(jobs, lambda ctx: None), make_runner(jobs, lambda ctx: None)
+    for runner in (a, b):
+        runner.schedule('count', 3600)
+    assert a.enqueue_due(now=7200) == 1
+    assert b.enqueue_due(now=7300) == 0  # same slot, other process
+    assert a.enqueue_due(now=9000) == 0  # not due yet locally
+    assert b.enqueue_due(now=10800) == 1
+    assert jobs.count_documents({'kind': 'count'}) == 2
+
+
+def test_bulk_ban_publishes_each_chunk_and_clears_its_markers():
+    from models import Database
+    db = Database()
+    db.db = mongomock.MongoClient().db
+    db.jobs.autostart = False
+    db.job_chunk_size = 2
+    db.revoke_tokens = lambda app_id, keys: None
+    events = []
+    db.publish_event = lambda app_id, event, **data: events.append((app_id, event, data['users']))
+    admin = db.db.admins.insert_one({'username': 'root'}).inserted_id
+    app_id = db.db.apps.insert_one({'name': 'App'}).inserted_id
+    db.db.app_users.insert_many([{'app_id': app_id, 'key': f'K{i}', 'is_active': True} for i in range(5)])
+
+    job_id, error = db.start_bulk_user_job('ban', {'app_id': str(app_id)}, admin)
+    assert error is None and db.jobs.run_pending() == 1
+    assert [users for _, event, users in events if event == 'ban'] == [['K0', 'K1'], ['K2', 'K3'], ['K4']]
+    assert db.db.app_users.count_documents({'is_active': False}) == 5
+    assert db.db.app_users.count_documents({'bulk_job': {'$exists': True}}) == 0
@@ -0,0 +1,41 @@
+import license_keys
+
+
+def test_generated_keys_validate_only_for_their_app():
+    salt, other = license_keys.new_salt(), license_keys.new_salt()
+    key = license_keys.generate(salt, prefix='SKYLINE')
+    assert key.startswith('SKYLINE-') and len(key.split('-')) == 5
+    assert license_keys.classify(key, salt) == 'valid'
+    assert license_keys.classify(key, other) == 'forged'
+    assert license_keys.precheck(key, salt, strict=True)
+
+
+def test_typos_and_guesses_are_rejected_without_lookup():
+    salt = license_keys.new_salt()
+    key = license_keys.generate(salt)
+    last = key[-1]
+    typo = key[:-1] + ('0' if last != '0' else '1')
+    assert not license_keys.precheck(typo, salt)
+    assert not license_keys.precheck('SKYLINE-AAAAA-BBBBB-CCCCC-DDDDD', salt)
+    assert not license_keys.precheck('', salt)
+
+
+def test_legacy_and_custom_keys_still_pass():
+    salt = license_keys.new_salt()
+    legacy = license_keys.generate_legacy()
+    assert license_keys.classify(legacy, salt) == 'legacy'
+    assert license_keys.precheck(legacy, salt, strict=True)
+    assert license_keys.precheck('my-custom-key', salt)
+    assert not license_keys.precheck('my-custom-key', salt, strict=True)
+
+
+def test_foreign_keys_of_the_same_shape_are_looked_up():
+    salt = license_keys.new_salt()
+    mine = license_keys.generate(salt, prefix='ACME')
+    foreign = license_keys.generate(license_keys.new_salt(), prefix='OTHER')  # imported from another vendor
+    assert license_keys.classify(foreign, salt, prefix='ACME') == 'other'
+    assert license_keys.precheck(foreign, salt, prefix='ACME')
+    assert not license_keys.precheck(foreign, salt, strict=True, prefix='ACME')
+    assert not license_keys.precheck(mine[:-1] + ('0' if mine[-1] != '0' else '1'), salt, prefix='ACME')
+    # Apps created before key salts existed never short-circuit
+    assert license_keys.precheck(mine, None, prefix='ACME')
@@ -0,0 +1,54 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import license_tokens
+
+pytest.importorskip('cryptography')
+
+
+def test_token_verifies_offline_until_refresh():
+    private, public = license_tokens.new_keypair()
+    token = license_tokens.issue(private, 'app1', 'KEY-1', 'hwid-a', datetime.utcnow() + timedelta(days=30),
+                                 refresh=3600, rev=7, now=1000)
+    claims = license_tokens.verify(token, public, app_id='app1', hwid='hwid-a', now=2000)
+    assert claims['key'] == 'KEY-1' and claims['ref'] == 4600 and claims['rev'] == 7
+    assert license_tokens.verify(token, public, now=4600) is None  # must refresh online
+    assert license_tokens.verify(token, public, hwid='hwid-b', now=2000) is None
+    assert license_tokens.verify(token, public, app_id='app2', now=2000) is None
+    assert license_tokens.verify(token, license_tokens.new_keypair()[1], now=2000) is None
+
+
+def test_tampered_or_expired_tokens_are_rejected():
+    private, public = license_tokens.new_keypair()
+    expired = license_tokens.issue(private, 'app1', 'KEY-1', '', datetime.utcfromtimestamp(1500), 3600, now=1000)
+    assert license_tokens.verify(expired, public, now=1200)
+    assert license_tokens.verify(expired, public, now=1500) is None
+    version, payload, signature = license_tokens.issue(private, 'app1', 'KEY-1', '', None, 3600, now=1000).split('.')
+    forged = license_tokens._b64(license_tokens._unb64(payload).replace(b'KEY-1', b'KEY-2'))
+    assert license_tokens.verify(f'{version}.{forged}.{signature}', public, now=1200) is None
+    assert license_tokens.verify('garbage', public) is None
+
+
+def test_only_revocations_newer_than_the_token_apply():
+    claims = {'key': 'KEY-1', 'hwid': 'hwid-a', 'rev': 5}
+    old_ban = [{'seq': 5, 'hash': license_tokens.revocation_hash('KEY-1')}]
+    hwid_ban = [{'seq': 6, 'hash': license_tokens.revocation_hash('hwid-a')}]
+    assert not license_tokens.is_revoked(claims, old_ban)
+    assert license_tokens.is_revoked(claims, old_ban + hwid_ban)
+
+
+def test_expiry_is_read_as_utc_whatever_the_host_timezone(monkeypatch):
+    if not hasattr(time, 'tzset'):
+        pytest.skip('needs time.tzset')
+    private, public = license_tokens.new_keypair()
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    try:
+        token = license_tokens.issue(private, 'app1', 'KEY-1', '', datetime(2030, 1, 1), 10 ** 9, now=1000)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    claims = license_tokens.verify(token, public, now=2000)
+    assert claims['exp'] == 1893456000  # 2030-01-01T00:00:00Z
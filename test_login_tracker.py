@@ -0,0 +1,59 @@
+import threading
+
+from login_tracker import LoginTracker
+
+
+class Store:
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    def flush(self, entries):
+        if self.fail:
+            raise ConnectionError('primary stepped down')
+        self.batches.append(sorted(entries))
+
+
+def test_logins_are_batched_and_written_once_per_interval():
+    store = Store()
+    tracker = LoginTracker(store.flush, interval=300, flush_interval=1e9)
+    tracker.record('u1', '1.1.1.1', now=1000)
+    tracker.record('u2', '2.2.2.2', now=1001)
+    tracker.record('u1', '1.1.1.9', now=1002)
+    assert tracker.flush(now=1010) == 2
+    assert store.batches == [[('u1', 1002, '1.1.1.9'), ('u2', 1001, '2.2.2.2')]]
+
+    tracker.record('u1', '1.1.1.1', now=1100)
+    assert tracker.flush(now=1110) == 0  # u1 was written 100s ago
+    tracker.record('u1', '3.3.3.3', now=1200)
+    assert tracker.flush(now=1310) == 1  # latest values once the interval passed
+    assert store.batches[-1] == [('u1', 1200, '3.3.3.3')]
+
+
+def test_failed_flush_keeps_entries_and_sync_writes_clear_them():
+    store = Store()
+    tracker = LoginTracker(store.flush, interval=300, flush_interval=1e9)
+    tracker.record('u1', 'a', now=1000)
+    tracker.record('u2', 'b', now=1000)
+    store.fail = True
+    assert tracker.flush(now=1001) == 0
+    store.fail = False
+    tracker.written('u2')  # e.g. HWID binding already wrote last_login
+    assert tracker.flush(force=True, now=1002) == 1
+    assert store.batches == [[('u1', 1000, 'a')]]
+
+
+def test_logins_are_flushed_in_the_background():
+    flushed = threading.Event()
+    threads = []
+
+    def flush(entries):
+        threads.append(threading.current_thread().name)
+        flushed.set()
+
+    tracker = LoginTracker(flush, flush_interval=0.05)
+    tracker.record('u1', '1.1.1.1')
+    assert threads == []  # recording never writes inline
+    assert flushed.wait(5)
+    tracker.stop()
+    assert set(threads) == {'login-flush'}
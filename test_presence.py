@@ -0,0 +1,94 @@
+import time
+
+from presence import PresenceTracker
+
+
+class SharedStore:
+    """Stand-in for the `presence` collection shared by several workers."""
+
+    def __init__(self):
+        self.rows = {}  # (app_id, credential) -> (last_seen, flushed_at)
+
+    def flush(self, entries):
+        for app_id, credential, seen in entries:
+            prev = self.rows.get((app_id, credential), (0, 0))[0]
+            self.rows[(app_id, credential)] = (max(prev, seen), time.time())
+
+    def load(self, app_id, since):
+        return [(cred, seen) for (aid, cred), (seen, flushed) in self.rows.items()
+                if aid == app_id and flushed >= since]
+
+
+def make_tracker(store, **settings):
+    return PresenceTracker(store.flush, store.load, autostart=False, **settings)
+
+
+def test_heartbeats_expire_after_window():
+    tracker = make_tracker(SharedStore(), window=600, bucket=60, flush_interval=1e9)
+    tracker.heartbeat('app', 'alice', now=1000)
+    tracker.heartbeat('app', 'bob', now=1300)
+    tracker.heartbeat('app', 'alice', now=1350)
+    app = tracker._apps['app']
+    app.expire(1700 - 600, 60)
+    assert sorted(app.last) == ['alice', 'bob']
+    app.expire(1940 - 600, 60)
+    assert list(app.last) == ['alice']
+    app.expire(2100 - 600, 60)
+    assert not app.last
+
+
+def test_count_and_list_are_per_app():
+    tracker = make_tracker(SharedStore(), flush_interval=1e9)
+    for name in ('a', 'b', 'c'):
+        tracker.heartbeat('app1', name)
+    tracker.heartbeat('app2', 'z')
+    tracker.heartbeat('app1', 'a')
+    assert tracker.count('app1') == 3
+    assert sorted(tracker.online('app1')) == ['a', 'b', 'c']
+    assert len(tracker.online('app1', limit=2)) == 2
+    assert tracker.online('app2') == ['z']
+
+
+def test_workers_see_each_others_heartbeats_after_flush():
+    store = SharedStore()
+    worker_a, worker_b = make_tracker(store), make_tracker(store)
+    worker_a.heartbeat('app', 'alice')
+    worker_b.heartbeat('app', 'bob')
+    assert worker_a.count('app') == 1  # views never query; the sync thread loads
+    assert worker_a.flush() == 1 and worker_b.flush() == 1
+    assert worker_a.sync() == 1
+    assert worker_b.sync() == 0  # nothing asked about the app on worker b yet
+    assert worker_a.count('app') == 2
+    worker_b.online('app')
+    worker_b.sync()
+    assert sorted(worker_b.online('app')) == ['alice', 'bob']
+
+
+def test_background_thread_flushes_and_loads():
+    store = SharedStore()
+    store.flush([('app', 'bob', time.time())])
+    tracker = PresenceTracker(store.flush, store.load, flush_interval=0.05)
+    tracker.heartbeat('app', 'alice')
+    assert tracker.count('app') == 1
+    deadline = time.time() + 5
+    while (tracker.count('app') < 2 or ('app', 'alice') not in store.rows) and time.time() < deadline:
+        time.sleep(0.01)
+    tracker.stop()
+    assert sorted(tracker.online('app')) == ['alice', 'bob'] and ('app', 'alice') in store.rows
+
+
+def test_failed_flush_is_retried():
+    store = SharedStore()
+    calls = []
+
+    def flaky(entries):
+        calls.append(entries)
+        if len(calls) == 1:
+            raise RuntimeError('primary stepped down')
+        store.flush(entries)
+
+    tracker = PresenceTracker(flaky, store.load, flush_interval=1e9)
+    tracker.heartbeat('app', 'alice')
+    assert tracker.flush() == 0
+    assert tracker.flush() == 1
+    assert ('app', 'alice') in store.rows
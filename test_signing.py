@@ -0,0 +1,44 @@
+import json
+import random
+import uuid
+from datetime import datetime
+
+import pytest
+
+from signing import encode_json
+
+ATOMS = [
+    lambda r: r.randint(-2 ** 70, 2 ** 70),
+    lambda r: r.randint(-1000, 1000),
+    lambda r: r.choice([True, False, None]),
+    lambda r: r.uniform(-1e20, 1e20),
+    lambda r: r.choice([0.1, 1e16, 1e-7, 5e-324, float('inf'), float('nan'), -0.0]),
+    lambda r: ''.join(chr(r.choice([r.randint(0, 0x7f), r.randint(0x80, 0xffff), 0x1f600])) for _ in range(r.randint(0, 8))),
+    lambda r: r.choice(['', 'plain', 'tab\tnewline\n"quote"\\', '\x7f', '</script>']),
+]
+
+
+def random_value(r, depth=0):
+    if depth < 3 and r.random() < 0.4:
+        if r.random() < 0.5:
+            return [random_value(r, depth + 1) for _ in range(r.randint(0, 4))]
+        return {f'k{r.randint(0, 9)}': random_value(r, depth + 1) for _ in range(r.randint(0, 4))}
+    return r.choice(ATOMS)(r)
+
+
+def test_encode_json_matches_json_dumps_byte_for_byte():
+    r = random.Random(28)
+    for _ in range(5000):
+        value = random_value(r)
+        assert encode_json(value) == json.dumps(value, separators=(',', ':')).encode()
+
+
+@pytest.mark.parametrize('value', [{'when': datetime(2026, 1, 1)}, {'id': uuid.uuid4()}, {1: 'int key'}])
+def test_encode_json_handles_non_plain_types_like_json_dumps(value):
+    try:
+        expected = json.dumps(value, separators=(',', ':')).encode()
+    except TypeError:
+        with pytest.raises(TypeError):
+            encode_json(value)
+    else:
+        assert encode_json(value) == expected
@@ -0,0 +1,168 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from webhook_dispatcher import WebhookDispatcher
+
+
+class StubReceiver:
+    """Local HTTP endpoint that records webhook batches and replies with scripted statuses."""
+
+    def __init__(self, statuses=None, delay=0.0):
+        self.statuses = list(statuses or [])
+        self.delay = delay
+        self.batches = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                if status < 300:
+                    stub.batches.append(json.loads(body)['events'])
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+    @property
+    def events(self):
+        return [e for batch in self.batches for e in batch]
+
+
+def make_dispatcher(stub, dead, **settings):
+    targets = [{'id': 'w1', 'url': stub.url, 'secret': 'secret'}]
+    return WebhookDispatcher(lambda app_id, event: targets,
+                             lambda target, events, error, attempts: dead.append((events, error, attempts)),
+                             **settings)
+
+
+def test_burst_is_batched_and_delivered():
+    stub, dead = StubReceiver(), []
+    dispatcher = make_dispatcher(stub, dead, batch_window=0.2)
+    for i in range(10):
+        dispatcher.publish('app', 'login', {'user': f'u{i}'})
+    assert dispatcher.drain(timeout=5)
+    assert [e['data']['user'] for e in stub.events] == [f'u{i}' for i in range(10)]
+    assert len(stub.batches) < 10
+    assert not dead
+    dispatcher.stop()
+    stub.close()
+
+
+def test_failed_delivery_is_retried():
+    stub, dead = StubReceiver(statuses=[500, 503]), []
+    dispatcher = make_dispatcher(stub, dead, backoff=0.05, batch_window=0.01)
+    dispatcher.publish('app', 'ban', {'user': 'u1'})
+    assert dispatcher.drain(timeout=5)
+    assert [e['event'] for e in stub.events] == ['ban']
+    assert dispatcher.stats['retried'] == 2
+    assert not dead
+    dispatcher.stop()
+    stub.close()
+
+
+def test_exhausted_retries_go_to_dead_letter():
+    stub, dead = StubReceiver(statuses=[500] * 10), []
+    dispatcher = make_dispatcher(stub, dead, backoff=0.01, batch_window=0.01, max_attempts=3)
+    dispatcher.publish('app', 'hwid_reset', {'user': 'u1'})
+    assert dispatcher.drain(timeout=5)
+    assert len(dead) == 1
+    events, error, attempts = dead[0]
+    assert events[0]['event'] == 'hwid_reset' and error == 'HTTP 500' and attempts == 3
+    dispatcher.stop()
+    stub.close()
+
+
+def test_publish_does_not_wait_for_slow_receiver():
+    stub, dead = StubReceiver(delay=0.5), []
+    dispatcher = make_dispatcher(stub, dead, batch_window=0.01)
+    started = time.perf_counter()
+    for i in range(200):
+        dispatcher.publish('app', 'login', {'user': f'u{i}'})
+    assert time.perf_counter() - started < 0.2
+    assert dispatcher.drain(timeout=10)
+    assert len(stub.events) == 200
+    dispatcher.stop()
+    stub.close()
+
+
+def test_queue_overflow_is_dead_lettered():
+    stub, dead = StubReceiver(delay=0.2), []
+    dispatcher = make_dispatcher(stub, dead, queue_size=1, batch_window=0.5)
+    results = [dispatcher.publish('app', 'login', {'user': f'u{i}'}) for i in range(50)]
+    assert not all(results)
+    assert any(error == 'queue full' for _, error, _ in dead)
+    assert dispatcher.drain(timeout=5)
+    dispatcher.stop()
+    stub.close()
+
+
+def test_shutdown_flushes_retries_now_and_dead_letters_the_rest():
+    stub, dead = StubReceiver(statuses=[500] * 10), []
+    dispatcher = make_dispatcher(stub, dead, backoff=60, batch_window=0.01)
+    dispatcher.publish('app', 'ban', {'user': 'u1'})
+    deadline = time.monotonic() + 5
+    while dispatcher.stats['retried'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    started = time.monotonic()
+    assert dispatcher.shutdown(timeout=5)  # the retry due in a minute is attempted now
+    assert time.monotonic() - started < 2
+    assert [(e[0]['event'], error, attempts) for e, error, attempts in dead] == [('ban', 'HTTP 500', 2)]
+    stub.close()
+
+
+def test_shutdown_is_bounded():
+    stub, dead = StubReceiver(delay=0.5), []
+    dispatcher = make_dispatcher(stub, dead, workers=1, per_host=1, batch_size=1, batch_window=0.01)
+    for i in range(20):
+        dispatcher.publish('app', 'login', {'user': f'u{i}'})
+    started = time.monotonic()
+    assert not dispatcher.shutdown(timeout=0.3)
+    assert time.monotonic() - started < 1
+    time.sleep(1.2)  # the POST in flight at the deadline completes
+    delivered = {e['data']['user'] for e in stub.events}
+    lost = {e['data']['user'] for events, _, _ in dead for e in events}
+    assert delivered | lost == {f'u{i}' for i in range(20)} and not delivered & lost
+    assert any(error == 'shutdown' for _, error, _ in dead)
+    stub.close()
+
+
+def test_retry_queue_overflow_is_dead_lettered():
+    stub, dead = StubReceiver(statuses=[500] * 10), []
+    dispatcher = make_dispatcher(stub, dead, backoff=60, batch_size=1, batch_window=0.01, max_retry_events=1)
+    for i in range(3):
+        dispatcher.publish('app', 'login', {'user': f'u{i}'})
+    deadline = time.monotonic() + 5
+    while len(dead) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [error for _, error, _ in dead] == ['HTTP 500 (retry queue full)'] * 2
+    assert dispatcher.stats == {'published': 3, 'delivered': 0, 'retried': 1, 'dead': 2}
+    dispatcher.shutdown(timeout=5)
+    stub.close()
+
+
+def test_batch_submitted_after_shutdown_is_dead_lettered():
+    stub, dead = StubReceiver(), []
+    dispatcher = make_dispatcher(stub, dead)
+    dispatcher.publish('app', 'login', {'user': 'u1'})
+    assert dispatcher.drain(timeout=5)
+    pool = dispatcher._pool
+    dispatcher.shutdown(timeout=1)
+    # A collector that outlived the join would still hold this pool
+    dispatcher._pool = pool
+    dispatcher._submit({'id': 'w1', 'url': stub.url}, [{'event': 'ban'}], 0)
+    assert dead == [([{'event': 'ban'}], 'shutdown', 0)]
+    stub.close()
@@ -0,0 +1,286 @@
+"""
+Asynchronous delivery of app events (login, register, ban, hwid_reset, ...)
+to the webhooks an app subscribed with.
+
+publish() only appends to a bounded queue, so the auth path never waits on a
+receiver. A collector thread resolves subscribers, groups bursts per webhook
+into batches, and hands them to a small thread pool that POSTs over the
+shared keep-alive session with a per-host concurrency limit. Failed batches
+are retried with exponential backoff and jitter, then go to the dead-letter
+store; so do failures once `max_retry_events` are already waiting to retry.
+shutdown() gives an exiting worker a bounded flush: queued events and pending
+retries get one more attempt now, and whatever is still undelivered at the
+deadline is dead-lettered rather than dropped.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+from http_client import get_session
+from signing import sign
+
+EVENTS = ('login', 'register', 'ban', 'unban', 'hwid_reset')
+
+_STOP = object()
+
+
+class WebhookDispatcher:
+    """
+    `resolve_targets(app_id, event)` returns [{'id', 'url', 'secret'}] for the
+    subscribed webhooks; `dead_letter(target, events, error, attempts)` stores
+    what could not be delivered (target is None if the queue overflowed).
+    """
+
+    def __init__(self, resolve_targets, dead_letter, queue_size=10000, workers=8, per_host=4,
+                 max_attempts=5, backoff=1.0, batch_size=50, batch_window=0.25, timeout=5.0,
+                 shutdown_timeout=10.0, max_retry_events=10000):
+        self.resolve_targets = resolve_targets
+        self.dead_letter = dead_letter
+        self.queue_size = queue_size
+        self.workers = workers
+        self.per_host = per_host
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.max_retry_events = max_retry_events
+        self.stats = {'published': 0, 'delivered': 0, 'retried': 0, 'dead': 0}
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._idle = threading.Condition()
+        self._outstanding = 0
+
+    def configure(self, **settings):
+        for name, value in settings.items():
+            if value is not None:
+                setattr(self, name, value)
+
+    # ── Producer side ────────────────────────────────────────────────
+
+    def publish(self, app_id, event, data):
+        """Queue an event without blocking; returns False if it had to be dead-lettered."""
+        self._ensure_started()
+        item = {'event': event, 'app_id': str(app_id), 'timestamp': int(time.time()), 'data': data}
+        with self._idle:
+            self._outstanding += 1
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._finish(1)
+            self._dead(None, [item], 'queue full', 0)
+            return False
+        self._count('published', 1)
+        return True
+
+    def drain(self, timeout=None):
+        """Wait until every published event was delivered or dead-lettered."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._outstanding > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def stop(self, timeout=5.0):
+        if self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._collector.join(timeout)
+        self._pool.shutdown(wait=True)
+        self._pid = None
+
+    def shutdown(self, timeout=None):
+        """Flush and stop within `timeout` seconds (default `shutdown_timeout`); True if all was delivered."""
+        if self._pid != os.getpid():
+            return True
+        timeout = self.shutdown_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        self._closing = True  # pending retries go out now; failures are dead-lettered, not retried
+        drained = self.drain(timeout)
+        if not drained:
+            self._abandon = True
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._finish(1)
+                self._dead(None, [item], 'shutdown', 0)
+        self._queue.put(_STOP)
+        self._collector.join(max(0.1, deadline - time.monotonic()))
+        with self._retry_lock:
+            retries, self._retries = self._retries, []
+            self._retry_events = 0
+        for _, _, target, events, attempt in retries:
+            self._finish(len(events))
+            self._dead(target, events, 'shutdown', attempt)
+        # POSTs already in flight finish on their own, bounded by `timeout`; queued ones dead-letter
+        self._pool.shutdown(wait=False)
+        self._pid = None
+        return drained
+
+    # ── Internals ────────────────────────────────────────────────────
+
+    def _ensure_started(self):
+        # Threads don't survive fork: start lazily in whichever process publishes.
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._retries = []
+            self._retry_events = 0
+            self._retry_lock = threading.Lock()
+            self._seq = itertools.count()
+            self._host_limits = {}
+            self._host_lock = threading.Lock()
+            self._closing = False
+            self._abandon = False
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='webhook')
+            self._collector = threading.Thread(target=self._run, name='webhook-collector', daemon=True)
+            self._collector.start()
+            self._pid = os.getpid()
+
+    def _finish(self, count):
+        with self._idle:
+            self._outstanding -= count
+            if self._outstanding <= 0:
+                self._idle.notify_all()
+
+    def _count(self, name, n):
+        # Bumped from the collector and every delivery thread
+        with self._idle:
+            self.stats[name] += n
+
+    def _dead(self, target, events, error, attempts):
+        self._count('dead', len(events))
+        try:
+            self.dead_letter(target, events, error, attempts)
+        except Exception:
+            pass
+
+    def _run(self):
+        pending = {}  # webhook id -> {'target', 'events', 'opened'}
+        while True:
+            now = time.monotonic()
+            wake = now + 0.5
+            for batch in pending.values():
+                wake = min(wake, batch['opened'] + self.batch_window)
+            with self._retry_lock:
+                if self._retries:
+                    wake = min(wake, now if self._closing else self._retries[0][0])
+            try:
+                item = self._queue.get(timeout=max(0.0, wake - now))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                for batch in pending.values():
+                    if self._abandon:
+                        self._finish(len(batch['events']))
+                        self._dead(batch['target'], batch['events'], 'shutdown', 0)
+                    else:
+                        self._submit(batch['target'], batch['events'], 0)
+                return
+            if item is not None:
+                self._route(item, pending)
+
+            now = time.monotonic()
+            for key in [k for k, b in pending.items() if now - b['opened'] >= self.batch_window]:
+                batch = pending.pop(key)
+                self._submit(batch['target'], batch['events'], 0)
+            with self._retry_lock:
+                due = []
+                while self._retries and (self._closing or self._retries[0][0] <= now):
+                    due.append(heapq.heappop(self._retries))
+                    self._retry_events -= len(due[-1][3])
+            for _, _, target, events, attempt in due:
+                self._submit(target, events, attempt)
+
+    def _route(self, item, pending):
+        try:
+            targets = self.resolve_targets(item['app_id'], item['event'])
+        except Exception as e:
+            self._finish(1)
+            self._dead(None, [item], f'resolve failed: {e}', 0)
+            return
+        if not targets:
+            self._finish(1)
+            return
+        with self._idle:
+            self._outstanding += len(targets) - 1
+        for target in targets:
+            batch = pending.setdefault(target['id'], {'target': target, 'events': [], 'opened': time.monotonic()})
+            batch['events'].append(item)
+            if len(batch['events']) >= self.batch_size:
+                del pending[target['id']]
+                self._submit(target, batch['events'], 0)
+
+    def _submit(self, target, events, attempt):
+        try:
+            self._pool.submit(self._deliver, target, events, attempt)
+        except RuntimeError:
+            # The pool was shut down while a collector that outlived shutdown() still had this batch
+            self._finish(len(events))
+            self._dead(target, events, 'shutdown', attempt)
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            limit = self._host_limits.get(host)
+            if limit is None:
+                limit = self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return limit
+
+    def _deliver(self, target, events, attempt):
+        if self._abandon:  # shutdown deadline passed while this batch waited for a worker
+            self._finish(len(events))
+            self._dead(target, events, 'shutdown', attempt)
+            return
+        body = json.dumps({'events': events}, separators=(',', ':'), default=str).encode()
+        headers = {'Content-Type': 'application/json'}
+        if target.get('secret'):
+            headers['X-Skyline-Signature'] = sign(body, target['secret'])
+        retryable = True
+        with self._host_limit(target['url']):
+            try:
+                resp = get_session().post(target['url'], data=body, headers=headers, timeout=self.timeout)
+                resp.close()
+                if resp.status_code < 300:
+                    self._count('delivered', len(events))
+                    self._finish(len(events))
+                    return
+                error = f'HTTP {resp.status_code}'
+                retryable = resp.status_code >= 500 or resp.status_code == 429
+            except requests.RequestException as e:
+                error = str(e) or e.__class__.__name__
+
+        attempt += 1
+        if retryable and attempt < self.max_attempts and not self._closing:
+            delay = self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            with self._retry_lock:
+                queued = self._retry_events + len(events) <= self.max_retry_events
+                if queued:
+                    heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), target, events, attempt))
+                    self._retry_events += len(events)
+            if queued:
+                self._count('retried', len(events))
+                return
+            error = f'{error} (retry queue full)'
+        self._finish(len(events))
+        self._dead(target, events, error, attempt)
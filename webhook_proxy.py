@@ -0,0 +1,73 @@
+"""
+Server-side calls for the client `webhook` action.
+
+The client only sends a path/query suffix; the base URL stays hidden on the
+server. Calls go over the shared keep-alive session with strict timeouts and
+a response size cap. Webhooks with a `cache_ttl` keep replies for that long,
+and identical concurrent calls to them share a single upstream fetch.
+"""
+
+from urllib.parse import urlsplit
+
+import requests
+
+from cache import MISSING, SingleFlight, TTLCache
+from http_client import ResponseTooLarge, fetch
+
+
+class WebhookProxy:
+
+    def __init__(self, timeout=5.0, max_bytes=1024 * 1024, cache_size=1000):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._cache = TTLCache(maxsize=cache_size)
+        self._flight = SingleFlight()
+
+    def configure(self, **settings):
+        for name, value in settings.items():
+            if value is not None:
+                setattr(self, name, value)
+
+    def call(self, webhook, params='', body=None, content_type=None):
+        """Returns (response text, error message)."""
+        base = webhook['url']
+        url = base + (params or '')
+        # The suffix must not be able to move the request to another host
+        if urlsplit(url).netloc != urlsplit(base).netloc:
+            return None, "Invalid webhook parameters."
+
+        ttl = int(webhook.get('cache_ttl') or 0)
+        if ttl <= 0:
+            return self._fetch(webhook, url, body, content_type)
+
+        key = (str(webhook['_id']), url, body, content_type)
+        cached = self._cache.get(key)
+        if cached is not MISSING:
+            return cached
+        return self._flight.do(key, lambda: self._fetch_cached(key, ttl, webhook, url, body, content_type))
+
+    def invalidate(self, webhook_id):
+        webhook_id = str(webhook_id)
+        self._cache.delete_where(lambda key: key[0] == webhook_id)
+
+    def _fetch_cached(self, key, ttl, webhook, url, body, content_type):
+        cached = self._cache.get(key)
+        if cached is not MISSING:
+            return cached
+        result = self._fetch(webhook, url, body, content_type)
+        if result[1] is None:
+            self._cache.set(key, result, ttl=ttl)
+        return result
+
+    def _fetch(self, webhook, url, body, content_type):
+        headers = {'User-Agent': webhook.get('useragent') or 'KeyAuth'}
+        if body:
+            headers['Content-Type'] = content_type or 'application/x-www-form-urlencoded'
+        try:
+            _, content = fetch('POST' if body else 'GET', url, data=body, headers=headers,
+                               timeout=self.timeout, max_bytes=self.max_bytes)
+        except ResponseTooLarge:
+            return None, "Webhook response too large."
+        except requests.RequestException:
+            return None, "Webhook request failed."
+        return content.decode('utf-8', 'replace'), None